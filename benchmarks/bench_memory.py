@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Measure the memory used per Exportable by the slotted Exportable against the original ComparableMixin
+based one that kept a per instance __dict__ and its own copy of the full_name string.
+
+Usage::
+
+    ➤ python benchmarks/bench_memory.py [--modules N] [--names N]
+
+The legacy Exportable is reproduced here.  Both sides build the exportables from the same strings (as
+ModuleInfo.exportables does, one module_spec and file_spec per module) and tracemalloc measures the memory
+they hold.
+"""
+
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# noinspection PyPep8
+from fullmonty.comparable_mixin import ComparableMixin
+# noinspection PyPep8
+from refactor_imports.exportable import Exportable
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+
+class LegacyExportable(ComparableMixin):
+    """the original Exportable"""
+
+    def __init__(self, module_spec, file_spec, name):
+        self.module_spec = module_spec.split('.__init__')[0]
+        self.file_spec = file_spec
+        self.name = name
+        self.full_name = '.'.join([module_spec, name])
+
+    def _cmpkey(self):
+        return self.full_name
+
+
+def build(exportable_class, modules, names):
+    """
+    :return: the exportables for the given number of modules, each exporting the given number of names
+    :rtype: list
+    """
+    exportables = []
+    for module in range(modules):
+        module_spec = 'package.subpackage.module_{n}'.format(n=module)
+        file_spec = '/home/user/src/package/subpackage/module_{n}.py'.format(n=module)
+        for index in range(names):
+            # a fresh string per name, as when the names are loaded from the cache
+            name = ''.join(['Symbol_', str(index)])
+            exportables.append(exportable_class(module_spec, file_spec, name))
+    return exportables
+
+
+def measure(exportable_class, modules, names):
+    """
+    :return: the bytes allocated per exportable
+    :rtype: float
+    """
+    tracemalloc.start()
+    try:
+        exportables = build(exportable_class, modules, names)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return float(current) / len(exportables)
+
+
+def main():
+    """run the benchmark and print the bytes per exportable"""
+    parser = argparse.ArgumentParser(description='Exportable memory benchmark')
+    parser.add_argument('--modules', type=int, default=1000, help='number of modules')
+    parser.add_argument('--names', type=int, default=100, help='exportable names per module')
+    args = parser.parse_args()
+
+    legacy = measure(LegacyExportable, args.modules, args.names)
+    slotted = measure(Exportable, args.modules, args.names)
+
+    print("exportables: {count}".format(count=args.modules * args.names))
+    print("legacy:      {bytes:.1f} bytes/exportable".format(bytes=legacy))
+    print("slotted:     {bytes:.1f} bytes/exportable".format(bytes=slotted))
+    print("reduction:   {ratio:.2f}x".format(ratio=legacy / slotted))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Benchmark the single pass ModuleInfo.ModuleParser against the original three pass design
+(CallsParser, ExportableParser, ImportParser) that walked each module's tree once per parser.
+
+Usage::
+
+    ➤ python benchmarks/bench_module_info.py [--functions N] [--repeat N]
+
+The legacy parsers are reproduced here without the import resolution so that both sides only
+measure the tree traversal.
+"""
+
+import argparse
+import ast
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# noinspection PyPep8
+from refactor_imports.module_info import ModuleInfo
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+
+# noinspection PyPep8Naming,PyDocstring
+class LegacyCallsParser(ast.NodeVisitor):
+    def __init__(self, parent):
+        self.parent = parent
+
+    def attr_to_name(self, node, suffix=''):
+        if isinstance(node, ast.Name):
+            if suffix:
+                return node.id + '.' + suffix
+            return node.id
+        if isinstance(node, ast.Attribute):
+            new_suffix = node.attr
+            if suffix:
+                new_suffix += '.' + suffix
+            return self.attr_to_name(node.value, new_suffix)
+        return suffix
+
+    def visit_Call(self, stmt):
+        name = None
+        if isinstance(stmt.func, ast.Name):
+            name = stmt.func.id
+        if isinstance(stmt.func, ast.Attribute):
+            name = self.attr_to_name(stmt.func)
+        if name:
+            self.parent.calls.append(name)
+        self.generic_visit(stmt)
+
+    def visit_ClassDef(self, stmt):
+        self.parent.class_names.append(str(stmt.name))
+        self.generic_visit(stmt)
+
+
+# noinspection PyPep8Naming,PyDocstring
+class LegacyExportableParser(ast.NodeVisitor):
+    def __init__(self, parent):
+        self.parent = parent
+
+    def visit_Module(self, stmt):
+        for module_stmt in stmt.body:
+            if isinstance(module_stmt, ast.Assign):
+                for target in module_stmt.targets:
+                    if isinstance(target, ast.Name):
+                        self.parent.variable_names.append(target.id)
+
+
+# noinspection PyPep8Naming,PyDocstring
+class LegacyImportParser(ast.NodeVisitor):
+    def __init__(self, parent):
+        self.parent = parent
+
+    def visit_Import(self, stmt):
+        for alias in stmt.names:
+            self.parent.import_modules.setdefault(alias.name, None)
+        self.generic_visit(stmt)
+
+    def visit_ImportFrom(self, stmt):
+        self.parent.import_modules.setdefault(stmt.module, None)
+        self.generic_visit(stmt)
+
+
+def synthetic_source(functions):
+    """
+    :param functions: the number of functions and classes to generate
+    :type functions: int
+    :return: python source with a mix of assignments, classes, functions, and calls
+    :rtype: str
+    """
+    lines = ['"""synthetic benchmark module"""', '']
+    for index in range(functions):
+        lines.extend([
+            'VALUE_{n} = {n}'.format(n=index),
+            '',
+            'class Klass{n}(object):'.format(n=index),
+            '    attr = {n}'.format(n=index),
+            '    def method(self, value):',
+            '        return self.helper.compute(value, len(str(value)))',
+            '',
+            'def function_{n}(arg):'.format(n=index),
+            '    result = [Klass{n}().method(x) for x in range(arg)]'.format(n=index),
+            '    os.path.join(str(arg), "a", "b")',
+            '    return sorted(result, key=lambda item: abs(item))',
+            '',
+        ])
+    return '\n'.join(lines)
+
+
+def reset(info):
+    """Clear the values a parser pass fills in so each timing run starts from scratch."""
+    info.calls = []
+    info.class_names = []
+    info.function_names = []
+    info.variable_names = []
+    info.import_names = []
+    info.import_modules = {}
+
+
+def three_pass(info):
+    """the original design, one walk per parser"""
+    reset(info)
+    LegacyCallsParser(info).visit(info.tree)
+    LegacyExportableParser(info).visit(info.tree)
+    LegacyImportParser(info).visit(info.tree)
+
+
+def single_pass(info):
+    """the fused design, one walk for everything"""
+    reset(info)
+    ModuleInfo.ModuleParser(info).visit(info.tree)
+
+
+def main():
+    """run the benchmark and print the timings"""
+    parser = argparse.ArgumentParser(description='ModuleInfo parser pass benchmark')
+    parser.add_argument('--functions', type=int, default=500, help='functions and classes in the module')
+    parser.add_argument('--repeat', type=int, default=20, help='number of passes to time')
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.py', delete=False) as source_file:
+        source_file.write(synthetic_source(args.functions))
+    try:
+        info = ModuleInfo(module_spec='synthetic', file_spec=source_file.name)
+        nodes = sum(1 for _ in ast.walk(info.tree))
+
+        legacy = min(timeit.repeat(lambda: three_pass(info), number=1, repeat=args.repeat))
+        fused = min(timeit.repeat(lambda: single_pass(info), number=1, repeat=args.repeat))
+    finally:
+        os.remove(source_file.name)
+
+    print("nodes:       {nodes}".format(nodes=nodes))
+    print("three pass:  {seconds:.6f}s".format(seconds=legacy))
+    print("single pass: {seconds:.6f}s".format(seconds=fused))
+    print("speedup:     {speedup:.2f}x".format(speedup=legacy / fused))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Time the main phases of an analysis on a generated synthetic package and write the results as JSON so they
+can be compared across releases.
+
+Usage::
+
+    ➤ python benchmarks/run_benchmarks.py --modules 500 --symbols 20 --output results.json
+
+Each phase is timed separately, on a fresh CodeAnalyzer without a cache:
+
+* find_modules - discovering and parsing the package
+* exportables - collecting the exportable symbols (modules already found)
+* calls - collecting the calls (modules already found)
+* astpp_dump - astpp.dump of every module's tree
+* import_tracer - ImportTracer.execute of each wildcard chain module
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+# noinspection PyPep8
+import refactor_imports
+# noinspection PyPep8
+from refactor_imports.code_analyzer import CodeAnalyzer
+# noinspection PyPep8
+from refactor_imports.import_tracer import ImportTracer
+# noinspection PyPep8
+from synthetic import generate_package
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+
+def time_runs(func, setup=None, repeat=3):
+    """
+    :param func: the function to time, called with the value returned by setup
+    :param setup: called before each run, not included in the time
+    :param repeat: the number of runs
+    :return: the timings
+    :rtype: dict
+    """
+    runs = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        start = timeit.default_timer()
+        func(arg)
+        runs.append(timeit.default_timer() - start)
+    return {'min': min(runs), 'mean': sum(runs) / len(runs), 'runs': runs}
+
+
+def analyzed(top_dir):
+    """a CodeAnalyzer that has already found the modules"""
+    analyzer = CodeAnalyzer(top_dir)
+    analyzer.find_modules(top_dir)
+    return analyzer
+
+
+def run(args, top_dir):
+    """
+    :return: the timing results for each phase
+    :rtype: dict
+    """
+    results = {
+        'find_modules': time_runs(lambda analyzer: analyzer.find_modules(top_dir),
+                                  setup=lambda: CodeAnalyzer(top_dir), repeat=args.repeat),
+        'exportables': time_runs(lambda analyzer: analyzer.exportables(),
+                                 setup=lambda: analyzed(top_dir), repeat=args.repeat),
+        'calls': time_runs(lambda analyzer: analyzer.calls(),
+                           setup=lambda: analyzed(top_dir), repeat=args.repeat),
+    }
+
+    module_infos = analyzed(top_dir).find_modules(top_dir)
+    results['astpp_dump'] = time_runs(lambda infos: [info.dump_tree() for info in infos],
+                                      setup=lambda: module_infos, repeat=args.repeat)
+
+    chain = [info for info in module_infos if os.path.basename(info.file_spec).startswith('chain')]
+    results['import_tracer'] = time_runs(
+        lambda infos: [ImportTracer(info.module_spec, info.file_spec).execute() for info in infos],
+        setup=lambda: chain, repeat=args.repeat)
+    results['import_tracer']['modules'] = len(chain)
+    return results
+
+
+def main():
+    """generate the package, run the benchmarks, and write the JSON results"""
+    parser = argparse.ArgumentParser(description='RefactorImports benchmark suite')
+    parser.add_argument('--modules', type=int, default=100, help='number of modules in the package')
+    parser.add_argument('--symbols', type=int, default=10, help='variables, classes and functions per module')
+    parser.add_argument('--wildcard_depth', type=int, default=2, help='length of the wildcard import chain')
+    parser.add_argument('--call_density', type=int, default=3, help='calls per function')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per phase')
+    parser.add_argument('--output', type=str, metavar='FILE', default='benchmark.json',
+                        help='write the JSON results to FILE (default=benchmark.json)')
+    args = parser.parse_args()
+
+    top_dir = tempfile.mkdtemp()
+    sys.path.insert(0, top_dir)
+    try:
+        generate_package(top_dir, modules=args.modules, symbols=args.symbols, wildcard_depth=args.wildcard_depth,
+                         call_density=args.call_density)
+        results = run(args, top_dir)
+    finally:
+        sys.path.remove(top_dir)
+        shutil.rmtree(top_dir)
+
+    report = {
+        'version': refactor_imports.__version__,
+        'python': platform.python_version(),
+        'parameters': {
+            'modules': args.modules,
+            'symbols': args.symbols,
+            'wildcard_depth': args.wildcard_depth,
+            'call_density': args.call_density,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    # written to a file as the tracer processes log to stdout
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# coding=utf-8
+
+"""
+Generate synthetic python packages for benchmarking.
+
+The generated package has:
+
+* modules ``mod0 .. modN`` each defining a number of variables, classes and functions,
+* functions whose bodies call symbols from lower numbered modules (the call density),
+* a chain of modules ``chain0 .. chainD`` where each one wildcard imports the next, the last one wildcard
+  importing ``mod0``.
+
+Usage::
+
+    package_dir = generate_package(work_dir, modules=200, symbols=20, wildcard_depth=3, call_density=5)
+"""
+
+import os
+import random
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+
+def generate_package(top_dir, modules=100, symbols=10, wildcard_depth=2, call_density=3, package='synth', seed=0):
+    """
+    Write the synthetic package into top_dir.
+
+    :param top_dir: the directory to create the package directory in
+    :type top_dir: str
+    :param modules: the number of plain modules
+    :type modules: int
+    :param symbols: the number of variables, classes and functions (each) per module
+    :type symbols: int
+    :param wildcard_depth: the length of the chain of wildcard importing modules
+    :type wildcard_depth: int
+    :param call_density: the number of calls to other modules' symbols in each function
+    :type call_density: int
+    :param package: the package name
+    :type package: str
+    :param seed: random seed so the same parameters always generate the same package
+    :type seed: int
+    :return: the package directory
+    :rtype: str
+    """
+    rand = random.Random(seed)
+    package_dir = os.path.join(top_dir, package)
+    os.makedirs(package_dir)
+    _write(package_dir, '__init__', '"""synthetic benchmark package"""\n')
+
+    for index in range(modules):
+        _write(package_dir, 'mod{n}'.format(n=index),
+               module_source(package, index, symbols, call_density, rand))
+
+    for index in range(wildcard_depth):
+        if index + 1 < wildcard_depth:
+            target = 'chain{n}'.format(n=index + 1)
+        else:
+            target = 'mod0'
+        _write(package_dir, 'chain{n}'.format(n=index),
+               '"""wildcard chain link {n}"""\n\nfrom {package}.{target} import *\n\n\n'
+               'def chain_{n}():\n    return function_0_0()\n'.format(n=index, package=package, target=target))
+    return package_dir
+
+
+def module_source(package, index, symbols, call_density, rand):
+    """
+    :return: the source for one plain module
+    :rtype: str
+    """
+    imports = set()
+    lines = ['"""synthetic module {n}"""'.format(n=index), '']
+    body = []
+    for symbol in range(symbols):
+        body.extend([
+            'VALUE_{n}_{s} = {s}'.format(n=index, s=symbol),
+            '',
+            '',
+            'class Klass_{n}_{s}(object):'.format(n=index, s=symbol),
+            '    attr = {s}'.format(s=symbol),
+            '',
+            '    def method(self, value):',
+            '        return self.attr + len(str(value))',
+            '',
+            '',
+            'def function_{n}_{s}(arg):'.format(n=index, s=symbol),
+        ])
+        for call in range(call_density):
+            # only call into lower numbered modules so importing the package never hits an import cycle
+            other = rand.randrange(index) if index else index
+            other_symbol = rand.randrange(symbols)
+            if other != index:
+                imports.add((other, other_symbol))
+            body.append('    Klass_{n}_{s}().method(arg)'.format(n=other, s=other_symbol))
+        body.extend(['    return arg', '', ''])
+
+    for other, other_symbol in sorted(imports):
+        lines.append('from {package}.mod{n} import Klass_{n}_{s}'.format(package=package, n=other, s=other_symbol))
+    lines.extend(['', ''])
+    lines.extend(body)
+    return '\n'.join(lines) + '\n'
+
+
+def _write(package_dir, module_name, source):
+    with open(os.path.join(package_dir, module_name + '.py'), 'w') as source_file:
+        source_file.write(source)
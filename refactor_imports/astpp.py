@@ -7,8 +7,14 @@ Alex Leone (acleone ~AT~ gmail.com), 2010-01-30
 """
 
 from ast import *
+from itertools import chain
 import sys
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 
 def dump(node, annotate_fields=True, include_attributes=False, indent='  '):
     """
@@ -28,44 +34,94 @@ def dump(node, annotate_fields=True, include_attributes=False, indent='  '):
     :param indent: indent output
     :type indent: str
     """
+    stream = StringIO()
+    dump_to(node, stream, annotate_fields=annotate_fields, include_attributes=include_attributes, indent=indent)
+    return stream.getvalue()
+
+
+class _Nested(object):
+    """a value to format at the given level"""
+    __slots__ = ('value', 'level')
+
+    def __init__(self, value, level):
+        self.value = value
+        self.level = level
+
+
+def dump_to(node, stream, annotate_fields=True, include_attributes=False, indent='  '):
+    """
+    Same as dump() but writes the dump to *stream* as the tree is walked instead of building the
+    whole string.  The walk keeps an explicit stack of iterators, one per open node or list, so deep
+    trees do not hit the recursion limit and the extra memory is proportional to the depth of the tree.
+
+    :param node:  AST tree node
+    :type node: AstNode
+    :param stream: where to write the dump, for example sys.stdout
+    :type stream: file
+    :param annotate_fields: show names and values for fields
+    :type annotate_fields: bool
+    :param include_attributes: dump includes line numbers and column offsets
+    :type include_attributes: bool
+    :param indent: indent output
+    :type indent: str
+    """
     # noinspection PyProtectedMember
-    def _format(node_, level=0):
-        if isinstance(node_, AST):
-            fields = [(a, _format(b, level)) for a, b in iter_fields(node_)]
-            if include_attributes and node_._attributes:
-                fields.extend([(a, _format(getattr(node_, a), level))
-                               for a in node_._attributes])
-            return ''.join([
-                node_.__class__.__name__,
-                '(',
-                ', '.join(('%s=%s' % field for field in fields)
-                          if annotate_fields else
-                          (b for a, b in fields)),
-                ')'])
-        elif isinstance(node_, list):
-            lines = ['[']
-            lines.extend((indent * (level + 2) + _format(x, level + 2) + ',' for x in node_))
-            if len(lines) > 1:
-                lines.append(indent * (level + 1) + ']')
-            else:
-                lines[-1] += ']'
-            return '\n'.join(lines)
-        return repr(node_)
+    def _node_tokens(node_, level):
+        yield node_.__class__.__name__ + '('
+        fields = iter_fields(node_)
+        if include_attributes and node_._attributes:
+            fields = chain(fields, ((a, getattr(node_, a)) for a in node_._attributes))
+        for index, (name, value) in enumerate(fields):
+            if index:
+                yield ', '
+            if annotate_fields:
+                yield name + '='
+            yield _Nested(value, level)
+        yield ')'
+
+    def _list_tokens(list_, level):
+        yield '['
+        if not list_:
+            yield ']'
+            return
+        for value in list_:
+            yield '\n' + indent * (level + 2)
+            yield _Nested(value, level + 2)
+            yield ','
+        yield '\n' + indent * (level + 1) + ']'
 
     if not isinstance(node, AST):
         raise TypeError('expected AST, got %r' % node.__class__.__name__)
-    return _format(node)
+
+    write = stream.write
+    stack = [_node_tokens(node, 0)]
+    while stack:
+        try:
+            token = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            continue
+        if isinstance(token, _Nested):
+            if isinstance(token.value, AST):
+                stack.append(_node_tokens(token.value, token.level))
+            elif isinstance(token.value, list):
+                stack.append(_list_tokens(token.value, token.level))
+            else:
+                write(repr(token.value))
+        else:
+            write(token)
 
 
 if __name__ == '__main__':
 
     for filename in sys.argv[1:]:
-        print '=' * 50
-        print 'AST tree for', filename
-        print '=' * 50
+        print('=' * 50)
+        print('AST tree for', filename)
+        print('=' * 50)
         # noinspection PyArgumentEqualDefault
         f = open(filename, 'r')
         fstr = f.read()
         f.close()
-        print dump(parse(fstr, filename=filename), include_attributes=True)
-        print
+        dump_to(parse(fstr, filename=filename), sys.stdout, include_attributes=True)
+        print()
+        print()
@@ -0,0 +1,183 @@
+# coding=utf-8
+
+"""
+Index of the call sites in the analyzed modules.
+
+Each call target is qualified through the calling module's imports ("from pkg.mod import func as f" makes f()
+a call of pkg.mod.func, calls of the module's own functions and classes get the module's name) and kept once,
+interned, in a table of names.  The call sites are rows of parallel integer arrays: target, module, line,
+column, and count, where the calls of the same target on the same line share one row and count them.  The
+rows of each target are found through a compressed sparse row index built on the first query, the same layout
+as the ImportGraph's edges, so a large repository's calls take a few bytes per call site.
+"""
+
+import heapq
+from array import array
+
+from refactor_imports.exportable import intern
+from refactor_imports.import_graph import package_spec
+from refactor_imports.module_info import absolute_module_spec
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+
+class CallSiteIndex(object):
+    """
+    Usage::
+
+        index = CallSiteIndex(analyzer.iter_modules())
+        for module_spec, line, column, count in index.callers('refactor_imports.module_info.find_module_file'):
+            print(module_spec, line)
+        for name, count in index.hottest(10):
+            print(name, count)
+    """
+
+    def __init__(self, module_infos=()):
+        """
+        :param module_infos: the modules whose calls are indexed
+        :type module_infos: iterable(ModuleInfo)
+        """
+        # target number -> qualified name, and back
+        self.names = []
+        self.name_index = {}
+        # module number -> module name, and back
+        self.modules = []
+        self.module_index = {}
+        # one element per call site row
+        self.site_names = array('i')
+        self.site_modules = array('i')
+        self.site_lines = array('i')
+        self.site_columns = array('i')
+        self.site_counts = array('i')
+        # target number -> the number of calls
+        self.totals = array('i')
+        # the rows of target i are rows[offsets[i]:offsets[i + 1]], built on first use
+        self._offsets = None
+        self._rows = None
+
+        for module_info in module_infos:
+            self.add(module_info)
+
+    def __len__(self):
+        return len(self.site_names)
+
+    def add(self, module_info):
+        """
+        Index the module's calls.
+
+        :param module_info: the module
+        :type module_info: ModuleInfo
+        """
+        module_number = self._number(module_info.module_spec, self.modules, self.module_index)
+        defined = set(module_info.defined_names)
+        positions = module_info.call_positions
+        # (target, line) -> row, for the calls of the same target on one line
+        rows = {}
+        for call_number, name in enumerate(module_info.calls):
+            if 2 * call_number + 1 < len(positions):
+                line, column = positions[2 * call_number], positions[2 * call_number + 1]
+            else:
+                # summary from before the positions were recorded
+                line, column = 0, 0
+            name_number = self._number(self.qualify(module_info, name, defined), self.names, self.name_index)
+            if name_number == len(self.totals):
+                self.totals.append(0)
+            self.totals[name_number] += 1
+            row = rows.get((name_number, line))
+            if row is not None:
+                self.site_counts[row] += 1
+                continue
+            rows[(name_number, line)] = len(self.site_names)
+            self.site_names.append(name_number)
+            self.site_modules.append(module_number)
+            self.site_lines.append(line)
+            self.site_columns.append(column)
+            self.site_counts.append(1)
+        self._offsets = None
+        self._rows = None
+
+    @staticmethod
+    def qualify(module_info, name, defined=None):
+        """
+        :param module_info: the module making the call
+        :type module_info: ModuleInfo
+        :param name: the called name as written, for example "os.path.join" or "f"
+        :type name: str
+        :param defined: the module's defined names, computed when None
+        :type defined: set(str)|None
+        :return: the name qualified through the module's imports, or with the module's name when the module
+                 defines it, else the name as written
+        :rtype: str
+        """
+        head, dot, rest = name.partition('.')
+        imported = module_info.import_aliases.get(head)
+        if imported is not None:
+            imported = absolute_module_spec(imported, module_info.module_spec, module_info.file_spec) or imported
+            return imported + dot + rest
+        if defined is None:
+            defined = set(module_info.defined_names)
+        module_spec = package_spec(module_info.module_spec)
+        if head in defined and module_spec:
+            return module_spec + '.' + name
+        return name
+
+    def callers(self, name):
+        """
+        :param name: the qualified name of the call target
+        :type name: str
+        :return: (module_spec, line, column, count) of each call site, in the order the modules were added
+        :rtype: list(tuple(str,int,int,int))
+        """
+        name_number = self.name_index.get(name)
+        if name_number is None:
+            return []
+        offsets, rows = self._target_rows()
+        return [(self.modules[self.site_modules[row]], self.site_lines[row], self.site_columns[row],
+                 self.site_counts[row]) for row in rows[offsets[name_number]:offsets[name_number + 1]]]
+
+    def hottest(self, count=10):
+        """
+        :param count: the number of targets
+        :type count: int
+        :return: (qualified name, number of calls) of the most called targets, most called first
+        :rtype: list(tuple(str,int))
+        """
+        totals = self.totals
+        numbers = heapq.nlargest(count, range(len(totals)), key=lambda number: (totals[number], -number))
+        return [(self.names[number], totals[number]) for number in numbers]
+
+    @staticmethod
+    def _number(name, names, index):
+        """
+        :return: the number of the name in the names table, added to the table if new
+        :rtype: int
+        """
+        number = index.get(name)
+        if number is None:
+            number = len(names)
+            names.append(intern(name))
+            index[names[number]] = number
+        return number
+
+    def _target_rows(self):
+        """
+        Counting sort of the rows by target so each target's rows are contiguous, in row order.
+
+        :return: the offsets and the rows
+        :rtype: tuple(array,array)
+        """
+        if self._offsets is None:
+            offsets = array('i', [0]) * (len(self.names) + 1)
+            for name_number in self.site_names:
+                offsets[name_number + 1] += 1
+            for number in range(len(self.names)):
+                offsets[number + 1] += offsets[number]
+            rows = array('i', [0]) * len(self.site_names)
+            position = array('i', offsets)
+            for row, name_number in enumerate(self.site_names):
+                rows[position[name_number]] = row
+                position[name_number] += 1
+            self._offsets = offsets
+            self._rows = rows
+        return self._offsets, self._rows
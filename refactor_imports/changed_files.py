@@ -0,0 +1,125 @@
+# coding=utf-8
+
+"""
+Limit the analysis to the modules touched by a change.
+
+The changed files come from an explicit list or from the local git executable: everything that differs from a
+commit (committed since, staged, or only in the working tree) plus the untracked files.  A module that wildcard
+imports a changed module may bind different names after the change, so the modules that wildcard import the
+changed ones, directly or through other wildcard imports, are selected too.  Finding those only scans the
+source text for "from ... import *" lines, nothing is parsed.
+"""
+
+import os
+import re
+import subprocess
+
+from refactor_imports.import_graph import package_spec
+from refactor_imports.module_info import absolute_module_spec
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+WILDCARD_REGEX = re.compile(br'^[ \t]*from[ \t]+(\S+)[ \t]+import[ \t]+[*]', re.MULTILINE)
+
+
+class GitError(Exception):
+    """The git executable failed or is not available."""
+    pass
+
+
+def git_output(work_dir, args):
+    """
+    :param work_dir: the directory to run git in
+    :type work_dir: str
+    :param args: the git command line arguments
+    :type args: list(str)
+    :return: the lines git wrote to stdout
+    :rtype: list(str)
+    :raises GitError: if git can not be run or fails
+    """
+    try:
+        process = subprocess.Popen(['git'] + args, cwd=work_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+    except OSError as ex:
+        raise GitError("Unable to run git: {err}".format(err=str(ex)))
+    if process.returncode != 0:
+        raise GitError("git {args} failed: {err}".format(args=' '.join(args),
+                                                         err=stderr.decode('utf-8', 'replace').strip()))
+    return stdout.decode('utf-8').splitlines()
+
+
+def git_changed_files(top_dir, since):
+    """
+    :param top_dir: the directory containing the modules, inside a git work tree
+    :type top_dir: str
+    :param since: the git commit, branch, or tag to compare the work tree with
+    :type since: str
+    :return: the absolute paths of the python files below top_dir that changed since the commit or are
+             untracked, deleted files are left out.  The paths start with top_dir even when it is reached
+             through a symbolic link.
+    :rtype: list(str)
+    :raises GitError: if git can not be run or top_dir is not in a git work tree
+    """
+    top_dir = os.path.abspath(top_dir)
+    # git reports the paths relative to the real work tree, so compare the real paths
+    real_top_dir = os.path.realpath(top_dir)
+    root = git_output(top_dir, ['rev-parse', '--show-toplevel'])[0]
+    names = git_output(top_dir, ['diff', '--name-only', since, '--'])
+    names += git_output(top_dir, ['ls-files', '--others', '--exclude-standard', '--full-name'])
+    file_specs = []
+    for name in names:
+        real_file_spec = os.path.realpath(os.path.join(root, name))
+        if not real_file_spec.endswith('.py') or not real_file_spec.startswith(os.path.join(real_top_dir, '')):
+            continue
+        file_spec = os.path.join(top_dir, os.path.relpath(real_file_spec, real_top_dir))
+        if os.path.isfile(file_spec) and file_spec not in file_specs:
+            file_specs.append(file_spec)
+    return file_specs
+
+
+def wildcard_modules(file_spec):
+    """
+    :param file_spec: the path to the module file
+    :type file_spec: str
+    :return: the module names, as written, of the module's "from module import *" lines
+    :rtype: list(str)
+    """
+    try:
+        with open(file_spec, 'rb') as source_file:
+            source = source_file.read()
+    except (IOError, OSError):
+        return []
+    if b'*' not in source:
+        return []
+    return [module.decode('utf-8', 'replace') for module in WILDCARD_REGEX.findall(source)]
+
+
+def wildcard_importers(module_files, file_specs):
+    """
+    :param module_files: (module_spec, file_spec) for every module in the tree
+    :type module_files: list(tuple(str,str))
+    :param file_specs: the changed files
+    :type file_specs: iterable(str)
+    :return: the changed files plus the files of the modules that wildcard import them, directly or through
+             other wildcard imports
+    :rtype: set(str)
+    """
+    selected = set(os.path.abspath(file_spec) for file_spec in file_specs)
+    module_file = dict((package_spec(module_spec), file_spec) for module_spec, file_spec in module_files if module_spec)
+
+    # imported file -> the files that wildcard import it
+    importers = {}
+    for module_spec, file_spec in module_files:
+        for module in wildcard_modules(file_spec):
+            imported_file = module_file.get(absolute_module_spec(module, module_spec, file_spec))
+            if imported_file is not None:
+                importers.setdefault(imported_file, []).append(file_spec)
+
+    pending = list(selected)
+    while pending:
+        for importer in importers.get(pending.pop(), ()):
+            if importer not in selected:
+                selected.add(importer)
+                pending.append(importer)
+    return selected
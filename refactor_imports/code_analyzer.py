@@ -4,9 +4,21 @@
 Analyzer for python source code import statements
 """
 
+import gc
+import multiprocessing
 import os
-from refactor_imports.module_info import ModuleInfo
+import sys
+
+from refactor_imports.call_index import CallSiteIndex
+from refactor_imports.changed_files import wildcard_importers
+from refactor_imports.import_graph import ImportGraph
+from refactor_imports.memory_usage import current_rss, megabytes
+from refactor_imports.module_finder import ModuleFinder
+from refactor_imports.module_info import ModuleInfo, ModuleRegistry
+from refactor_imports.phase_timer import PhaseTimer
+from refactor_imports.symbol_index import SymbolIndex
 from fullmonty.list_helper import unique_list
+from fullmonty.simple_logger import debug
 
 __author__ = 'roy'
 
@@ -17,11 +29,61 @@ class CodeAnalyzer(object):
 
     :param top_dir: top directory containing python source files (*.py)
     :type top_dir: str
+    :param cache: optional persistent cache of module summaries so unchanged files are not parsed again
+    :type cache: refactor_imports.module_cache.ModuleCache|None
+    :param jobs: the number of processes to parse the modules with
+    :type jobs: int
+    :param keep_trees: keep each module's parsed tree.  When False only the extracted names are kept and
+                       ModuleInfo.dump_tree() parses the file again.
+    :type keep_trees: bool
+    :param include: when given, only analyze the modules whose file name or relative path match one of these globs
+    :type include: list(str)|None
+    :param exclude: skip the files and directories whose name or relative path match one of these globs
+    :type exclude: list(str)|None
+    :param timer: the timer the phases of the analysis are added to, a new one when None
+    :type timer: PhaseTimer|None
+    :param memory_limit: the resident memory, in bytes, above which iter_chunks() releases the analyzed imported
+                         modules between chunks.  None for no limit.
+    :type memory_limit: int|None
+    :param files: when given, only output and trace these files and the modules that wildcard import them, for
+                  example the files changed since a commit.  The indexes are still built over the whole tree.  None
+                  to select the whole tree.
+    :type files: list(str)|None
     """
 
-    def __init__(self, top_dir):
+    # with several jobs, modules are parsed in batches of this many per job
+    BATCH_PER_JOB = 16
+
+    # the default number of modules per iter_chunks() chunk
+    CHUNK_SIZE = 256
+
+    # the fraction of memory_limit the process must grow by after a release before the registry is released again
+    RELEASE_GROWTH = 0.1
+
+    def __init__(self, top_dir, cache=None, jobs=1, keep_trees=True, include=None, exclude=None, timer=None,
+                 memory_limit=None, files=None):
         self.top_dir = top_dir
+        # wall and cpu time per phase: discovery, parse, visit, resolve imports, parallel parse
+        self.timer = timer or PhaseTimer()
+        self.cache = cache
+        self.jobs = jobs
+        self.keep_trees = keep_trees
+        self.include = include
+        self.exclude = exclude
+        self.finder = ModuleFinder(top_dir, include=include, exclude=exclude)
+        self.memory_limit = memory_limit
+        self.files = files
+        # top directory -> the files selected by files, found on first use
+        self._selected = {}
+        # the number of times iter_chunks() released the registry to stay under memory_limit
+        self.releases = 0
+        # the resident memory right after the last release, None before the first
+        self._released_rss = None
+        self.registry = self._new_registry()
         self.module_infos = None
+        self._symbol_index = None
+        # the whole tree's modules kept by symbol_index(), reused by iter_modules()
+        self._indexed_modules = None
 
     def exportables(self):
         """
@@ -37,6 +99,58 @@ class CodeAnalyzer(object):
             exportables_.extend(info.exportables)
         return exportables_
 
+    def iter_exportables(self):
+        """
+        Streaming version of exportables(), yields each module's exportables as soon as the module is analyzed.
+
+        :return: generator of exportable objects
+        :rtype: iterable(Exportable)
+        """
+        for info in self.iter_modules():
+            for exportable in info.exportables:
+                yield exportable
+
+    def symbol_index(self):
+        """
+        The index over all of the exportables, built on the first call.
+
+        Building the index analyzes every module of the tree, including the ones files does not select, from
+        the cache when there is one so only the changed modules are parsed.  The modules, without their trees and
+        with their imports unresolved, are kept so a following iter_modules() pass, for example to print each
+        module's imports, reuses them instead of analyzing every module a second time.  With a memory_limit, or
+        when files selects the modules to output, they are not kept and the following pass analyzes the modules
+        it yields again, so memory use does not grow with the size of the tree.
+
+        :return: index mapping names to the exportables and modules to their names
+        :rtype: SymbolIndex
+        """
+        if self._symbol_index is None:
+            if self.module_infos is not None and self.files is None:
+                self._symbol_index = SymbolIndex(self.exportables())
+            else:
+                index = SymbolIndex()
+                indexed_modules = [] if self.memory_limit is None and self.files is None else None
+                for info in self.iter_modules(selected=False):
+                    if indexed_modules is not None:
+                        indexed_modules.append(info)
+                    for exportable in info.exportables:
+                        index.add(exportable)
+                self._symbol_index = index
+                self._indexed_modules = indexed_modules
+        return self._symbol_index
+
+    def import_graph(self, start_dir=None):
+        """
+        Build the graph of the imports between the modules in one pass over the modules, including the ones files
+        does not select.
+
+        :param start_dir: the directory (or stand-alone file) to search, defaults to top_dir
+        :type start_dir: str|None
+        :return: the import graph
+        :rtype: ImportGraph
+        """
+        return ImportGraph(self.iter_modules(self.top_dir, start_dir, selected=False))
+
     def calls(self):
         """
         Find the list of calls in each module.
@@ -50,37 +164,259 @@ class CodeAnalyzer(object):
             calls[info.module_spec] = sorted(unique_list(info.calls))
         return calls
 
-    # noinspection PyMethodMayBeStatic
+    def call_index(self):
+        """
+        The index of every call site in the tree, with the call targets qualified through each module's imports.
+
+        :return: the call site index
+        :rtype: CallSiteIndex
+        """
+        if self.module_infos is not None and self.files is None:
+            return CallSiteIndex(self.module_infos)
+        # no need to keep every module around just to build the index
+        return CallSiteIndex(self.iter_modules(selected=False))
+
+    def iter_calls(self):
+        """
+        Streaming version of calls(), yields each module's calls as soon as the module is analyzed.
+
+        :return: generator of (module name, sorted list of call symbols in the module)
+        :rtype: iterable(tuple(str,list(str)))
+        """
+        for info in self.iter_modules():
+            yield info.module_spec, sorted(unique_list(info.calls))
+
     def find_modules(self, top_dir, start_dir=None):
         """
         Find information about each module in the given directory tree.
 
-        :param top_dir:
-        :param start_dir:
-        :return:
-        :rtype:
-        """
-        if start_dir is None:
-            start_dir = top_dir
+        When jobs is greater than one, the files are parsed in a pool of worker processes.  The workers
+        return plain summaries which are turned back into ModuleInfo objects in the same order the files
+        were found.
+
+        The modules of the whole tree are kept, later calls for the whole tree or any subtree of it reuse them.
 
-        if self.module_infos is not None:
+        :param top_dir: the directory module names are relative to
+        :type top_dir: str
+        :param start_dir: the directory (or stand-alone file) to search, defaults to top_dir
+        :type start_dir: str|None
+        :return: the modules in the subtree
+        :rtype: list(ModuleInfo)
+        """
+        whole_tree = start_dir is None or os.path.abspath(start_dir) == os.path.abspath(top_dir)
+        if whole_tree and self.module_infos is not None:
             return self.module_infos
-        module_infos = []
-        if os.path.isdir(start_dir):
-            # package directory structure
-            for dir_name, subdir_list, file_list in os.walk(start_dir):
-                # python packages must have a __init__.py file
-
-                if '__init__.py' in file_list:
-                    for file_name in [name for name in file_list if name.endswith('.py')]:
-                        dir_path = os.path.relpath(dir_name, top_dir)
-                        module_spec = os.path.splitext(os.path.join(dir_path, file_name))[0].replace('/', '.')
-                        file_spec = os.path.join(os.path.abspath(top_dir), dir_path, file_name)
-                        module_infos.append(ModuleInfo(module_spec=module_spec, file_spec=file_spec))
-        elif os.path.isfile(start_dir):
-            # stand-alone file
-            file_spec = os.path.abspath(start_dir)
-            module_infos.append(ModuleInfo(module_spec='', file_spec=file_spec))
-
-        self.module_infos = module_infos
+
+        module_infos = list(self.iter_modules(top_dir, start_dir))
+
+        # register all of the newly found modules before resolving any imports so imports between them resolve
+        # to these ModuleInfo objects
+        self._resolve_chunk(module_infos)
+
+        if whole_tree:
+            self.module_infos = module_infos
         return module_infos
+
+    def iter_modules(self, top_dir=None, start_dir=None, selected=True, by_name=False):
+        """
+        Streaming version of find_modules(), yields each module as soon as it is analyzed.  The modules are not
+        kept and their imports are not resolved, so memory use does not grow with the size of the tree.
+
+        :param top_dir: defaults to self.top_dir
+        :param start_dir: defaults to top_dir
+        :param selected: only the modules selected by files, False for every module
+        :type selected: bool
+        :param by_name: yield the modules in module name order instead of the order find_modules() returns them
+        :type by_name: bool
+        :return: generator of modules in the same order as find_modules(), or by name
+        :rtype: iterable(ModuleInfo)
+        """
+        if top_dir is None:
+            top_dir = self.top_dir
+        module_files = self.module_files(top_dir, start_dir, selected=selected)
+        if by_name:
+            # sort the file listing rather than the analyzed modules so they are still streamed
+            module_files = sorted(module_files, key=lambda module_file: module_file[0])
+
+        known_infos = self.module_infos if self.module_infos is not None else self._indexed_modules
+        if known_infos is not None:
+            # already analyzed the whole tree
+            known = dict((info.file_spec, info) for info in known_infos)
+            for module_spec, file_spec in module_files:
+                info = known.get(file_spec)
+                if info is None:
+                    info = ModuleInfo(module_spec=module_spec, file_spec=file_spec, cache=self.cache, resolve=False,
+                                      keep_tree=self.keep_trees, timer=self.timer)
+                yield info
+            return
+
+        if self.jobs <= 1:
+            for module_spec, file_spec in module_files:
+                yield ModuleInfo(module_spec=module_spec, file_spec=file_spec, cache=self.cache, resolve=False,
+                                 keep_tree=self.keep_trees, timer=self.timer)
+            return
+
+        pool = multiprocessing.Pool(processes=self.jobs)
+        try:
+            # hand the files to the pool a batch at a time so the first results are available right away
+            batch = []
+            for module_file in module_files:
+                batch.append(module_file)
+                if len(batch) == self.jobs * CodeAnalyzer.BATCH_PER_JOB:
+                    for info in self._analyze_batch(batch, pool):
+                        yield info
+                    batch = []
+            for info in self._analyze_batch(batch, pool):
+                yield info
+        finally:
+            pool.close()
+            pool.join()
+
+    def iter_chunks(self, top_dir=None, start_dir=None, chunk_size=None):
+        """
+        Memory bounded version of find_modules(), yields the modules a chunk at a time with their imports
+        resolved.  No chunk is kept after the next one is requested.  Imported modules stay in the registry
+        so later chunks can reuse them, until the process grows past memory_limit and the registry is
+        released.
+
+        :param top_dir: defaults to self.top_dir
+        :param start_dir: defaults to top_dir
+        :param chunk_size: the number of modules per chunk, defaults to CHUNK_SIZE
+        :type chunk_size: int|None
+        :return: generator of lists of modules, in the same order as find_modules()
+        :rtype: iterable(list(ModuleInfo))
+        """
+        chunk_size = chunk_size or CodeAnalyzer.CHUNK_SIZE
+        chunk = []
+        for info in self.iter_modules(top_dir, start_dir):
+            chunk.append(info)
+            if len(chunk) == chunk_size:
+                yield self._resolve_chunk(chunk)
+                chunk = []
+                self._limit_memory()
+        if chunk:
+            yield self._resolve_chunk(chunk)
+            self._limit_memory()
+
+    def release(self):
+        """
+        Drop the analyzed imported modules, and the whole tree's modules if find_modules() kept them, so
+        their memory can be reused.
+        """
+        registry = self._new_registry()
+        # keep counting across releases
+        registry.hits = self.registry.hits
+        registry.misses = self.registry.misses
+        self.registry = registry
+        self.module_infos = None
+        self._indexed_modules = None
+        gc.collect()
+        self.releases += 1
+
+    def _resolve_chunk(self, chunk):
+        """
+        :param chunk: newly analyzed modules
+        :type chunk: list(ModuleInfo)
+        :return: the chunk after registering the modules and resolving their imports
+        :rtype: list(ModuleInfo)
+        """
+        found = [info for info in chunk if info.registry is None]
+        for info in found:
+            self.registry.register(info)
+        with self.timer.phase('resolve imports'):
+            for info in found:
+                self.registry.resolve_imports(info)
+        return chunk
+
+    def _limit_memory(self):
+        """
+        Release the registry when the process uses more than memory_limit.  The freed memory is usually kept by
+        the process, so once over the limit the registry is only released again after the process has grown by
+        another RELEASE_GROWTH of the limit since the last release.
+        """
+        if self.memory_limit is not None:
+            rss = current_rss()
+            if rss is None or rss <= self.memory_limit:
+                return
+            if self._released_rss is not None and \
+                    rss < self._released_rss + self.memory_limit * CodeAnalyzer.RELEASE_GROWTH:
+                return
+            debug("Resident memory {rss} is over the {limit} limit, releasing the analyzed modules".format(
+                rss=megabytes(rss), limit=megabytes(self.memory_limit)))
+            self.release()
+            self._released_rss = current_rss()
+
+    def _new_registry(self):
+        """
+        :return: an empty registry of imported modules
+        :rtype: ModuleRegistry
+        """
+        return ModuleRegistry(search_path=[os.path.abspath(self.top_dir)] + sys.path, cache=self.cache,
+                              keep_trees=self.keep_trees, timer=self.timer)
+
+    def module_files(self, top_dir, start_dir=None, selected=True):
+        """
+        Find the python modules in the directory tree.
+
+        :param top_dir: the directory module names are relative to
+        :type top_dir: str
+        :param start_dir: the directory (or stand-alone file) to search, defaults to top_dir
+        :type start_dir: str|None
+        :param selected: only the modules selected by files, False for every module
+        :type selected: bool
+        :return: (module_spec, file_spec) for each module
+        :rtype: list(tuple(str,str))
+        """
+        finder = self.finder
+        if os.path.abspath(top_dir) != finder.top_dir:
+            finder = ModuleFinder(top_dir, include=self.include, exclude=self.exclude)
+        with self.timer.phase('discovery'):
+            module_files = finder.module_files(start_dir)
+            if selected and self.files is not None:
+                if finder.top_dir not in self._selected:
+                    # the importers can be anywhere in the tree, not only below start_dir
+                    self._selected[finder.top_dir] = wildcard_importers(finder.index, self.files)
+                selected_files = self._selected[finder.top_dir]
+                module_files = [(module_spec, file_spec) for module_spec, file_spec in module_files
+                                if file_spec in selected_files]
+            return module_files
+
+    def _analyze_batch(self, module_files, pool):
+        """
+        :param module_files: (module_spec, file_spec) for each module
+        :type module_files: list(tuple(str,str))
+        :param pool: the worker processes
+        :type pool: multiprocessing.Pool
+        :return: the modules, in the same order as module_files
+        :rtype: list(ModuleInfo)
+        """
+        # the parse and visit phases run in the workers so only the total is timed
+        with self.timer.phase('parallel parse'):
+            summaries = self._summaries([file_spec for module_spec, file_spec in module_files], pool)
+        return [ModuleInfo(module_spec=module_spec, file_spec=file_spec, cache=self.cache, summary=summary,
+                           resolve=False, keep_tree=self.keep_trees)
+                for (module_spec, file_spec), summary in zip(module_files, summaries)]
+
+    def _summaries(self, file_specs, pool):
+        """
+        Get the summaries for the files from the cache or by parsing them in the pool of worker processes.
+
+        :param file_specs: the module files
+        :type file_specs: list(str)
+        :param pool: the worker processes
+        :type pool: multiprocessing.Pool
+        :return: the summary for each of file_specs, in the same order
+        :rtype: list(dict)
+        """
+        summaries = [None] * len(file_specs)
+        if self.cache is not None:
+            summaries = [self.cache.get(file_spec) for file_spec in file_specs]
+        missing = [index for index, summary in enumerate(summaries) if summary is None]
+        if missing:
+            chunk_size = max(1, len(missing) // (self.jobs * 4))
+            parsed = pool.imap(ModuleInfo.summarize, [file_specs[index] for index in missing], chunk_size)
+            for index, summary in zip(missing, parsed):
+                summaries[index] = summary
+                if self.cache is not None:
+                    self.cache.put(file_specs[index], summary)
+        return summaries
@@ -3,14 +3,27 @@
 """
 Symbols in a module that other modules may import are referred to here as "Exportable".
 This is a wrapper for exportable symbols with basic comparison and conversions.
+
+There may be millions of exportables in a large tree so they are slotted (no per instance __dict__), the
+module and file strings are interned so every exportable from a module shares one copy, and the comparisons
+work directly on a (module_spec, name) tuple, the rest of the ordering comes from total_ordering.
 """
 
-from fullmonty.comparable_mixin import ComparableMixin
+import sys
+from functools import total_ordering
 
 __author__ = 'roy'
 
+try:
+    intern = sys.intern
+except AttributeError:
+    # python 2, intern is a builtin
+    # noinspection PyUnboundLocalVariable,PyCompatibility
+    intern = intern
+
 
-class Exportable(ComparableMixin):
+@total_ordering
+class Exportable(object):
     """
     Usage::
 
@@ -19,6 +32,8 @@ class Exportable(ComparableMixin):
         print(exportable.import_str)
     """
 
+    __slots__ = ('module_spec', 'file_spec', 'name')
+
     def __init__(self, module_spec, file_spec, name):
         """
         Exportable(module_spec, file_spec, name)
@@ -30,14 +45,25 @@ class Exportable(ComparableMixin):
         :param name: the symbol in the module visible to external modules
         :type name: str
         """
-        self.module_spec = module_spec.split('.__init__')[0]
-        self.file_spec = file_spec
-        self.name = name
-        self.full_name = '.'.join([module_spec, name])
+        self.module_spec = intern(module_spec.split('.__init__')[0])
+        self.file_spec = intern(file_spec)
+        self.name = intern(name)
 
     def __str__(self):
         return "{module}.{name}".format(module=self.module_spec, name=self.name)
 
+    def __repr__(self):
+        return "Exportable({module!r}, {file!r}, {name!r})".format(module=self.module_spec, file=self.file_spec,
+                                                                   name=self.name)
+
+    @property
+    def full_name(self):
+        """
+        :return: the fully qualified name of the symbol
+        :rtype: str
+        """
+        return '.'.join([self.module_spec, self.name])
+
     @property
     def import_str(self):
         """
@@ -46,5 +72,20 @@ class Exportable(ComparableMixin):
         """
         return "from {module} import {name}".format(module=self.module_spec, name=self.name)
 
-    def _cmpkey(self):
-        return self.full_name
+    def __hash__(self):
+        return hash((self.module_spec, self.name))
+
+    def __eq__(self, other):
+        if not isinstance(other, Exportable):
+            return NotImplemented
+        return (self.module_spec, self.name) == (other.module_spec, other.name)
+
+    def __ne__(self, other):
+        # python 2 does not derive != from ==
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __lt__(self, other):
+        if not isinstance(other, Exportable):
+            return NotImplemented
+        return (self.module_spec, self.name) < (other.module_spec, other.name)
@@ -0,0 +1,227 @@
+# coding=utf-8
+
+"""
+The import graph of the analyzed modules.
+
+The modules are numbered and the edges stored in compressed sparse row form: the modules imported by module i
+are targets[offsets[i]:offsets[i + 1]].  Both are integer arrays so the graph of a large repository takes a
+few bytes per edge instead of a dictionary of ModuleInfo objects per module.
+
+A module's edges go to every module in the graph an import statement of the module may execute: the imported
+module, its parent packages, and for "from X import name" also X.name when that is a submodule, as in
+"from . import b".  The importing module's own packages are left out as they are imported before it runs.
+
+Import cycles are the strongly connected components of the graph, found with an iterative version of
+Tarjan's algorithm in linear time.  Tarjan's algorithm completes a component only after every component it
+imports, so the components come out with dependencies first which is also the topological order.
+"""
+
+from array import array
+
+from refactor_imports.exportable import intern
+from refactor_imports.module_info import absolute_module_spec
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+
+def package_spec(module_spec):
+    """
+    :param module_spec: the module name, possibly a package's "package.__init__"
+    :type module_spec: str
+    :return: the name the module is imported by
+    :rtype: str
+    """
+    if module_spec.endswith('.__init__'):
+        return module_spec[:-len('.__init__')]
+    return module_spec
+
+
+def imported_specs(module_info):
+    """
+    :param module_info: the importing module
+    :type module_info: ModuleInfo
+    :return: the names of the modules the module's imports may execute, including names that are not modules,
+             such as the X.name of "from X import name" when name is a class
+    :rtype: set(str)
+    """
+    module_spec = package_spec(module_info.module_spec)
+    parts = module_spec.split('.')
+    # the module's own packages are imported before the module runs
+    own = set('.'.join(parts[:count]) for count in range(1, len(parts)))
+    specs = set()
+    parents = set()
+    for name in module_info.import_names:
+        spec = package_spec(absolute_module_spec(name, module_info.module_spec, module_info.file_spec) or '')
+        if spec:
+            specs.add(spec)
+            spec_parts = spec.split('.')
+            parents.update('.'.join(spec_parts[:count]) for count in range(1, len(spec_parts)))
+    # "from X import name" and "import X as name" bind name -> X.name and X
+    for name in module_info.import_aliases.values():
+        spec = absolute_module_spec(name, module_info.module_spec, module_info.file_spec)
+        if spec:
+            specs.add(spec)
+    # a module importing itself is a cycle, one importing its own submodule only runs its package
+    parents.discard(module_spec)
+    return (specs | parents) - own
+
+
+class ImportGraph(object):
+    """
+    Usage::
+
+        graph = ImportGraph(analyzer.iter_modules())
+        for cycle in graph.cycles():
+            print(' -> '.join(cycle))
+        for module_spec in graph.topological_order():
+            print(module_spec)
+    """
+
+    def __init__(self, module_infos=()):
+        """
+        :param module_infos: the modules, only imports between these modules are edges of the graph
+        :type module_infos: iterable(ModuleInfo)
+        """
+        # node number -> module name
+        self.names = []
+        # module name -> node number
+        self.index = {}
+        # the imported modules of node i are targets[offsets[i]:offsets[i + 1]]
+        self.offsets = array('i', [0])
+        self.targets = array('i')
+        self._components = None
+
+        imports = []
+        for module_info in module_infos:
+            module_spec = package_spec(module_info.module_spec)
+            if not module_spec or module_spec in self.index:
+                continue
+            self.index[module_spec] = len(self.names)
+            self.names.append(intern(module_spec))
+            imports.append(imported_specs(module_info))
+
+        for imported in imports:
+            self.targets.extend(sorted(self.index[spec] for spec in imported if spec in self.index))
+            self.offsets.append(len(self.targets))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, module_spec):
+        return module_spec in self.index
+
+    @property
+    def edge_count(self):
+        """
+        :return: the number of imports between the modules
+        :rtype: int
+        """
+        return len(self.targets)
+
+    def imports(self, module_spec):
+        """
+        :param module_spec: the module name
+        :type module_spec: str
+        :return: the names of the modules in the graph the module imports
+        :rtype: list(str)
+        """
+        node = self.index[module_spec]
+        return [self.names[target] for target in self.targets[self.offsets[node]:self.offsets[node + 1]]]
+
+    def strongly_connected_components(self):
+        """
+        :return: the strongly connected components, each a list of module names, dependencies first
+        :rtype: list(list(str))
+        """
+        if self._components is None:
+            self._components = [[self.names[node] for node in component] for component in self._tarjan()]
+        return self._components
+
+    def cycles(self):
+        """
+        :return: the import cycles, the components with more than one module or a module importing itself
+        :rtype: list(list(str))
+        """
+        return [component for component in self.strongly_connected_components()
+                if len(component) > 1 or component[0] in self.imports(component[0])]
+
+    def topological_order(self):
+        """
+        :return: the module names with each module after the modules it imports, except within an import
+                 cycle where there is no such order
+        :rtype: list(str)
+        """
+        return [module_spec for component in self.strongly_connected_components() for module_spec in component]
+
+    def sort_modules(self, module_infos):
+        """
+        :param module_infos: modules, usually the ones the graph was built from
+        :type module_infos: iterable(ModuleInfo)
+        :return: the modules in topological order, modules not in the graph last in their original order
+        :rtype: list(ModuleInfo)
+        """
+        position = dict((module_spec, number) for number, module_spec in enumerate(self.topological_order()))
+        last = len(position)
+        return sorted(module_infos, key=lambda module_info: position.get(package_spec(module_info.module_spec), last))
+
+    def _tarjan(self):
+        """
+        Tarjan's strongly connected components algorithm with an explicit stack instead of recursion so
+        long import chains do not hit the recursion limit.
+
+        :return: the components as lists of node numbers, each component after the components it imports
+        :rtype: list(list(int))
+        """
+        count = len(self.names)
+        offsets = self.offsets
+        targets = self.targets
+        unvisited = -1
+        # visit order of each node and the lowest visit order reachable from it
+        order = array('i', [unvisited]) * count
+        low = array('i', [0]) * count
+        on_stack = bytearray(count)
+        stack = []
+        components = []
+        counter = 0
+
+        for root in range(count):
+            if order[root] != unvisited:
+                continue
+            # (node, position of the next edge to follow)
+            work = [(root, offsets[root])]
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            while work:
+                node, edge = work[-1]
+                if edge < offsets[node + 1]:
+                    work[-1] = (node, edge + 1)
+                    target = targets[edge]
+                    if order[target] == unvisited:
+                        order[target] = low[target] = counter
+                        counter += 1
+                        stack.append(target)
+                        on_stack[target] = 1
+                        work.append((target, offsets[target]))
+                    elif on_stack[target] and order[target] < low[node]:
+                        low[node] = order[target]
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if low[node] < low[parent]:
+                        low[parent] = low[node]
+                if low[node] == order[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        component.append(member)
+                        if member == node:
+                            break
+                    component.sort()
+                    components.append(component)
+        return components
@@ -3,23 +3,47 @@
 """
 Describe Me!
 """
-import collections
 import difflib
-import inspect
+import io
+import linecache
 import multiprocessing
 from multiprocessing import Process
 
 import sys
+import time
 
 import re
-# dictdiffer is in py-dictdiffer
-# noinspection PyPackageRequirements
-from dictdiffer import DictDiffer
+
+try:
+    from collections.abc import Iterable
+except ImportError:
+    # python2
+    from collections import Iterable
+
+try:
+    import builtins
+except ImportError:
+    # python2
+    # noinspection PyUnresolvedReferences
+    import __builtin__ as builtins
+
 from fullmonty.simple_logger import info, debug, error
 
+from refactor_imports.patch_applier import NO_NEWLINE_MARKER
+from refactor_imports.phase_timer import NULL_TIMER, PhaseTimer
+
 __docformat__ = 'restructuredtext en'
 __author__ = 'wrighroy'
 
+# line trace every frame of the module's import with sys.settrace
+SETTRACE_BACKEND = 'settrace'
+# only intercept the module's wildcard imports by wrapping builtins.__import__
+IMPORT_HOOK_BACKEND = 'import-hook'
+TRACER_BACKENDS = (SETTRACE_BACKEND, IMPORT_HOOK_BACKEND)
+
+# imported by an Isolate's zygote so the forked tracers start with the tracer already loaded
+TRACER_PRELOAD = ('fullmonty.simple_logger', 'refactor_imports.import_tracer')
+
 
 # noinspection PyShadowingBuiltins
 def flatten(l):
@@ -29,23 +53,106 @@ def flatten(l):
     except NameError:
         basestring = (str, bytes)
     for el in l:
-        if isinstance(el, collections.Iterable) and not isinstance(el, basestring):
+        if isinstance(el, Iterable) and not isinstance(el, basestring):
             for sub in flatten(el):
                 yield sub
         else:
             yield el
 
 
+def mark_unterminated(lines):
+    """
+    Mark a last line without a line ending the way diff does, otherwise difflib joins it with the following
+    line of the patch.
+
+    :param lines: the lines of a file including the line endings
+    :type lines: list(str)
+    :return: the lines with a "\\ No newline at end of file" line after an unterminated last line
+    :rtype: list(str)
+    """
+    if lines and not lines[-1].endswith(('\n', '\r')):
+        return lines[:-1] + [lines[-1] + '\n' + NO_NEWLINE_MARKER]
+    return lines
+
+
+def wildcard_patch(file_spec, replacements):
+    """
+    Create the unified diff that replaces wildcard imports with explicit imports.
+
+    :param file_spec: the path to the module file
+    :type file_spec: str
+    :param replacements: maps the line number of each "from module import *" to (module, names) where
+                         names are the symbols the wildcard import binds.  Lines without names are left alone.
+    :type replacements: dict(int,tuple(str,iterable(str)))
+    :return: the patch, empty if nothing is replaced
+    :rtype: str
+    """
+    # get the source file and make a copy, keeping the line endings so the PatchApplier sees the same lines
+    with io.open(file_spec, encoding='utf-8', newline='') as source_file:
+        original_source = source_file.readlines()
+    new_source = original_source[:]
+
+    for line_number, (module, names) in replacements.items():
+        if names:
+            # replace wildcard import with list of explicit imports, with the replaced line's line ending
+            line = original_source[line_number - 1]
+            ending = line[len(line.rstrip('\r\n')):]
+            imports = ["from {src} import {symbol}{ending}".format(src=module, symbol=symbol, ending=ending or '\n')
+                       for symbol in sorted(names)]
+            # an unterminated last line stays unterminated
+            imports[-1] = imports[-1].rstrip('\r\n') + ending
+            new_source[line_number - 1] = imports
+
+    return ''.join(difflib.unified_diff(mark_unterminated(original_source),
+                                       mark_unterminated(list(flatten(new_source))),
+                                       fromfile=file_spec,
+                                       tofile=file_spec))
+
+
 class ImportTracer(object):
     """
     In a separate process, import a module and capture the locals and globals around each import statement.
     """
 
-    def __init__(self, module_spec, file_spec):
+    def __init__(self, module_spec, file_spec, backend=SETTRACE_BACKEND):
+        """
+        :param module_spec: module path
+        :type module_spec: str
+        :param file_spec: the path to the module file
+        :type file_spec: str
+        :param backend: how the imports are traced, one of TRACER_BACKENDS
+        :type backend: str
+        """
         self.module_spec = module_spec
         self.file_spec = file_spec
+        self.backend = backend
+        # wall and cpu time per phase: tracer startup, traced import, to_patch
+        self.timer = PhaseTimer()
+        # the exception importing the module raised, the patch is then partial
+        self.error = None
+
+    def execute(self, pool=None, isolate=None):
+        """
+        Trace the module in a new process, in one of the pool's workers when given a pool, or in a fork of
+        the isolate's zygote when given an isolate.
+
+        :param pool: optional pool of reusable tracer processes
+        :type pool: TracerPool|None
+        :param isolate: optional zygote process that has already imported the shared dependencies
+        :type isolate: refactor_imports.isolate.Isolate|None
+        :return: the patch that replaces the module's wildcard imports
+        :rtype: str
+        """
+        if pool is not None:
+            patch = pool.trace(self.module_spec, self.file_spec, backend=self.backend, timer=self.timer)
+            self.error = pool.errors.get(self.module_spec)
+            return patch
+        if isolate is not None:
+            patch, timings, self.error = isolate.fork(ImportTracer.fork_job, self.module_spec, self.file_spec,
+                                                      self.backend, time.time())
+            self.timer.merge(timings)
+            return patch
 
-    def execute(self):
         # noinspection PyBroadException
         try:
             multiprocessing.set_start_method('spawn')
@@ -55,14 +162,16 @@ class ImportTracer(object):
         # the module tracer holds content over the entire module
         tracer = ImportTracer.ModuleTracer(self.file_spec)
         q = multiprocessing.Queue()
-        p = Process(target=ImportTracer.module_trace, args=(self.module_spec, self.file_spec, tracer, q))
+        p = Process(target=ImportTracer.module_trace, args=(self.module_spec, self.file_spec, tracer, q,
+                                                            self.backend, time.time()))
         p.start()
-        patch = q.get()
+        patch, timings, self.error = q.get()
         p.join()
+        self.timer.merge(timings)
         return patch
 
     @staticmethod
-    def module_trace(module_spec, file_spec, tracer, q):
+    def module_trace(module_spec, file_spec, tracer, q, backend=SETTRACE_BACKEND, started=None):
         """
         Load self.file_path and trace the imports
 
@@ -70,87 +179,379 @@ class ImportTracer(object):
         :type module_spec: str
         :param tracer: tracer context
         :type tracer: ImportTracer.ModuleTracer
+        :param backend: one of TRACER_BACKENDS
+        :type backend: str
+        :param started: time.time() when the process was started, to time the process startup
+        :type started: float|None
         """
+        timer = PhaseTimer()
+        if started is not None:
+            timer.add('tracer startup', time.time() - started, 0.0)
+        errors = []
+        patch = ImportTracer.trace(module_spec, file_spec, tracer, backend, timer=timer, errors=errors)
+        q.put((patch, timer.timings, errors[0] if errors else None))
+
+    @staticmethod
+    def fork_job(module_spec, file_spec, backend=SETTRACE_BACKEND, started=None):
+        """
+        Runs in a forked child of an Isolate's zygote to trace one module.  The child is thrown away
+        afterwards so, unlike a TracerPool worker, there is nothing to reset.
+
+        :param module_spec: module path
+        :type module_spec: str
+        :param file_spec: the path to the module file
+        :type file_spec: str
+        :param backend: one of TRACER_BACKENDS
+        :type backend: str
+        :param started: time.time() when the trace was requested, to time the fork
+        :type started: float|None
+        :return: the patch, the child's PhaseTimer timings, and the import's error or None
+        :rtype: tuple(str,dict,str|None)
+        """
+        timer = PhaseTimer()
+        if started is not None:
+            timer.add('tracer startup', time.time() - started, 0.0)
+        # the zygote may have preloaded the module, so remove it to have it executed under the tracer
+        sys.modules.pop(module_spec, None)
+        errors = []
+        patch = ImportTracer.trace(module_spec, file_spec, backend=backend, timer=timer, errors=errors)
+        return patch, timer.timings, errors[0] if errors else None
+
+    @staticmethod
+    def trace(module_spec, file_spec, tracer=None, backend=SETTRACE_BACKEND, timer=None, errors=None):
+        """
+        Import the module in this process while tracing the imports.
+
+        :param module_spec: module path
+        :type module_spec: str
+        :param file_spec: the path to the module file
+        :type file_spec: str
+        :param tracer: tracer context for the settrace backend, a new one is used if None
+        :type tracer: ImportTracer.ModuleTracer|None
+        :param backend: one of TRACER_BACKENDS
+        :type backend: str
+        :param timer: optional timer the traced import and to_patch phases are added to
+        :type timer: PhaseTimer|None
+        :param errors: optional list the exception importing the module raised is appended to
+        :type errors: list(str)|None
+        :return: the patch that replaces the module's wildcard imports, only the ones executed before the error
+                 when importing the module raises an exception
+        :rtype: str
+        """
+        timer = timer or NULL_TIMER
+        if backend == IMPORT_HOOK_BACKEND:
+            hook = ImportTracer.ImportHook(file_spec)
+            info("__import__({name})".format(name=module_spec))
+            with timer.phase('traced import'):
+                hook.install()
+                try:
+                    __import__(module_spec)
+                except KeyboardInterrupt:
+                    raise
+                except BaseException as ex:
+                    # whatever the module raises, SystemExit included, the names bound before the exception
+                    # still give a patch and the worker goes on
+                    ImportTracer.import_error(ex, errors)
+                finally:
+                    hook.uninstall()
+            with timer.phase('to_patch'):
+                return hook.to_patch(file_spec)
+
+        if tracer is None:
+            tracer = ImportTracer.ModuleTracer(file_spec)
 
         # trace the import of the module
         info("__import__({name})".format(name=module_spec))
-        sys.settrace(tracer.trace_imports)
-        try:
-            __import__(module_spec)
-        except ImportError as ex:
-            error("Error tracing import.  " + str(ex))
-        sys.settrace(None)
-        q.put(tracer.to_patch(file_spec))
+        with timer.phase('traced import'):
+            previous_trace = sys.gettrace()
+            sys.settrace(tracer.trace_imports)
+            try:
+                __import__(module_spec)
+            except KeyboardInterrupt:
+                raise
+            except BaseException as ex:
+                # whatever the module raises, SystemExit included, the names bound before the exception still
+                # give a patch and the worker goes on
+                ImportTracer.import_error(ex, errors)
+            finally:
+                # a pool worker or zygote child must not stay traced, and a debugger or coverage tracer is kept
+                sys.settrace(previous_trace)
+        with timer.phase('to_patch'):
+            return tracer.to_patch(file_spec)
+
+    @staticmethod
+    def import_error(ex, errors=None):
+        """
+        Log the exception importing the traced module raised.
+
+        :param ex: the exception
+        :type ex: BaseException
+        :param errors: optional list the error message is appended to
+        :type errors: list(str)|None
+        """
+        message = "{name}: {err}".format(name=type(ex).__name__, err=str(ex))
+        error("Error tracing import.  {message}".format(message=message))
+        if errors is not None:
+            errors.append(message)
+
+    class ImportHook(object):
+        """
+        Wraps builtins.__import__ to record the names bound by each wildcard import made by the module in
+        file_spec.  Nothing is line traced so the rest of the import chain runs at full speed.
+        """
+
+        def __init__(self, file_spec):
+            self.file_spec = file_spec
+            self.replacements = {}
+            self.original_import = None
+
+        def install(self):
+            """start intercepting imports"""
+            self.original_import = builtins.__import__
+            builtins.__import__ = self.hook_import
+
+        def uninstall(self):
+            """stop intercepting imports"""
+            if self.original_import is not None:
+                builtins.__import__ = self.original_import
+                self.original_import = None
+
+        # noinspection PyShadowingBuiltins
+        def hook_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+            module = self.original_import(name, globals, locals, fromlist, level)
+            if fromlist and tuple(fromlist) == ('*',) and globals is not None and \
+                    globals.get('__file__') == self.file_spec:
+                # the caller's frame is executing the "from name import *" line
+                # noinspection PyProtectedMember
+                line_number = sys._getframe(1).f_lineno
+                names = getattr(module, '__all__', None)
+                if names is None:
+                    names = [key for key in vars(module) if not key.startswith('_')]
+                self.replacements[line_number] = ('.' * level + name, list(names))
+            return module
+
+        def to_patch(self, file_spec):
+            return wildcard_patch(file_spec, self.replacements)
 
     class ModuleTracer(object):
+        """
+        Records the names bound by each "from BLAH import *" line executed in file_spec.
+
+        Nothing is copied for ordinary lines.  When a wildcard import line is about to run, the frame's
+        namespace is snapshotted as name -> id(value), and on the frame's next event the names that are new
+        or now refer to a different object are recorded.  self.diffs therefore holds one entry per wildcard
+        import instead of one per executed line.
+
+        trace_imports is the global trace function, it only sees the call events of new frames.  Frames
+        running code from other files get no local trace function so their lines are never traced, and
+        the lines of file_spec's frames are checked against the wildcard import line numbers found by
+        reading the source once.
+        """
+
+        WILDCARD_REGEX = re.compile(r'^\s*from\s+(\S+)\s+import\s+[*]')
 
         def __init__(self, file_spec):
             self.file_spec = file_spec
             self.diffs = []
-            self.last_locals = {}
-            self.last_globals = {}
+            # (frame, line_number, module, snapshot) while a wildcard import line runs
+            self.pending = None
+            # line number -> module for each wildcard import in file_spec, read on first use
+            self._wildcard_lines = None
+
+        @property
+        def wildcard_lines(self):
+            """
+            :return: the module imported by each "from module import *" line in file_spec
+            :rtype: dict(int,str)
+            """
+            if self._wildcard_lines is None:
+                self._wildcard_lines = {}
+                for line_number, line in enumerate(linecache.getlines(self.file_spec), 1):
+                    match = ImportTracer.ModuleTracer.WILDCARD_REGEX.search(line)
+                    if match:
+                        self._wildcard_lines[line_number] = match.group(1)
+            return self._wildcard_lines
 
         # noinspection PyUnusedLocal
         def trace_imports(self, frame, event, arg):
-            frame_info = inspect.getframeinfo(frame)
-            if frame_info[0] == self.file_spec:
-                f_globals = dict(frame.f_globals)
-                f_globals.pop('__builtins__', None)
-
-                f_locals = dict(frame.f_locals)
-                f_locals.pop('__builtins__', None)
-
-                diff = {
-                    'added_globals': DictDiffer(f_globals, self.last_globals).added(),
-                    'added_locals': DictDiffer(f_locals, self.last_locals).added(),
-                    'line_number': frame_info[1],
-                    'filename': frame_info[0],
-                    'source_line': frame_info[3],
-                }
-                self.diffs.append(diff)
-
-                if not self.last_locals:
-                    self.last_locals = f_locals
-                if not self.last_globals:
-                    self.last_globals = f_globals
-
-            return self.trace_imports
+            """
+            Global trace function, only line trace the frames running file_spec.
+
+            :return: the local trace function for the frame or None to not trace it
+            """
+            if frame.f_code.co_filename == self.file_spec:
+                return self.trace_lines
+            return None
+
+        # noinspection PyUnusedLocal
+        def trace_lines(self, frame, event, arg):
+            """local trace function for the frames running file_spec"""
+            if self.pending is not None and frame is self.pending[0] and event in ('line', 'return'):
+                self.record_pending()
+
+            if event == 'line':
+                module = self.wildcard_lines.get(frame.f_lineno)
+                if module is not None:
+                    self.pending = (frame, frame.f_lineno, module, self.snapshot(frame))
+
+            return self.trace_lines
+
+        # noinspection PyMethodMayBeStatic
+        def snapshot(self, frame):
+            """
+            :return: the identity of each value in the frame's namespace
+            :rtype: dict(str,int)
+            """
+            return dict((name, id(value)) for name, value in frame.f_locals.items())
+
+        def record_pending(self):
+            """record the names bound since the pending wildcard import's snapshot"""
+            frame, line_number, module, before = self.pending
+            self.pending = None
+            added = set(name for name, value in frame.f_locals.items()
+                        if name != '__builtins__' and before.get(name) != id(value))
+            self.diffs.append({
+                'line_number': line_number,
+                'module': module,
+                'added': added,
+            })
 
         def to_patch(self, file_spec):
             # post-process the trace
+            if self.pending is not None:
+                # the wildcard import was the last thing the module did
+                self.record_pending()
+            replacements = dict((diff['line_number'], (diff['module'], diff['added'])) for diff in self.diffs)
+            return wildcard_patch(file_spec, replacements)
 
-            # get the source file and make a copy
-            with open(file_spec) as source_file:
-                original_source = source_file.readlines()
-            new_source = original_source[:]
 
-            # process all of the trace diffs.  We want only diffs:
-            #
-            # * for the current file
-            # * whose source line is "from BLAH import *"
-            # * and adds symbols to our locals and/or globals
+class TracerPool(object):
+    """
+    A pool of long lived worker processes that trace module imports.  Each worker boots and imports its
+    dependencies once, then traces one module after another.  Between modules the worker restores sys.modules
+    and sys.path to the snapshot taken when it started so every module is imported fresh.
 
-            for index, diff in enumerate(self.diffs):
-                try:
-                    if diff['filename'] == file_spec:
-                        code_context = ''.join(diff['source_line']).strip()
-                        match = re.search(r'^\s*from\s+(\S+)\s+import\s+[*]', code_context)
-                        if match:
-                            # get the added symbols from the union of the locals and globals in the next tracer diff
-                            added_symbols = self.diffs[index + 1]['added_locals'] | \
-                                            self.diffs[index + 1]['added_globals']
-                            if added_symbols:
-                                new_lines = []
-                                for symbol in added_symbols:
-                                    new_lines.append("from {src} import {symbol}\n".format(src=match.group(1),
-                                                                                           symbol=symbol))
-                                # replace wildcard import with list of explicit imports
-                                new_source[diff['line_number'] - 1] = new_lines[:]
-                except IndexError:
-                    pass
-
-            patch = ''.join(difflib.unified_diff(original_source,
-                                                 list(flatten(new_source)),
-                                                 fromfile=file_spec,
-                                                 tofile=file_spec))
-            return patch
+    Usage::
+
+        with TracerPool(processes=4) as pool:
+            for patch in pool.trace_modules([(module_spec, file_spec), ...]):
+                print(patch)
+    """
+
+    def __init__(self, processes=None, timer=None):
+        """
+        :param processes: the number of worker processes, defaults to the number of CPUs
+        :type processes: int|None
+        :param timer: the timer the workers' phases are added to, a new one when None
+        :type timer: PhaseTimer|None
+        """
+        self.timer = timer or PhaseTimer()
+        # module name -> the exception importing it raised, for the traced modules whose patch is partial
+        self.errors = {}
+        with self.timer.phase('tracer startup'):
+            # spawn so the workers do not inherit the modules already imported by this process
+            context = multiprocessing.get_context('spawn')
+            self.pool = context.Pool(processes=processes, initializer=TracerPool.init_worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def trace(self, module_spec, file_spec, backend=SETTRACE_BACKEND, timer=None):
+        """
+        :param module_spec: module path
+        :type module_spec: str
+        :param file_spec: the path to the module file
+        :type file_spec: str
+        :param backend: one of TRACER_BACKENDS
+        :type backend: str
+        :param timer: also add the worker's phases to this timer
+        :type timer: PhaseTimer|None
+        :return: the patch that replaces the module's wildcard imports
+        :rtype: str
+        """
+        patch, timings, import_error = self.pool.apply(TracerPool.trace_job, ((module_spec, file_spec, backend),))
+        self.record_error(module_spec, import_error)
+        self.timer.merge(timings)
+        if timer is not None and timer is not self.timer:
+            timer.merge(timings)
+        return patch
+
+    def trace_modules(self, modules, backend=SETTRACE_BACKEND):
+        """
+        Trace the modules across the workers.
+
+        :param modules: (module_spec, file_spec) for each module to trace
+        :type modules: iterable(tuple(str,str))
+        :param backend: one of TRACER_BACKENDS
+        :type backend: str
+        :return: generator of patches in the same order as modules
+        :rtype: iterable(str)
+        """
+        modules = list(modules)
+        jobs = self.pool.imap(TracerPool.trace_job, ((module_spec, file_spec, backend)
+                                                     for module_spec, file_spec in modules))
+        for (module_spec, file_spec), (patch, timings, import_error) in zip(modules, jobs):
+            self.record_error(module_spec, import_error)
+            self.timer.merge(timings)
+            yield patch
+
+    def record_error(self, module_spec, import_error):
+        """
+        :param module_spec: the traced module
+        :type module_spec: str
+        :param import_error: the exception importing the module raised, or None
+        :type import_error: str|None
+        """
+        if import_error is None:
+            self.errors.pop(module_spec, None)
+        else:
+            self.errors[module_spec] = import_error
+
+    def close(self):
+        """wait for pending jobs then stop the workers"""
+        self.pool.close()
+        self.pool.join()
+
+    # baseline snapshot of sys.modules and sys.path in a worker process
+    _baseline_modules = None
+    _baseline_path = None
+
+    @staticmethod
+    def init_worker():
+        """runs once in each worker process to take the baseline snapshot"""
+        TracerPool._baseline_modules = dict(sys.modules)
+        TracerPool._baseline_path = list(sys.path)
+
+    @staticmethod
+    def trace_job(module):
+        """
+        Runs in a worker process to trace one module then reset the worker.
+
+        :param module: (module_spec, file_spec, backend)
+        :type module: tuple(str,str,str)
+        :return: the patch, the worker's PhaseTimer timings, and the import's error or None
+        :rtype: tuple(str,dict,str|None)
+        """
+        module_spec, file_spec, backend = module
+        timer = PhaseTimer()
+        errors = []
+        # the module may be one the worker already imported, so remove it to have it executed under the tracer
+        sys.modules.pop(module_spec, None)
+        try:
+            patch = ImportTracer.trace(module_spec, file_spec, backend=backend, timer=timer, errors=errors)
+        finally:
+            with timer.phase('worker reset'):
+                TracerPool.reset_worker()
+        return patch, timer.timings, errors[0] if errors else None
+
+    @staticmethod
+    def reset_worker():
+        """restore sys.modules and sys.path to the baseline snapshot"""
+        for name in list(sys.modules):
+            if name not in TracerPool._baseline_modules:
+                del sys.modules[name]
+        sys.modules.update(TracerPool._baseline_modules)
+        sys.path[:] = TracerPool._baseline_path
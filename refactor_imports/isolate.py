@@ -2,25 +2,214 @@
 
 """
 Facilitate running a code block in s separate process
+
+The Isolate starts a zygote process that imports a set of shared, heavy dependencies once and then waits
+for work.  Each call to fork() has the zygote os.fork() a copy-on-write child that runs the function and
+sends back the result, so every call starts from the same clean, already initialized interpreter in a few
+milliseconds instead of booting and importing the dependencies again.  submit() and result() split fork() so
+several children can run at once.
+
+The zygote is started with the spawn method so it does not inherit the modules already imported by this
+process.  os.fork() is required, so the Isolate is not available on Windows (see ZYGOTE_SUPPORTED).
 """
 
+import multiprocessing
+import os
+import pickle
+import select
+import sys
+import traceback
+
+from fullmonty.simple_logger import debug
+
+__docformat__ = 'restructuredtext en'
 __author__ = 'roy'
 
+ZYGOTE_SUPPORTED = hasattr(os, 'fork')
+
+
+class IsolateError(RuntimeError):
+    """The function failed, or its process died, in the forked child."""
+    pass
+
 
 class Isolate(object):
     """
-    with Isolate().fork as proc:
-        dosomething()
+    Usage::
+
+        with Isolate(preload=['fullmonty.simple_logger']) as isolate:
+            result = isolate.fork(dosomething, arg)
+            # run in two children at the same time
+            requests = [isolate.submit(dosomething, arg) for arg in (1, 2)]
+            results = [isolate.result(request) for request in requests]
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, preload=()):
+        """
+        :param preload: the modules the zygote imports before forking any children
+        :type preload: iterable(str)
+        """
+        self.preload = list(preload)
+        self.process = None
+        self.connection = None
+        # the id of the next submit() request
+        self._next_request = 0
+        # request id -> the pickled result received while waiting for another request's result
+        self._results = {}
 
     def __enter__(self):
+        self.start()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        pass
+        self.close()
+
+    def start(self):
+        """start the zygote and wait for it to import the preload modules"""
+        if not ZYGOTE_SUPPORTED:
+            raise OSError("Isolate requires os.fork()")
+        context = multiprocessing.get_context('spawn')
+        self.connection, zygote_connection = context.Pipe()
+        self.process = context.Process(target=Isolate.zygote, args=(zygote_connection, self.preload))
+        self.process.daemon = True
+        self.process.start()
+        zygote_connection.close()
+        self.connection.recv()
+
+    def close(self):
+        """stop the zygote"""
+        if self.process is not None:
+            try:
+                self.connection.send(None)
+                # the zygote waits for the running children, drain their results until it exits
+                while True:
+                    self.connection.recv()
+            except (EOFError, IOError, OSError):
+                pass
+            self.process.join()
+            self.connection.close()
+            self.process = None
+            self.connection = None
+            self._results = {}
+
+    def fork(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) in a forked child of the zygote.  The function, arguments, and result must
+        be picklable, the function by reference so a module level function or static method.
+
+        :return: the function's result
+        :raises IsolateError: the function raised an exception or the child process died
+        """
+        return self.result(self.submit(func, *args, **kwargs))
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Start running func(*args, **kwargs) in a forked child of the zygote without waiting for it to finish.
+
+        :return: the request, passed to result() to get the function's result
+        :rtype: int
+        """
+        if self.process is None:
+            self.start()
+        request = self._next_request
+        self._next_request += 1
+        self.connection.send((request, (func, args, kwargs)))
+        return request
+
+    def result(self, request):
+        """
+        Wait for a submit() request to finish.
+
+        :param request: the value returned by submit()
+        :type request: int
+        :return: the function's result
+        :raises IsolateError: the function raised an exception or the child process died
+        """
+        while request not in self._results:
+            finished, data = self.connection.recv()
+            self._results[finished] = data
+        data = self._results.pop(request)
+        if not data:
+            raise IsolateError("the forked process exited without a result")
+        status, value = pickle.loads(data)
+        if status != 'ok':
+            raise IsolateError(value)
+        return value
+
+    @staticmethod
+    def zygote(connection, preload):
+        """
+        The zygote process, import the preload modules then fork a child for each request until told to stop.
+        The children run concurrently, each result is sent back with its request id as soon as it is read.
+
+        :param connection: the pipe to the Isolate
+        :type connection: multiprocessing.connection.Connection
+        :param preload: the modules to import
+        :type preload: list(str)
+        """
+        for name in preload:
+            try:
+                __import__(name)
+            except ImportError as ex:
+                debug("Unable to preload {name}: {err}".format(name=name, err=str(ex)))
+        connection.send('ready')
+
+        # the read end of each running child's result pipe -> (request id, pid, the data read so far)
+        children = {}
+        serving = True
+        while serving or children:
+            readable, writable, failed = select.select(([connection] if serving else []) + list(children), [], [])
+            for ready in readable:
+                if ready is connection:
+                    try:
+                        request = connection.recv()
+                    except EOFError:
+                        request = None
+                    if request is None:
+                        serving = False
+                        continue
+                    request_id, call = request
+                    read_fd, write_fd = os.pipe()
+                    pid = os.fork()
+                    if pid == 0:
+                        os.close(read_fd)
+                        Isolate.child(call, write_fd)
+                    # closed now so the children forked later do not hold this child's pipe open
+                    os.close(write_fd)
+                    children[read_fd] = (request_id, pid, [])
+                else:
+                    data = os.read(ready, 65536)
+                    if data:
+                        children[ready][2].append(data)
+                        continue
+                    request_id, pid, parts = children.pop(ready)
+                    os.close(ready)
+                    os.waitpid(pid, 0)
+                    try:
+                        connection.send((request_id, b''.join(parts)))
+                    except (IOError, OSError):
+                        # the Isolate is gone
+                        serving = False
 
-    def fork(self):
-        pass
+    @staticmethod
+    def child(request, write_fd):
+        """
+        The forked child, run the function, write the pickled result to write_fd, and exit without returning
+        to the zygote's loop.
+        """
+        try:
+            func, args, kwargs = request
+            result = ('ok', func(*args, **kwargs))
+        except BaseException:
+            result = ('error', traceback.format_exc())
+        try:
+            data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            data = pickle.dumps(('error', traceback.format_exc()), pickle.HIGHEST_PROTOCOL)
+        try:
+            with os.fdopen(write_fd, 'wb') as result_file:
+                result_file.write(data)
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(0)
@@ -0,0 +1,59 @@
+# coding=utf-8
+
+"""
+Resident set size (RSS) of the current process, used to keep the analysis of very large trees under a memory
+ceiling and to report the peak memory use of a run.
+"""
+
+import os
+import sys
+
+try:
+    import resource
+except ImportError:
+    # windows
+    resource = None
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+STATM = '/proc/self/statm'
+
+
+def peak_rss():
+    """
+    :return: the peak resident set size of this process in bytes, or None if it is not available
+    :rtype: int|None
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    if sys.platform == 'darwin':
+        return max_rss
+    return max_rss * 1024
+
+
+def current_rss():
+    """
+    :return: the current resident set size of this process in bytes.  Falls back to the peak where the
+             current size is not available.
+    :rtype: int|None
+    """
+    try:
+        with open(STATM) as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        return peak_rss()
+
+
+def megabytes(size):
+    """
+    :param size: a size in bytes or None
+    :type size: int|None
+    :return: the size formatted in megabytes
+    :rtype: str
+    """
+    if size is None:
+        return 'unknown'
+    return "{size:.1f} MB".format(size=size / (1024.0 * 1024.0))
@@ -0,0 +1,206 @@
+# coding=utf-8
+
+"""
+Persistent on-disk cache of per-module analysis results.
+
+Each analyzed file gets one JSON entry in the cache directory holding the ModuleInfo summary (names, calls,
+and imports) along with the file's mtime, size, and content hash.  An entry is used when the file's mtime and
+size still match or, failing that, when the content hash still matches (for example after a fresh checkout).
+Unchanged files therefore never get parsed again.
+
+The total size of the cache directory is capped.  Entry files are touched whenever they are used so the
+least recently used entries are the ones evicted when the cap is exceeded.  Eviction frees some room below the
+cap so the directory is not listed again on every following put.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from fullmonty.simple_logger import debug
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'refactor_imports')
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+
+class ModuleCache(object):
+    """
+    Usage::
+
+        cache = ModuleCache(DEFAULT_CACHE_DIR)
+        module_info = ModuleInfo("refactor_imports.module_info", "module_info.py", cache=cache)
+        print(cache.hits, cache.misses)
+    """
+
+    # bump when the summary format changes so stale entries are ignored
+    VERSION = 6
+
+    ENTRY_SUFFIX = '.json'
+
+    # the fraction of max_bytes the cache is evicted down to once it exceeds max_bytes
+    LOW_WATER = 0.9
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_SIZE):
+        """
+        :param cache_dir: the directory to keep the cache entries in.  Created if necessary.
+        :type cache_dir: str
+        :param max_bytes: the maximum total size of the cache entries
+        :type max_bytes: int
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes = None
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get(self, file_spec):
+        """
+        :param file_spec: the path to the module file
+        :type file_spec: str
+        :return: the cached summary if the file is unchanged since it was cached, else None
+        :rtype: dict|None
+        """
+        entry_path = self._entry_path(file_spec)
+        try:
+            stat = os.stat(file_spec)
+            with open(entry_path) as entry_file:
+                entry = json.load(entry_file)
+        except (IOError, OSError, ValueError):
+            self.misses += 1
+            return None
+
+        if entry.get('version') != ModuleCache.VERSION or entry.get('file_spec') != file_spec \
+                or entry.get('size') != stat.st_size:
+            self.misses += 1
+            return None
+
+        if entry.get('mtime') != stat.st_mtime:
+            # touched but maybe not changed, fall back to comparing the contents
+            if entry.get('hash') != self._hash(file_spec):
+                self.misses += 1
+                return None
+            entry['mtime'] = stat.st_mtime
+            self._write(entry_path, entry)
+        else:
+            self._touch(entry_path)
+
+        self.hits += 1
+        return entry['summary']
+
+    def put(self, file_spec, summary):
+        """
+        Save the summary for the file then evict the least recently used entries if the cache is too big.
+
+        :param file_spec: the path to the module file
+        :type file_spec: str
+        :param summary: the ModuleInfo summary
+        :type summary: dict
+        """
+        try:
+            stat = os.stat(file_spec)
+            entry = {
+                'version': ModuleCache.VERSION,
+                'file_spec': file_spec,
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                # the hash of the parsed bytes, the file may have changed since
+                'hash': summary.get('source_hash') or self._hash(file_spec),
+                'summary': summary,
+            }
+            self._write(self._entry_path(file_spec), entry)
+        except (IOError, OSError) as ex:
+            debug("Unable to cache {file}: {err}".format(file=file_spec, err=str(ex)))
+            return
+        self._evict()
+
+    def clear(self):
+        """Remove all of the entries from the cache"""
+        for entry_path, size, mtime in self._entries():
+            os.remove(entry_path)
+        self._total_bytes = 0
+
+    @property
+    def total_bytes(self):
+        """
+        :return: the total size of the entries in the cache
+        :rtype: int
+        """
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for entry_path, size, mtime in self._entries())
+        return self._total_bytes
+
+    def _entry_path(self, file_spec):
+        key = hashlib.sha1(os.path.abspath(file_spec).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key + ModuleCache.ENTRY_SUFFIX)
+
+    def _entries(self):
+        """
+        :return: (path, size, mtime) for each entry in the cache directory
+        :rtype: list(tuple(str,int,float))
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(ModuleCache.ENTRY_SUFFIX):
+                entry_path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(entry_path)
+                    entries.append((entry_path, stat.st_size, stat.st_mtime))
+                except OSError:
+                    pass
+        return entries
+
+    def _write(self, entry_path, entry):
+        """write the entry to a temp file then rename it into place so readers never see a partial entry"""
+        old_size = 0
+        if os.path.exists(entry_path):
+            old_size = os.path.getsize(entry_path)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as tmp_file:
+                json.dump(entry, tmp_file)
+            os.rename(tmp_path, entry_path)
+        except (IOError, OSError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self._total_bytes is not None:
+            self._total_bytes += os.path.getsize(entry_path) - old_size
+
+    # noinspection PyMethodMayBeStatic
+    def _touch(self, entry_path):
+        """mark the entry as recently used"""
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+
+    def _evict(self):
+        """
+        Once the cache is over max_bytes, remove the least recently used entries until it is down to LOW_WATER
+        of max_bytes.  Listing the entries is only needed again after the freed room has been filled.
+        """
+        if self.total_bytes <= self.max_bytes:
+            return
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for entry_path, size, mtime in entries)
+        low_water = self.max_bytes * ModuleCache.LOW_WATER
+        for entry_path, size, mtime in entries:
+            if total <= low_water:
+                break
+            try:
+                os.remove(entry_path)
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
+
+    # noinspection PyMethodMayBeStatic
+    def _hash(self, file_spec):
+        with open(file_spec, 'rb') as source_file:
+            return hashlib.sha1(source_file.read()).hexdigest()
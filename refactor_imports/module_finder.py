@@ -0,0 +1,210 @@
+# coding=utf-8
+
+"""
+Find the python modules in a directory tree.
+
+The tree is scanned once, with os.scandir where available, into an index of (module_spec, file_spec) in a
+repeatable depth first order.  Each directory's modules form one contiguous run in the index so the modules
+in any scanned subtree are a slice of the index.
+
+Directories that can not hold importable modules are pruned as soon as they are seen instead of being walked
+and filtered afterwards:
+
+* directories matching the exclude globs,
+* directories matching the default excludes (version control and tool directories, virtualenvs, build output,
+  and __pycache__) unless they are packages, so a real subpackage named build or env is still analyzed,
+* virtualenvs, recognized by their pyvenv.cfg file,
+* directories inside a package that are not packages themselves (no __init__.py).
+
+The exclude globs and the optional include globs are each compiled into a single regular expression that is
+matched against both the name and the path relative to the top directory.
+"""
+
+import fnmatch
+import os
+import re
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+# tool, virtualenv, and build output directories, skipped unless they are packages
+DEFAULT_EXCLUDES = ('.*', '__pycache__', 'node_modules', 'build', 'dist', '*.egg-info', 'venv', 'env', 'site-packages')
+
+
+def compile_globs(patterns):
+    """
+    :param patterns: glob patterns, fnmatch style
+    :type patterns: iterable(str)
+    :return: a regular expression matching any of the patterns, or None if there are no patterns
+    :rtype: re.Pattern|None
+    """
+    patterns = list(patterns or [])
+    if not patterns:
+        return None
+    return re.compile('|'.join('(?:{regex})'.format(regex=fnmatch.translate(pattern)) for pattern in patterns))
+
+
+def list_dir(dir_name):
+    """
+    :param dir_name: the directory to list
+    :type dir_name: str
+    :return: the names of the files and of the sub-directories (not following symbolic links, same as os.walk)
+    :rtype: tuple(list(str),list(str))
+    """
+    file_names = []
+    dir_names = []
+    try:
+        if hasattr(os, 'scandir'):
+            for entry in os.scandir(dir_name):
+                if entry.is_dir(follow_symlinks=False):
+                    dir_names.append(entry.name)
+                elif entry.is_file():
+                    file_names.append(entry.name)
+        else:
+            for name in os.listdir(dir_name):
+                path = os.path.join(dir_name, name)
+                if os.path.isdir(path) and not os.path.islink(path):
+                    dir_names.append(name)
+                elif os.path.isfile(path):
+                    file_names.append(name)
+    except OSError:
+        pass
+    return file_names, dir_names
+
+
+class ModuleFinder(object):
+    """
+    Usage::
+
+        finder = ModuleFinder(top_dir, exclude=['*_pb2.py'])
+        for module_spec, file_spec in finder.module_files(os.path.join(top_dir, 'refactor_imports')):
+            print(module_spec)
+    """
+
+    def __init__(self, top_dir, include=None, exclude=None, default_excludes=DEFAULT_EXCLUDES):
+        """
+        :param top_dir: the directory module names are relative to
+        :type top_dir: str
+        :param include: when given, only modules whose file name or relative path match one of these globs
+        :type include: list(str)|None
+        :param exclude: skip the files and directories whose name or relative path match one of these globs
+        :type exclude: list(str)|None
+        :param default_excludes: globs excluded in addition to exclude
+        :type default_excludes: iterable(str)
+        """
+        self.top_dir = os.path.abspath(top_dir)
+        self._include = compile_globs(include)
+        self._exclude = compile_globs(exclude)
+        self._default_exclude = compile_globs(default_excludes)
+        # [(module_spec, file_spec)] for the whole tree, built on first use
+        self._index = None
+        # directory -> (start, end) of its subtree's modules in the index
+        self._ranges = None
+
+    @property
+    def index(self):
+        """
+        :return: (module_spec, file_spec) for every module in the tree
+        :rtype: list(tuple(str,str))
+        """
+        if self._index is None:
+            self._index, self._ranges = self._scan(self.top_dir)
+        return self._index
+
+    def module_files(self, start_dir=None):
+        """
+        :param start_dir: the directory (or stand-alone file) to search, defaults to the top directory
+        :type start_dir: str|None
+        :return: (module_spec, file_spec) for the modules in the subtree, in index order
+        :rtype: list(tuple(str,str))
+        """
+        index = self.index
+        if start_dir is None:
+            return index
+        start_dir = os.path.abspath(start_dir)
+        if start_dir in self._ranges:
+            start, end = self._ranges[start_dir]
+            return index[start:end]
+        if os.path.isdir(start_dir):
+            # pruned from the index, for example an excluded directory, so scan it on its own
+            return self._scan(start_dir)[0]
+        if os.path.isfile(start_dir):
+            # stand-alone file
+            return [('', start_dir)]
+        return []
+
+    def excluded(self, name, rel_path, is_package=False):
+        """
+        :param is_package: the name is a package directory, which only the exclude globs given to the finder
+                           exclude, not the default ones
+        :type is_package: bool
+        :return: True if the file or directory matches one of the exclude globs
+        :rtype: bool
+        """
+        if self._exclude is not None and \
+                (self._exclude.match(name) is not None or self._exclude.match(rel_path) is not None):
+            return True
+        return not is_package and self._default_exclude is not None and \
+            (self._default_exclude.match(name) is not None or self._default_exclude.match(rel_path) is not None)
+
+    def included(self, name, rel_path):
+        """
+        :return: True if there are no include globs or the file matches one of them
+        :rtype: bool
+        """
+        return self._include is None or \
+            self._include.match(name) is not None or self._include.match(rel_path) is not None
+
+    def _scan(self, root):
+        """
+        Depth first scan of the tree below root, directories in sorted order, each directory's modules
+        before its sub-directories'.
+
+        :param root: absolute path of the directory to scan
+        :type root: str
+        :return: the index and the directory ranges
+        :rtype: tuple(list(tuple(str,str)),dict(str,tuple(int,int)))
+        """
+        index = []
+        ranges = {}
+        # (directory, parent is a package) or (None, directory) once the directory's subtree is done
+        pending = [(root, False)]
+        while pending:
+            dir_name, parent_is_package = pending.pop()
+            if dir_name is None:
+                ranges[parent_is_package] = (ranges[parent_is_package][0], len(index))
+                continue
+
+            file_names, dir_names = list_dir(dir_name)
+            is_package = '__init__.py' in file_names
+            if dir_name != root and (('pyvenv.cfg' in file_names) or (parent_is_package and not is_package)):
+                continue
+
+            rel_dir = os.path.relpath(dir_name, self.top_dir)
+            if rel_dir == os.curdir:
+                rel_dir = ''
+            ranges[dir_name] = (len(index), None)
+
+            # python packages must have a __init__.py file
+            if is_package:
+                for file_name in sorted(file_names):
+                    if not file_name.endswith('.py'):
+                        continue
+                    rel_path = os.path.join(rel_dir, file_name)
+                    if self.excluded(file_name, rel_path) or not self.included(file_name, rel_path):
+                        continue
+                    module_spec = os.path.splitext(rel_path)[0].replace(os.sep, '.')
+                    index.append((module_spec, os.path.join(dir_name, file_name)))
+
+            pending.append((None, dir_name))
+            for sub_dir in sorted(dir_names, reverse=True):
+                sub_path = os.path.join(dir_name, sub_dir)
+                rel_path = os.path.join(rel_dir, sub_dir)
+                if self.excluded(sub_dir, rel_path):
+                    # the default excludes do not apply to packages, only look for the __init__.py of the
+                    # directories they would exclude
+                    sub_is_package = os.path.isfile(os.path.join(sub_path, '__init__.py'))
+                    if self.excluded(sub_dir, rel_path, is_package=sub_is_package):
+                        continue
+                pending.append((sub_path, is_package))
+        return index, ranges
@@ -6,17 +6,130 @@ is parsed for information about it's imports and exportable symbols, and call re
 """
 
 import ast
+import hashlib
 import os
 import re
-import imp
+import sys
+from copy import copy
 from pprint import pformat
 
-from refactor_imports.astpp import dump
+from fullmonty.simple_logger import debug
 
-from refactor_imports.exportable import Exportable
+from refactor_imports.astpp import dump, dump_to
+
+from refactor_imports.exportable import Exportable, intern
+from refactor_imports.phase_timer import NULL_TIMER
 
 __author__ = 'roy'
 
+# AsyncFunctionDef only exists in python 3.5+
+FUNCTION_DEFS = tuple(getattr(ast, name) for name in ('FunctionDef', 'AsyncFunctionDef') if hasattr(ast, name))
+
+# module level statements that may bind names the ModuleParser does not record
+BINDING_STATEMENTS = tuple(getattr(ast, name) for name in ('If', 'For', 'AsyncFor', 'While', 'With', 'AsyncWith',
+                                                           'Try', 'TryStar', 'TryExcept', 'TryFinally', 'Match',
+                                                           'AugAssign', 'AnnAssign', 'Delete', 'Exec')
+                           if hasattr(ast, name))
+
+
+def find_module_file(module_spec, search_path=None):
+    """
+    Find the source file for a module without importing it (so no code is executed).
+
+    :param module_spec: the absolute, dotted module name
+    :type module_spec: str
+    :param search_path: the directories to search, defaults to sys.path
+    :type search_path: list(str)|None
+    :return: the path to the module's .py file or the package's __init__.py, or None if not found
+    :rtype: str|None
+    """
+    parts = module_spec.split('.')
+    if search_path is None:
+        search_path = sys.path
+    for dir_name in search_path:
+        base = os.path.join(dir_name or os.curdir, *parts)
+        # packages take precedence over modules, same as the import system
+        for file_spec in (os.path.join(base, '__init__.py'), base + '.py'):
+            if os.path.isfile(file_spec):
+                return file_spec
+    return None
+
+
+def absolute_module_spec(module, importer_spec, importer_file_spec):
+    """
+    Convert a possibly relative module name, as written in an import statement, to the absolute module name.
+
+    :param module: the module name from the import statement, relative names start with dots
+    :type module: str
+    :param importer_spec: the module_spec of the module containing the import statement
+    :type importer_spec: str
+    :param importer_file_spec: the path to the module containing the import statement
+    :type importer_file_spec: str
+    :return: the absolute module name or None if it can not be determined
+    :rtype: str|None
+    """
+    name = module.lstrip('.')
+    level = len(module) - len(name)
+    if level == 0:
+        return module
+    if not importer_spec:
+        return None
+    package_parts = importer_spec.split('.')
+    if package_parts[-1] == '__init__':
+        package_parts.pop()
+    elif os.path.basename(importer_file_spec) != '__init__.py':
+        package_parts.pop()
+    if level > 1:
+        if level - 1 > len(package_parts):
+            return None
+        package_parts = package_parts[:len(package_parts) - (level - 1)]
+    if name:
+        package_parts.append(name)
+    return '.'.join(package_parts) or None
+
+
+def literal_strings(node):
+    """
+    :param node: AST expression node
+    :return: the strings if node is a literal list or tuple of strings else None
+    :rtype: list(str)|None
+    """
+    if not isinstance(node, (ast.List, ast.Tuple)):
+        return None
+    strings = []
+    for element in node.elts:
+        value = getattr(element, 'value', getattr(element, 's', None))
+        if not isinstance(value, str):
+            return None
+        strings.append(value)
+    return strings
+
+
+def binds_name(stmt, name):
+    """
+    :param stmt: AST statement
+    :param name: the variable name
+    :type name: str
+    :return: True if the statement, or a statement nested in it, assigns to or deletes the name
+    :rtype: bool
+    """
+    return any(isinstance(node, ast.Name) and node.id == name and not isinstance(node.ctx, ast.Load)
+               for node in ast.walk(stmt))
+
+
+def is_main_guard(stmt):
+    """
+    :param stmt: AST statement
+    :return: True if the statement is "if __name__ == '__main__':" which does not run when imported
+    :rtype: bool
+    """
+    if not isinstance(stmt, ast.If) or not isinstance(stmt.test, ast.Compare) or len(stmt.test.comparators) != 1:
+        return False
+    left = stmt.test.left
+    right = stmt.test.comparators[0]
+    return isinstance(left, ast.Name) and left.id == '__name__' and \
+        getattr(right, 'value', getattr(right, 's', None)) == '__main__'
+
 
 # noinspection PyPep8Naming
 class ModuleInfo(object):
@@ -29,38 +142,145 @@ class ModuleInfo(object):
     """
     TEST_NUMBER = 1
 
-    def __init__(self, module_spec, file_spec):
+    __slots__ = ('module_spec', 'file_spec', 'cache', 'registry', 'keep_tree', 'tree', 'calls', 'call_positions',
+                 'variable_names', 'class_names', 'function_names', 'import_names', 'import_modules', 'import_aliases',
+                 'imported_names', 'all_names', 'wildcard_imports', 'dynamic_names', 'source_hash')
+
+    # the ModuleInfo attributes saved in a summary (see ModuleCache)
+    SUMMARY_FIELDS = ('calls', 'call_positions', 'variable_names', 'class_names', 'function_names', 'import_names',
+                      'import_aliases', 'imported_names', 'all_names', 'wildcard_imports', 'dynamic_names',
+                      'source_hash')
+
+    def __init__(self, module_spec, file_spec, cache=None, summary=None, resolve=True, registry=None,
+                 keep_tree=True, timer=None):
         """
         :param module_spec: the module_spec which is the concatenation of the package and module name.
         :type module_spec: str
         :param file_spec: the path to the module file
         :type file_spec: str
+        :param cache: optional persistent cache of module summaries.  When the file is unchanged since it
+                      was cached, the summary is used instead of parsing the file.
+        :type cache: refactor_imports.module_cache.ModuleCache|None
+        :param summary: an already extracted summary() of the file, so the file is not parsed
+        :type summary: dict|None
+        :param resolve: find and analyze the imported modules
+        :type resolve: bool
+        :param registry: the registry of imported modules shared by all the ModuleInfo objects in a run.  When
+                         None, a registry is created for this module and its imports.
+        :type registry: ModuleRegistry|None
+        :param keep_tree: keep the parsed tree after the names are extracted.  When False the tree is discarded
+                          as soon as it has been parsed and dump_tree() parses the file again.
+        :type keep_tree: bool
+        :param timer: optional timer the parse and visit phases are added to
+        :type timer: refactor_imports.phase_timer.PhaseTimer|None
         """
-        self.module_spec = module_spec
-        self.file_spec = file_spec
-        self.tree = ast.parse(open(file_spec).read())
+        self.module_spec = intern(module_spec)
+        self.file_spec = intern(file_spec)
+        self.cache = cache
+        self.registry = registry
+        self.keep_tree = keep_tree
+        self.tree = None
         self.calls = []
+        # line, column of each call in calls, flattened to [line, column, line, column, ...]
+        self.call_positions = []
         self.variable_names = []
         self.class_names = []
         self.function_names = []
+        self.import_names = []
         self.import_modules = {}
-        self.calls_parser = ModuleInfo.CallsParser(self)
-        self.calls_parser.visit(self.tree)
-        self.exportable_parser = ModuleInfo.ExportableParser(self)
-        self.exportable_parser.visit(self.tree)
-        self.import_parser = ModuleInfo.ImportParser(self)
-        self.import_parser.visit(self.tree)
+        # name bound by an import -> what it was imported as, "from .a import b as c" gives c -> .a.b
+        self.import_aliases = {}
+        # module level names bound by import statements
+        self.imported_names = []
+        # the literal __all__ list or None
+        self.all_names = None
+        # [line_number, module] for each "from module import *", module includes any leading dots
+        self.wildcard_imports = []
+        # True when module level statements may bind names that are not recorded above
+        self.dynamic_names = False
+        # the sha1 of the bytes that were parsed, compared with the file before it is rewritten
+        self.source_hash = None
+
+        if summary is None and cache is not None:
+            summary = cache.get(file_spec)
+        if summary is None:
+            timer = timer or NULL_TIMER
+            with timer.phase('parse'):
+                with open(file_spec, 'rb') as source_file:
+                    source = source_file.read()
+                self.source_hash = hashlib.sha1(source).hexdigest()
+                tree = ast.parse(source)
+            with timer.phase('visit'):
+                ModuleInfo.ModuleParser(self).visit(tree)
+            if keep_tree:
+                self.tree = tree
+            if cache is not None:
+                cache.put(file_spec, self.summary())
+        else:
+            self.load_summary(summary)
+        if resolve:
+            self.resolve_imports()
 
     def __str__(self):
         return "module: {m} file: {f}\n{classes}".format(m=self.module_spec, f=self.file_spec,
                                                          classes=pformat(self.class_names))
 
-    def dump_tree(self):
+    def dump_tree(self, stream=None):
+        """
+        :param stream: write the dump to the stream as the tree is walked instead of returning it
+        :type stream: file|None
+        :return: the pretty printed tree, None when written to stream
+        :rtype: str|None
+        """
+        tree = self.tree
+        if tree is None:
+            # loaded from a summary so the file was never parsed, or the tree was discarded
+            tree = ast.parse(open(self.file_spec).read())
+            if self.keep_tree:
+                self.tree = tree
+        if stream is not None:
+            dump_to(tree, stream)
+            return None
+        return dump(tree)
+
+    def summary(self):
+        """
+        :return: the extracted names, calls, and imports as plain data suitable for caching
+        :rtype: dict(str,list(str))
+        """
+        return dict((field, copy(getattr(self, field))) for field in ModuleInfo.SUMMARY_FIELDS)
+
+    @staticmethod
+    def summarize(file_spec):
+        """
+        Parse the file and return its summary without resolving the imports.  Cheap to send between
+        processes as it is plain data instead of an AST.
+
+        :param file_spec: the path to the module file
+        :type file_spec: str
+        :return: the summary as returned by summary()
+        :rtype: dict(str,list(str))
+        """
+        return ModuleInfo(module_spec='', file_spec=file_spec, resolve=False, keep_tree=False).summary()
+
+    def load_summary(self, summary):
         """
-        :return:
-        :rtype:
+        Restore the extracted names, calls, and imports from a summary() instead of parsing the file.
+
+        :param summary: a dictionary as returned by summary()
+        :type summary: dict(str,list(str))
         """
-        return dump(self.tree)
+        for field in ModuleInfo.SUMMARY_FIELDS:
+            if field in summary:
+                setattr(self, field, copy(summary[field]))
+
+    def resolve_imports(self):
+        """
+        Find the file for each imported module and set import_modules to the ModuleInfo for each one found.
+        """
+        if self.registry is None:
+            ModuleRegistry(cache=self.cache).register(self)
+        self.registry.resolve_imports(self)
 
     @property
     def exportables(self):
@@ -120,58 +340,49 @@ class ModuleInfo(object):
         """
         return ["{module}.{name}".format(module=self.module_spec, name=name) for name in self.exportable_names]
 
-    # noinspection PyPep8Naming,PyMethodMayBeStatic,PyDocstring
-    class ImportParser(ast.NodeVisitor):
-        """sets parent.symbol_hash"""
+    # noinspection PyPep8Naming,PyDocstring
+    class ModuleParser(ast.NodeVisitor):
+        """
+        Single pass over the module's tree that sets parent.calls, parent.class_names, parent.function_names,
+        parent.variable_names, and parent.import_names.
 
-        def __init__(self, parent):
-            self.parent = parent
+        Only module level classes, functions, and variables are recorded as they are the only ones another
+        module may import.  Calls and imports are recorded from anywhere in the tree.
+        """
 
-        def continue_parsing(self, stmt):
-            """
-            Helper: parse a node's children
+        # node class -> visit_* method or None, shared by all instances
+        _dispatch = {}
 
-            :param stmt: AST statement
-            """
-            super(ModuleInfo.ImportParser, self).generic_visit(stmt)
+        def __init__(self, parent):
+            self.parent = parent
 
-        def visit_Import(self, stmt):
+        def visit(self, node):
             """
-            retrieve the name from the returned object
-            normally, there is just a single alias
+            Same as ast.NodeVisitor.visit but caches the visitor method lookup per node class instead of
+            building the method name on every node.
 
-            :param stmt: AST statement
+            :param node: AST node
             """
-            for alias in stmt.names:
-                if alias.name not in self.parent.import_modules:
-                    try:
-                        file_spec = imp.find_module(stmt.module)[1]
-                        print(file_spec)
-                        if os.path.isfile(file_spec):
-                            info = ModuleInfo(module_spec=alias.name, file_spec=file_spec)
-                            self.parent.import_modules[alias.name] = info
-                    except (ImportError, AttributeError):
-                        pass
-            self.continue_parsing(stmt)
-
-        def visit_ImportFrom(self, stmt):
-            if stmt.module not in self.parent.import_modules:
-                try:
-                    file_spec = imp.find_module(stmt.module)[1]
-                    print(file_spec)
-                    if os.path.isfile(file_spec):
-                        info = ModuleInfo(module_spec=stmt.module, file_spec=file_spec)
-                        self.parent.import_modules[stmt.module] = info
-                except ImportError:
-                    pass
-            self.continue_parsing(stmt)
-
-    # noinspection PyPep8Naming,PyDocstring
-    class CallsParser(ast.NodeVisitor):
-        """sets parent.calls"""
-
-        def __init__(self, parent):
-            self.parent = parent
+            node_class = node.__class__
+            try:
+                visitor = self._dispatch[node_class]
+            except KeyError:
+                visitor = getattr(type(self), 'visit_' + node_class.__name__, None)
+                self._dispatch[node_class] = visitor
+            if visitor is None:
+                self.generic_visit(node)
+            else:
+                visitor(self, node)
+
+        def generic_visit(self, node):
+            for field in node._fields:
+                value = getattr(node, field, None)
+                if isinstance(value, list):
+                    for item in value:
+                        if isinstance(item, ast.AST):
+                            self.visit(item)
+                elif isinstance(value, ast.AST):
+                    self.visit(value)
 
         def continue_parsing(self, stmt):
             """
@@ -179,66 +390,199 @@ class ModuleInfo(object):
 
             :param stmt: AST statement
             """
-            super(ModuleInfo.CallsParser, self).generic_visit(stmt)
+            self.generic_visit(stmt)
 
+        # noinspection PyMethodMayBeStatic
         def attr_to_name(self, node, suffix=''):
+            """
+            :param node: a Name or a chain of Attribute nodes
+            :type node: ast.AST
+            :param suffix: dotted name appended to the node's name
+            :type suffix: str
+            :return: the interned dotted name, "a.b.c" for a.b.c, without the parts below any other kind of node
+            :rtype: str
+            """
+            parts = [suffix] if suffix else []
+            while isinstance(node, ast.Attribute):
+                parts.append(node.attr)
+                node = node.value
             if isinstance(node, ast.Name):
-                if suffix:
-                    return node.id + '.' + suffix
-                return node.id
-            if isinstance(node, ast.Attribute):
-                new_suffix = node.attr
-                if suffix:
-                    new_suffix += '.' + suffix
-                return self.attr_to_name(node.value, new_suffix)
-            return suffix
+                parts.append(node.id)
+            parts.reverse()
+            return intern('.'.join(parts))
+
+        def visit_Module(self, stmt):
+            for module_stmt in stmt.body:
+                if isinstance(module_stmt, ast.Assign):
+                    for target in module_stmt.targets:
+                        if isinstance(target, ast.Name):
+                            self.parent.variable_names.append(target.id)
+                            if target.id == '__all__':
+                                self.parent.all_names = literal_strings(module_stmt.value)
+                        else:
+                            self.parent.dynamic_names = True
+                elif isinstance(module_stmt, ast.ClassDef):
+                    self.parent.class_names.append(str(module_stmt.name))
+                elif isinstance(module_stmt, FUNCTION_DEFS):
+                    self.parent.function_names.append(str(module_stmt.name))
+                elif isinstance(module_stmt, ast.Import):
+                    for alias in module_stmt.names:
+                        self.parent.imported_names.append(alias.asname or alias.name.split('.')[0])
+                elif isinstance(module_stmt, ast.ImportFrom):
+                    for alias in module_stmt.names:
+                        if alias.name == '*':
+                            module = '.' * (module_stmt.level or 0) + (module_stmt.module or '')
+                            self.parent.wildcard_imports.append([module_stmt.lineno, module])
+                        else:
+                            self.parent.imported_names.append(alias.asname or alias.name)
+                elif isinstance(module_stmt, BINDING_STATEMENTS) and not is_main_guard(module_stmt):
+                    self.parent.dynamic_names = True
+                    if binds_name(module_stmt, '__all__'):
+                        # changed after, or instead of, a literal assignment so only known at run time
+                        self.parent.all_names = None
+                self.visit(module_stmt)
 
         def visit_Call(self, stmt):
             name = None
             if isinstance(stmt.func, ast.Name):
-                name = stmt.func.id
+                name = intern(stmt.func.id)
             if isinstance(stmt.func, ast.Attribute):
                 name = self.attr_to_name(stmt.func)
             if name is not None and name:
                 self.parent.calls.append(name)
+                self.parent.call_positions.extend((stmt.lineno, stmt.col_offset))
             self.continue_parsing(stmt)
 
-        def visit_ClassDef(self, stmt):
-            self.parent.class_names.append(str(stmt.name))
+        def visit_Import(self, stmt):
+            """
+            retrieve the name from the returned object
+            normally, there is just a single alias
+
+            :param stmt: AST statement
+            """
+            for alias in stmt.names:
+                if alias.name not in self.parent.import_names:
+                    self.parent.import_names.append(alias.name)
+                if alias.asname:
+                    self.parent.import_aliases[alias.asname] = alias.name
             self.continue_parsing(stmt)
 
-    # noinspection PyPep8Naming,PyDocstring
-    class ExportableParser(ast.NodeVisitor):
-        """sets parent.class_names, parent.function_names, parent.variable_names"""
+        def visit_ImportFrom(self, stmt):
+            # relative imports keep their leading dots, the registry makes them absolute
+            module = '.' * (stmt.level or 0) + (stmt.module or '')
+            if module and module not in self.parent.import_names:
+                self.parent.import_names.append(module)
+            for alias in stmt.names:
+                if alias.name != '*':
+                    self.parent.import_aliases[alias.asname or alias.name] = \
+                        module + alias.name if module.endswith('.') else module + '.' + alias.name
+            self.continue_parsing(stmt)
 
-        def __init__(self, parent):
-            self.parent = parent
 
-        def continue_parsing(self, stmt):
-            """
-            Helper: parse a node's children
+class ModuleRegistry(object):
+    """
+    Resolves imported module names to ModuleInfo objects once per run.  Every ModuleInfo sharing the registry
+    gets the same ModuleInfo for a given module, so a dependency like os is only analyzed once and import
+    cycles end at the already registered module.
 
-            :param stmt: AST statement
-            """
-            super(ModuleInfo.ExportableParser, self).generic_visit(stmt)
+    Usage::
 
-        def visit_ClassDef(self, stmt):
-            # self.parent.class_names.append(str(stmt.name))
-            for class_stmt in stmt.body:
-                if isinstance(class_stmt, ast.Assign):
-                    for target in class_stmt.targets:
-                        if isinstance(target, ast.Name):
-                            self.parent.variable_names.append(stmt.name + '.' + target.id)
-            # self.continue_parsing(stmt)
+        registry = ModuleRegistry(search_path=[top_dir] + sys.path)
+        module_info = ModuleInfo("refactor_imports.module_info", "module_info.py", registry=registry)
+        print(registry.hits, registry.misses)
+    """
 
-        def visit_FunctionDef(self, stmt):
-            self.parent.function_names.append(str(stmt.name))
-            # self.continue_parsing(stmt)
+    def __init__(self, search_path=None, cache=None, keep_trees=True, timer=None):
+        """
+        :param search_path: the directories to find imported modules in, defaults to sys.path
+        :type search_path: list(str)|None
+        :param cache: optional persistent cache of module summaries
+        :type cache: refactor_imports.module_cache.ModuleCache|None
+        :param keep_trees: keep the parsed trees of the imported modules (see ModuleInfo keep_tree)
+        :type keep_trees: bool
+        :param timer: optional timer the imported modules' parse and visit phases are added to
+        :type timer: refactor_imports.phase_timer.PhaseTimer|None
+        """
+        self.search_path = search_path
+        self.cache = cache
+        self.keep_trees = keep_trees
+        self.timer = timer
+        # module_spec -> ModuleInfo, or None when the module has no python source
+        self.modules = {}
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, module_info):
+        """
+        Add an already analyzed module so imports of it resolve to module_info.
 
-        def visit_Module(self, stmt):
-            for module_stmt in stmt.body:
-                if isinstance(module_stmt, ast.Assign):
-                    for target in module_stmt.targets:
-                        if isinstance(target, ast.Name):
-                            self.parent.variable_names.append(target.id)
-            # self.continue_parsing(stmt)
+        :param module_info: the module
+        :type module_info: ModuleInfo
+        """
+        module_info.registry = self
+        module_spec = module_info.module_spec
+        if module_spec.endswith('.__init__'):
+            module_spec = module_spec[:-len('.__init__')]
+        if module_spec:
+            self.modules[module_spec] = module_info
+
+    def resolve(self, module_spec):
+        """
+        :param module_spec: the absolute module name
+        :type module_spec: str
+        :return: the module with its imports resolved, None if there is no python source for it
+        :rtype: ModuleInfo|None
+        """
+        module_info = self._lookup(module_spec)
+        if module_info is not None:
+            self.resolve_imports(module_info)
+        return module_info
+
+    def resolve_imports(self, module_info):
+        """
+        Set import_modules for module_info and, transitively, for every module it imports.  Works through a
+        list of modules instead of recursing so deep import chains do not hit the recursion limit.
+
+        :param module_info: the module
+        :type module_info: ModuleInfo
+        """
+        pending = [module_info]
+        resolved = set()
+        while pending:
+            current = pending.pop()
+            if id(current) in resolved:
+                continue
+            resolved.add(id(current))
+            for name in current.import_names:
+                if name in current.import_modules:
+                    continue
+                module_spec = absolute_module_spec(name, current.module_spec, current.file_spec)
+                if not module_spec:
+                    continue
+                imported = self._lookup(module_spec)
+                if imported is not None:
+                    current.import_modules[name] = imported
+                    pending.append(imported)
+
+    def _lookup(self, module_spec):
+        """
+        :return: the registered module, analyzing it first if this is the first time it is seen
+        :rtype: ModuleInfo|None
+        """
+        try:
+            module_info = self.modules[module_spec]
+            self.hits += 1
+            return module_info
+        except KeyError:
+            self.misses += 1
+
+        module_info = None
+        file_spec = find_module_file(module_spec, self.search_path)
+        if file_spec is not None:
+            try:
+                module_info = ModuleInfo(module_spec=module_spec, file_spec=file_spec, cache=self.cache,
+                                         resolve=False, registry=self, keep_tree=self.keep_trees, timer=self.timer)
+            except (SyntaxError, UnicodeDecodeError, IOError) as ex:
+                debug("Unable to analyze {file}: {err}".format(file=file_spec, err=str(ex)))
+        self.modules[module_spec] = module_info
+        return module_info
@@ -0,0 +1,225 @@
+# coding=utf-8
+
+"""
+Apply the unified diffs generated by --trace to the module files.
+
+The files are rewritten in a pool of worker processes.  Each file is written to a temporary file in the same
+directory which is then renamed over the original so a file is never left partially written.  A file is not
+touched when it changed on disk since it was analyzed, either because its content hash no longer matches the
+one taken at analysis time or because the patch's context lines no longer match the file.
+"""
+
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import timeit
+
+from fullmonty.simple_logger import debug
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+# the result of applying the patch to one file
+REWRITTEN = 'rewritten'
+UNCHANGED = 'unchanged'
+STALE = 'stale'
+FAILED = 'failed'
+
+HUNK_REGEX = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+# follows the patch line of a last line without a line ending
+NO_NEWLINE_MARKER = '\\ No newline at end of file\n'
+
+
+class StalePatchError(Exception):
+    """The file does not match the one the patch was generated from."""
+    pass
+
+
+def file_signature(file_spec):
+    """
+    :param file_spec: the path to the file
+    :type file_spec: str
+    :return: the hash of the file's contents, used to detect the file changing after it was analyzed
+    :rtype: str
+    """
+    with open(file_spec, 'rb') as source_file:
+        return hashlib.sha1(source_file.read()).hexdigest()
+
+
+def split_lines(text):
+    """
+    Split the text the same way as reading a file opened with newline='', which is how the patches are
+    generated: only at LF, CRLF, and CR, unlike str.splitlines() which also splits at form feeds and other
+    separators.
+
+    :param text: the file's contents
+    :type text: str
+    :return: the lines, each with its original line ending
+    :rtype: list(str)
+    """
+    return io.StringIO(text, newline='').readlines()
+
+
+def apply_patch(source_lines, patch):
+    """
+    Apply a unified diff, as generated by difflib.unified_diff, to the lines of one file.
+
+    :param source_lines: the lines of the file including the line endings
+    :type source_lines: list(str)
+    :param patch: the unified diff
+    :type patch: str
+    :return: the patched lines
+    :rtype: list(str)
+    :raises StalePatchError: if a context or removed line does not match the source
+    """
+    patch_lines = []
+    for line in split_lines(patch):
+        if line.startswith('\\'):
+            # the previous line is the file's last line and has no line ending
+            patch_lines[-1] = patch_lines[-1].rstrip('\r\n')
+        else:
+            patch_lines.append(line)
+
+    result = []
+    position = 0
+    in_hunk = False
+    for line in patch_lines:
+        match = HUNK_REGEX.match(line)
+        if match:
+            in_hunk = True
+            start = int(match.group(1))
+            # an empty old range starts after the given line instead of at it
+            if match.group(2) != '0':
+                start -= 1
+            if start < position or start > len(source_lines):
+                raise StalePatchError("hunk at line {line} is out of order or past the end".format(line=start + 1))
+            result.extend(source_lines[position:start])
+            position = start
+        elif not in_hunk:
+            # the ---/+++ file header
+            continue
+        elif line.startswith('+'):
+            result.append(line[1:])
+        elif line.startswith(' ') or line.startswith('-'):
+            if position >= len(source_lines) or source_lines[position] != line[1:]:
+                raise StalePatchError("line {line} does not match the patch".format(line=position + 1))
+            if line.startswith(' '):
+                result.append(source_lines[position])
+            position += 1
+    result.extend(source_lines[position:])
+    return result
+
+
+def write_atomic(file_spec, text):
+    """
+    Write the text to a temporary file next to file_spec, with file_spec's permissions, then rename it over
+    file_spec.
+
+    :param file_spec: the path to the file to replace
+    :type file_spec: str
+    :param text: the new content
+    :type text: str
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_spec)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(text.encode('utf-8'))
+        shutil.copymode(file_spec, tmp_path)
+        os.rename(tmp_path, file_spec)
+    except (IOError, OSError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class PatchApplier(object):
+    """
+    Usage::
+
+        signatures = dict((module.file_spec, file_signature(module.file_spec)) for module in modules)
+        applier = PatchApplier(jobs=4)
+        for file_spec, status, message in applier.apply((file_spec, patch, signatures[file_spec])
+                                                        for file_spec, patch in patches):
+            print(file_spec, status)
+        print(applier.summary())
+    """
+
+    def __init__(self, jobs=1):
+        """
+        :param jobs: the number of processes writing the files
+        :type jobs: int
+        """
+        self.jobs = jobs
+        # status -> number of files
+        self.counts = dict((status, 0) for status in (REWRITTEN, UNCHANGED, STALE, FAILED))
+        self.seconds = 0.0
+
+    def apply(self, patches):
+        """
+        Apply the patches, yielding each result as soon as its file is done (not necessarily in order).
+
+        :param patches: (file_spec, patch, signature) where signature is the file_signature() taken when the
+                        file was analyzed, or None to only check the patch context
+        :type patches: iterable(tuple(str,str,str|None))
+        :return: generator of (file_spec, status, message)
+        :rtype: iterable(tuple(str,str,str))
+        """
+        start = timeit.default_timer()
+        if self.jobs <= 1:
+            results = (PatchApplier.apply_job(job) for job in patches)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(processes=self.jobs)
+            results = pool.imap_unordered(PatchApplier.apply_job, patches)
+        try:
+            for file_spec, status, message in results:
+                self.counts[status] += 1
+                yield file_spec, status, message
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            self.seconds += timeit.default_timer() - start
+
+    def summary(self):
+        """
+        :return: the number of files rewritten, and per second, and the number skipped
+        :rtype: str
+        """
+        rewritten = self.counts[REWRITTEN]
+        rate = rewritten / self.seconds if self.seconds > 0 else 0.0
+        return "Rewrote {rewritten} files in {seconds:.2f}s ({rate:.1f} files/s), {stale} stale, {failed} failed, " \
+               "{unchanged} unchanged".format(rewritten=rewritten, seconds=self.seconds, rate=rate,
+                                              stale=self.counts[STALE], failed=self.counts[FAILED],
+                                              unchanged=self.counts[UNCHANGED])
+
+    @staticmethod
+    def apply_job(job):
+        """
+        Apply one patch, run in the worker processes.
+
+        :param job: (file_spec, patch, signature)
+        :type job: tuple(str,str,str|None)
+        :return: (file_spec, status, message)
+        :rtype: tuple(str,str,str)
+        """
+        file_spec, patch, signature = job
+        if not patch:
+            return file_spec, UNCHANGED, ''
+        try:
+            with open(file_spec, 'rb') as source_file:
+                content = source_file.read()
+            if signature is not None and hashlib.sha1(content).hexdigest() != signature:
+                return file_spec, STALE, 'changed since it was analyzed'
+            source_lines = split_lines(content.decode('utf-8'))
+            write_atomic(file_spec, ''.join(apply_patch(source_lines, patch)))
+        except StalePatchError as ex:
+            return file_spec, STALE, str(ex)
+        except (IOError, OSError, UnicodeDecodeError) as ex:
+            debug("Unable to rewrite {file}: {err}".format(file=file_spec, err=str(ex)))
+            return file_spec, FAILED, str(ex)
+        return file_spec, REWRITTEN, ''
@@ -0,0 +1,175 @@
+# coding=utf-8
+
+"""
+Persistent, content-addressed cache of the patches generated by tracing modules.
+
+Tracing a module imports it, and the names its wildcard imports bind depend only on the module and the modules
+those wildcard imports load.  The cache key is therefore the hash of the module's source combined with the
+hashes of the sources of its wildcard import targets, followed transitively through the targets' own wildcard
+imports, plus the module name, path, tracer backend, and python version.  Editing any of those files gives a new
+key, so a re-run only traces the modules whose inputs changed and stale entries simply age out of the cache.
+
+The entries live in a sub-directory of the module cache directory and are evicted the same way, least recently
+used first.
+"""
+
+import hashlib
+import json
+import os
+import sys
+
+from fullmonty.simple_logger import debug
+
+from refactor_imports.import_tracer import SETTRACE_BACKEND
+from refactor_imports.module_cache import DEFAULT_CACHE_SIZE, ModuleCache
+from refactor_imports.module_info import ModuleInfo, absolute_module_spec, find_module_file
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+PATCH_CACHE_DIR = 'patches'
+
+
+class PatchCache(ModuleCache):
+    """
+    Usage::
+
+        patch_cache = PatchCache(os.path.join(DEFAULT_CACHE_DIR, PATCH_CACHE_DIR), search_path=[top_dir] + sys.path)
+        key = patch_cache.key(module_info, backend)
+        patch = patch_cache.get(key)
+        if patch is None:
+            tracer = ImportTracer(module_info.module_spec, module_info.file_spec, backend=backend)
+            patch = tracer.execute()
+            if tracer.error is None:
+                patch_cache.put(key, patch)
+        print(patch_cache.hits, patch_cache.misses)
+    """
+
+    # bump when the patch format or the tracer's results change so old entries are ignored
+    VERSION = 2
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_SIZE, search_path=None, module_cache=None):
+        """
+        :param cache_dir: the directory to keep the patches in.  Created if necessary.
+        :type cache_dir: str
+        :param max_bytes: the maximum total size of the cached patches
+        :type max_bytes: int
+        :param search_path: the directories to find the wildcard import targets in, defaults to sys.path
+        :type search_path: list(str)|None
+        :param module_cache: optional cache of module summaries used to find the targets' wildcard imports
+        :type module_cache: ModuleCache|None
+        """
+        super(PatchCache, self).__init__(cache_dir=cache_dir, max_bytes=max_bytes)
+        self.search_path = search_path
+        self.module_cache = module_cache
+        # file path -> content hash, each file is read once per run
+        self._hashes = {}
+        # module name -> the file paths of its transitive wildcard import targets
+        self._targets = {}
+
+    def key(self, module_info, backend=SETTRACE_BACKEND):
+        """
+        :param module_info: the module that is going to be traced
+        :type module_info: ModuleInfo
+        :param backend: the tracer backend the module is traced with, one of TRACER_BACKENDS
+        :type backend: str
+        :return: the content address of the module's trace
+        :rtype: str
+        """
+        digest = hashlib.sha1()
+        for part in (str(PatchCache.VERSION), sys.version, backend, module_info.module_spec, module_info.file_spec,
+                     self._file_hash(module_info.file_spec)):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        targets = set()
+        for line_number, module in module_info.wildcard_imports:
+            module_spec = absolute_module_spec(module, module_info.module_spec, module_info.file_spec)
+            if module_spec:
+                targets.update(self._wildcard_targets(module_spec))
+            else:
+                targets.add(module)
+        for target in sorted(targets):
+            digest.update(target.encode('utf-8'))
+            digest.update(self._file_hash(target).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        :param key: the content address from key()
+        :type key: str
+        :return: the cached patch or None
+        :rtype: str|None
+        """
+        entry_path = self._key_path(key)
+        try:
+            with open(entry_path) as entry_file:
+                entry = json.load(entry_file)
+        except (IOError, OSError, ValueError):
+            self.misses += 1
+            return None
+        if entry.get('version') != PatchCache.VERSION:
+            self.misses += 1
+            return None
+        self._touch(entry_path)
+        self.hits += 1
+        return entry['patch']
+
+    def put(self, key, patch):
+        """
+        Save the patch then evict the least recently used entries if the cache is too big.
+
+        :param key: the content address from key()
+        :type key: str
+        :param patch: the traced patch
+        :type patch: str
+        """
+        try:
+            self._write(self._key_path(key), {'version': PatchCache.VERSION, 'patch': patch})
+        except (IOError, OSError) as ex:
+            debug("Unable to cache the patch {key}: {err}".format(key=key, err=str(ex)))
+            return
+        self._evict()
+
+    def _key_path(self, key):
+        return os.path.join(self.cache_dir, key + ModuleCache.ENTRY_SUFFIX)
+
+    def _file_hash(self, file_spec):
+        """
+        :return: the hash of the file's contents, or an empty string for a module without a source file
+        :rtype: str
+        """
+        if file_spec not in self._hashes:
+            try:
+                self._hashes[file_spec] = self._hash(file_spec)
+            except (IOError, OSError):
+                self._hashes[file_spec] = ''
+        return self._hashes[file_spec]
+
+    def _wildcard_targets(self, module_spec):
+        """
+        :param module_spec: the absolute name of a wildcard imported module
+        :type module_spec: str
+        :return: the file of the module and of the modules it wildcard imports, transitively.  A module without
+                 a source file (builtin or extension) is represented by its name.
+        :rtype: set(str)
+        """
+        if module_spec in self._targets:
+            return self._targets[module_spec]
+        # guard against wildcard import cycles while this module's targets are being found
+        self._targets[module_spec] = targets = set()
+        file_spec = find_module_file(module_spec, self.search_path)
+        if file_spec is None:
+            targets.add(module_spec)
+            return targets
+        targets.add(file_spec)
+        try:
+            info = ModuleInfo(module_spec=module_spec, file_spec=file_spec, cache=self.module_cache, resolve=False,
+                              keep_tree=False)
+        except (SyntaxError, IOError, UnicodeDecodeError):
+            return targets
+        for line_number, module in info.wildcard_imports:
+            target_spec = absolute_module_spec(module, module_spec, file_spec)
+            if target_spec:
+                targets.update(self._wildcard_targets(target_spec))
+        return targets
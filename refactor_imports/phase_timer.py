@@ -0,0 +1,170 @@
+# coding=utf-8
+
+"""
+Wall clock and CPU time accounting for the phases of a run (discovery, parsing, tracing, output...).
+
+The timings are plain data, phase name -> [wall seconds, cpu seconds, count], so they can be returned from
+worker processes and merged into the parent's timer.
+"""
+
+import cProfile
+import time
+import timeit
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+try:
+    process_time = time.process_time
+except AttributeError:
+    # python 2
+    process_time = time.clock
+
+
+class PhaseTimer(object):
+    """
+    Usage::
+
+        timer = PhaseTimer()
+        with timer.phase('parse'):
+            tree = ast.parse(source)
+        for line in timer.report():
+            print(line)
+    """
+
+    def __init__(self):
+        # phase name -> [wall seconds, cpu seconds, count]
+        self.timings = {}
+        # the phases in the order they were first seen
+        self.order = []
+
+    def phase(self, name):
+        """
+        :param name: the phase name
+        :type name: str
+        :return: context manager adding the time spent in the with block to the phase
+        :rtype: PhaseTimer.Phase
+        """
+        return PhaseTimer.Phase(self, name)
+
+    def add(self, name, wall, cpu, count=1):
+        """
+        :param name: the phase name
+        :type name: str
+        :param wall: wall clock seconds
+        :type wall: float
+        :param cpu: cpu seconds of this process
+        :type cpu: float
+        :param count: the number of times the phase ran
+        :type count: int
+        """
+        if name not in self.timings:
+            self.timings[name] = [0.0, 0.0, 0]
+            self.order.append(name)
+        timing = self.timings[name]
+        timing[0] += wall
+        timing[1] += cpu
+        timing[2] += count
+
+    def merge(self, timings):
+        """
+        Add the timings from another timer, for example one that ran in a worker process.
+
+        :param timings: another PhaseTimer's timings
+        :type timings: dict(str,list)
+        """
+        for name in sorted(timings):
+            wall, cpu, count = timings[name]
+            self.add(name, wall, cpu, count)
+
+    def report(self):
+        """
+        :return: one line per phase with the wall and cpu time, in the order the phases were first seen
+        :rtype: list(str)
+        """
+        lines = ["{phase:<24} {wall:>10} {cpu:>10} {count:>8}".format(phase='phase', wall='wall (s)',
+                                                                    cpu='cpu (s)', count='count')]
+        for name in self.order:
+            wall, cpu, count = self.timings[name]
+            lines.append("{phase:<24} {wall:>10.3f} {cpu:>10.3f} {count:>8}".format(phase=name, wall=wall, cpu=cpu,
+                                                                                  count=count))
+        return lines
+
+    class Phase(object):
+        """Times a with block"""
+
+        def __init__(self, timer, name):
+            self.timer = timer
+            self.name = name
+            self.wall = None
+            self.cpu = None
+
+        def __enter__(self):
+            self.wall = timeit.default_timer()
+            self.cpu = process_time()
+            return self
+
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            self.timer.add(self.name, timeit.default_timer() - self.wall, process_time() - self.cpu)
+
+
+class NullTimer(object):
+    """Same interface as PhaseTimer but records nothing, used when no timer is given."""
+
+    def phase(self, name):
+        """
+        :param name: the phase name
+        :type name: str
+        :return: context manager that does nothing
+        :rtype: NullTimer
+        """
+        return self
+
+    def add(self, name, wall, cpu, count=1):
+        """ignored"""
+        pass
+
+    def merge(self, timings):
+        """ignored"""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class Profiler(object):
+    """
+    cProfile the with block and write the pstats file, or do nothing when there is no file name.
+
+    Usage::
+
+        with Profiler('run.pstats'):
+            app.execute(settings)
+
+        ➤ python -m pstats run.pstats
+    """
+
+    def __init__(self, file_name=None):
+        """
+        :param file_name: where to write the pstats data, None to not profile
+        :type file_name: str|None
+        """
+        self.file_name = file_name
+        self.profile = None
+
+    def __enter__(self):
+        if self.file_name:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(self.file_name)
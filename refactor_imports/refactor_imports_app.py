@@ -4,10 +4,24 @@ The RefactorImports application.
 
 """
 import os
+import sys
+import time
+from collections import deque
 from fullmonty.graceful_interrupt_handler import GracefulInterruptHandler
-from fullmonty.simple_logger import Logger, FileLogger
+from fullmonty.simple_logger import Logger, FileLogger, info
+from fullmonty.list_helper import unique_list
+from refactor_imports.changed_files import GitError, git_changed_files
 from refactor_imports.code_analyzer import CodeAnalyzer
-from refactor_imports.import_tracer import ImportTracer
+from refactor_imports.import_tracer import ImportTracer, TRACER_PRELOAD, TracerPool
+from refactor_imports.import_graph import ImportGraph
+from refactor_imports.isolate import Isolate, IsolateError
+from refactor_imports.memory_usage import megabytes, peak_rss
+from refactor_imports.module_cache import ModuleCache
+from refactor_imports.patch_cache import PATCH_CACHE_DIR, PatchCache
+from refactor_imports.phase_timer import NULL_TIMER, PhaseTimer, Profiler
+from refactor_imports.patch_applier import PatchApplier, REWRITTEN, UNCHANGED, file_signature
+from refactor_imports.refactor_imports_cli import ArgumentError
+from refactor_imports.wildcard_resolver import WildcardResolver
 
 __docformat__ = 'restructuredtext en'
 __all__ = ("RefactorImportsApp",)
@@ -47,33 +61,318 @@ class RefactorImportsApp(object):
         if settings.logfile is not None and settings.logfile:
             Logger.add_logger(FileLogger(settings.logfile))
 
-        with GracefulInterruptHandler() as handler:
-            analyzer = CodeAnalyzer(settings.top_dir)
-            if settings.trace:
-                print("Trace Imports")
-                print("top_dir: {dir}".format(dir=settings.top_dir))
-                for module in analyzer.find_modules(settings.top_dir,
-                                                    start_dir=os.path.join(settings.top_dir, 'refactor_imports')):
-                    print('-' * 60)
-                    print("{name}:".format(name=module.module_spec))
-                    tracer = ImportTracer(module_spec=module.module_spec, file_spec=module.file_spec)
-                    patch = tracer.execute()
-                    print(patch)
+        cache = None
+        patch_cache = None
+        if not settings.no_cache:
+            cache = ModuleCache(cache_dir=settings.cache_dir, max_bytes=settings.cache_size * 1024 * 1024)
+            patch_cache = PatchCache(cache_dir=os.path.join(settings.cache_dir, PATCH_CACHE_DIR),
+                                     max_bytes=settings.cache_size * 1024 * 1024,
+                                     search_path=[os.path.abspath(settings.top_dir)] + sys.path, module_cache=cache)
+
+        # the zygote imports the tracer and the --preload modules once, each traced module starts in a fork of it
+        preload = None
+        if settings.zygote:
+            preload = unique_list(list(TRACER_PRELOAD) + settings.preload)
+
+        # --since and --files limit the output and tracing to the changed files and their wildcard importers
+        files = None
+        if settings.since is not None or settings.files is not None:
+            files = [os.path.abspath(file_spec) for file_spec in settings.files or []]
+            if settings.since is not None:
+                try:
+                    files.extend(git_changed_files(settings.top_dir, settings.since))
+                except GitError as ex:
+                    raise ArgumentError("--since {ref}: {err}".format(ref=settings.since, err=str(ex)))
+            info("{count} changed files".format(count=len(files)))
+
+        memory_limit = None
+        if settings.memory_limit is not None:
+            memory_limit = settings.memory_limit * 1024 * 1024
+
+        # wall and cpu time of each phase of the run, printed with --profile
+        timer = PhaseTimer()
+        with Profiler(settings.profile_file):
+            with GracefulInterruptHandler() as handler:
+                # the trees are only needed by --dump which parses each file again as it is printed
+                analyzer = CodeAnalyzer(settings.top_dir, cache=cache, jobs=settings.jobs, keep_trees=False,
+                                        include=settings.include or None, exclude=settings.exclude, timer=timer,
+                                        memory_limit=memory_limit, files=files)
+                if settings.trace or settings.apply:
+                    print("Trace Imports")
+                    print("top_dir: {dir}".format(dir=settings.top_dir))
+                    if memory_limit is None:
+                        modules = analyzer.find_modules(settings.top_dir)
+                        # trace and rewrite the dependencies before the modules that import them
+                        chunks = [ImportGraph(modules).sort_modules(modules)]
+                    else:
+                        # only one chunk of modules is alive at a time
+                        chunks = analyzer.iter_chunks(settings.top_dir)
+                    resolver = WildcardResolver(search_path=[os.path.abspath(settings.top_dir)] + sys.path,
+                                                cache=cache)
+                    if settings.apply:
+                        signatures = {}
+                        patches = self.trace_patches(self.signed(chunks, signatures), resolver, settings.jobs,
+                                                     settings.tracer_backend, timer, preload=preload,
+                                                     patch_cache=patch_cache)
+                        self.apply_patches(patches, signatures, settings.jobs)
+                    else:
+                        patches = self.trace_patches(chunks, resolver, settings.jobs, settings.tracer_backend, timer,
+                                                     preload=preload, patch_cache=patch_cache)
+                        for module, patch in patches:
+                            with timer.phase('output'):
+                                print('-' * 60)
+                                print("{name}:".format(name=module.module_spec))
+                                print(patch)
+                    info("Resolved {resolved} modules statically, traced {traced}".format(
+                        resolved=resolver.resolved, traced=resolver.unresolved))
+                elif settings.cycles:
+                    graph = analyzer.import_graph()
+                    cycles = graph.cycles()
+                    for cycle in cycles:
+                        print(' -> '.join(cycle + cycle[:1]))
+                    info("{modules} modules, {imports} imports, {cycles} import cycles".format(
+                        modules=len(graph), imports=graph.edge_count, cycles=len(cycles)))
+                elif settings.callers or settings.hottest:
+                    call_index = analyzer.call_index()
+                    with timer.phase('output'):
+                        for name in settings.callers:
+                            print("{name}:".format(name=name))
+                            for module_spec, line, column, count in call_index.callers(name):
+                                print("  {module}:{line}:{column}  x{count}".format(module=module_spec, line=line,
+                                                                                  column=column, count=count))
+                        if settings.hottest:
+                            for name, count in call_index.hottest(settings.hottest):
+                                print("{count:>8}  {name}".format(count=count, name=name))
+                    info("{sites} call sites of {targets} names".format(sites=len(call_index),
+                                                                        targets=len(call_index.names)))
+                else:
+                    # the index needs every module's exportables so it is built before the output pass, which
+                    # then reuses the modules analyzed for the index unless there is a memory limit
+                    index = analyzer.symbol_index() if settings.usages or settings.imports else None
+                    # --usages lists the modules in name order
+                    modules = analyzer.iter_modules(by_name=settings.usages)
+                    # print each module's results as soon as it is analyzed
+                    for module in modules:
+                        with timer.phase('output'):
+                            if settings.dump:
+                                print("{name}:".format(name=module.file_spec))
+                                module.dump_tree(sys.stdout)
+                                print()
+                                print("\n")
+
+                            if settings.all:
+                                for exportable in module.exportables:
+                                    print(exportable.import_str)
+
+                            if settings.usages:
+                                self.print_usages(module, index)
+
+                            if settings.imports:
+                                self.print_imports(module, index)
+
+                # only the modes that resolve imports (--trace, --apply) consult the registry
+                if analyzer.registry.hits or analyzer.registry.misses:
+                    info("Module registry: {hits} hits, {misses} misses".format(hits=analyzer.registry.hits,
+                                                                                misses=analyzer.registry.misses))
+
+        if cache is not None:
+            info("Cache: {hits} hits, {misses} misses".format(hits=cache.hits, misses=cache.misses))
+        if patch_cache is not None and (settings.trace or settings.apply):
+            info("Patch cache: {hits} hits, {misses} misses".format(hits=patch_cache.hits, misses=patch_cache.misses))
+
+        if settings.profile:
+            for line in timer.report():
+                print(line)
+
+        if memory_limit is not None or settings.profile:
+            print("Peak RSS: {peak}".format(peak=megabytes(peak_rss())))
+            if analyzer.releases:
+                info("Released the analyzed modules {count} times to stay under {limit}".format(
+                    count=analyzer.releases, limit=megabytes(memory_limit)))
+
+    def print_usages(self, module, index):
+        """
+        Print the calls made by the module along with the modules that export each called symbol.
+
+        :param module: the module
+        :type module: ModuleInfo
+        :param index: the index over all of the exportables
+        :type index: SymbolIndex
+        """
+        print("{module}:".format(module=module.module_spec))
+        for call in sorted(unique_list(module.calls)):
+            exporters = index.resolve_call(call)
+            if exporters:
+                print("  {call}  ({modules})".format(
+                    call=call, modules=', '.join(exportable.module_spec for exportable in exporters)))
             else:
-                if settings.dump:
-                    for module in analyzer.find_modules(settings.top_dir):
-                        print("{name}:".format(name=module.file_spec))
-                        print(module.dump_tree())
-                        print("\n")
-
-                exportables = analyzer.exportables()
-                if settings.all:
-                    for exportable in exportables:
-                        print(exportable.import_str)
-
-                if settings.usages:
-                    calls = analyzer.calls()
-                    for module_name in sorted(calls.keys()):
-                        print("{module}:".format(module=module_name))
-                        for call in calls[module_name]:
-                            print("  " + call)
+                print("  " + call)
+
+    def print_imports(self, module, index):
+        """
+        Print the explicit import lines the module needs for the symbols it calls.
+
+        :param module: the module
+        :type module: ModuleInfo
+        :param index: the index over all of the exportables
+        :type index: SymbolIndex
+        """
+        print("{module}:".format(module=module.module_spec))
+        for line in index.import_lines(module):
+            print("  " + line)
+
+    def signed(self, chunks, signatures):
+        """
+        Record the signature of each module, the hash of the bytes it was parsed from, as its chunk is analyzed.
+
+        :param chunks: lists of analyzed modules
+        :type chunks: iterable(list(ModuleInfo))
+        :param signatures: filled in with file_spec -> signature
+        :type signatures: dict(str,str)
+        :return: generator of the chunks
+        :rtype: iterable(list(ModuleInfo))
+        """
+        for chunk in chunks:
+            for module in chunk:
+                signatures[module.file_spec] = module.source_hash or file_signature(module.file_spec)
+            yield chunk
+
+    def apply_patches(self, patches, signatures, jobs):
+        """
+        Rewrite the module files with their patches, skipping the files changed since they were analyzed.
+
+        :param patches: (module, patch) for each module
+        :type patches: iterable(tuple(ModuleInfo,str))
+        :param signatures: the hash of the contents of each module file when it was analyzed
+        :type signatures: dict(str,str)
+        :param jobs: the number of processes writing the files
+        :type jobs: int
+        """
+        applier = PatchApplier(jobs=jobs)
+        for file_spec, status, message in applier.apply((module.file_spec, patch, signatures.pop(module.file_spec))
+                                                        for module, patch in patches):
+            if status == REWRITTEN:
+                print("Rewrote {file}".format(file=file_spec))
+            elif status != UNCHANGED:
+                print("Skipped {file}: {status}, {message}".format(file=file_spec, status=status, message=message))
+        print(applier.summary())
+
+    def trace_patches(self, chunks, resolver, jobs, backend, timer=None, preload=None, patch_cache=None):
+        """
+        Get the patch for each module, expanding the wildcard imports statically when possible and tracing
+        the remaining modules in a pool of worker processes, or in forks of a zygote process when given the
+        modules to preload.  The pool or zygote is started when the first module that needs tracing is found
+        and is shared by all of the chunks.
+
+        :param chunks: lists of the modules to patch
+        :type chunks: iterable(list(ModuleInfo))
+        :param resolver: the static wildcard import resolver
+        :type resolver: WildcardResolver
+        :param jobs: the number of tracer processes
+        :type jobs: int
+        :param backend: the tracer backend, one of TRACER_BACKENDS
+        :type backend: str
+        :param timer: optional timer the static resolve and tracer phases are added to
+        :type timer: PhaseTimer|None
+        :param preload: trace in forks of a zygote that imports these modules, None to use a TracerPool
+        :type preload: list(str)|None
+        :param patch_cache: optional cache of traced patches, a module is only traced if its trace is not cached.
+                            The partial patch of a module whose import raised is not cached.
+        :type patch_cache: PatchCache|None
+        :return: generator of (module, patch) in the same order as the modules in the chunks
+        :rtype: iterable(tuple(ModuleInfo,str))
+        """
+        timer = timer or NULL_TIMER
+        pool = None
+        # module name -> the exception importing it raised
+        errors = {}
+        try:
+            for modules in chunks:
+                with timer.phase('static resolve'):
+                    static_patches = [resolver.patch(module) for module in modules]
+                # content addresses of the traces, only modules without a cached trace are traced
+                keys = [None] * len(modules)
+                if patch_cache is not None:
+                    with timer.phase('patch cache'):
+                        for number, module in enumerate(modules):
+                            if static_patches[number] is None:
+                                keys[number] = patch_cache.key(module, backend)
+                                static_patches[number] = patch_cache.get(keys[number])
+                traced_modules = [(module.module_spec, module.file_spec)
+                                  for module, patch in zip(modules, static_patches) if patch is None]
+                if traced_modules and pool is None:
+                    if preload is not None:
+                        with timer.phase('tracer startup'):
+                            pool = Isolate(preload=preload)
+                            pool.start()
+                    else:
+                        # sized from jobs rather than this chunk as the pool traces all of the chunks
+                        pool = TracerPool(processes=jobs, timer=timer)
+                        errors = pool.errors
+                traced_patches = None
+                if traced_modules and preload is not None:
+                    traced_patches = self.fork_traces(pool, traced_modules, backend, jobs, timer, errors)
+                elif traced_modules:
+                    traced_patches = pool.trace_modules(traced_modules, backend=backend)
+                for module, patch, key in zip(modules, static_patches, keys):
+                    if patch is None:
+                        patch = next(traced_patches)
+                        if key is not None and module.module_spec not in errors:
+                            patch_cache.put(key, patch)
+                    yield module, patch
+        finally:
+            if pool is not None:
+                pool.close()
+
+    # noinspection PyMethodMayBeStatic
+    def fork_traces(self, isolate, modules, backend, jobs, timer, errors):
+        """
+        Trace the modules in forks of the zygote, up to jobs of them at a time.  A module whose fork fails, or
+        dies, gets an empty patch and the failure is recorded in errors.
+
+        :param isolate: the running zygote
+        :type isolate: Isolate
+        :param modules: (module_spec, file_spec) for each module to trace
+        :type modules: list(tuple(str,str))
+        :param jobs: the number of forks running at once
+        :type jobs: int
+        :param errors: module name -> the exception importing it raised, updated with these modules'
+        :type errors: dict(str,str)
+        :return: generator of the patches from tracing the modules, in the same order as modules
+        :rtype: iterable(str)
+        """
+        # (module_spec, request) of the running forks, oldest first
+        running = deque()
+        for module_spec, file_spec in modules:
+            if len(running) >= jobs:
+                yield self.fork_result(isolate, running.popleft(), timer, errors)
+            running.append((module_spec, isolate.submit(ImportTracer.fork_job, module_spec, file_spec, backend,
+                                                        time.time())))
+        while running:
+            yield self.fork_result(isolate, running.popleft(), timer, errors)
+
+    # noinspection PyMethodMayBeStatic
+    def fork_result(self, isolate, fork, timer, errors):
+        """
+        :param isolate: the running zygote
+        :type isolate: Isolate
+        :param fork: (module_spec, request) of a module being traced in a fork of the zygote
+        :type fork: tuple(str,int)
+        :param errors: module name -> the exception importing it raised, updated with this module's
+        :type errors: dict(str,str)
+        :return: the patch from tracing the module, empty when the fork failed
+        :rtype: str
+        """
+        module_spec, request = fork
+        try:
+            patch, timings, error = isolate.result(request)
+            timer.merge(timings)
+        except IsolateError as ex:
+            # the traceback of the failure, or the child died
+            patch = ''
+            error = "IsolateError: {err}".format(err=str(ex).strip().splitlines()[-1])
+        if error is None:
+            errors.pop(module_spec, None)
+        else:
+            errors[module_spec] = error
+        return patch
@@ -4,6 +4,8 @@ RefactorImportsSettings adds application specific information to the generic App
 """
 import os
 from fullmonty.application_settings import ApplicationSettings
+from refactor_imports.import_tracer import IMPORT_HOOK_BACKEND, SETTRACE_BACKEND, TRACER_BACKENDS
+from refactor_imports.module_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
 
 __docformat__ = 'restructuredtext en'
 __all__ = ("RefactorImportsSettings",)
@@ -30,7 +32,51 @@ class RefactorImportsSettings(ApplicationSettings):
         'usages': 'List usages of package.module.* symbols',
         'imports': 'List the desired import lines for each module.',
         'dump': 'Dump AST tree for each module',
+        'cycles': 'List the import cycles between the modules.',
+        'callers': 'List the call sites (module, line, column, and number of calls) of the qualified name, for '
+                   'example "package.module.function".  May be given more than once.',
+        'hottest': 'List the N most called qualified names.',
         'trace': 'Trace imports for each module',
+        'memory_limit': 'Analyze the modules in chunks and release the analyzed imported modules whenever the '
+                        'process grows past MB megabytes.  --usages and --imports analyze each module again for '
+                        'the output, from the cache, instead of keeping the modules read to build the symbol '
+                        'index.  The peak memory use is reported at the end.',
+        'apply': 'Apply the --trace patches to the module files instead of printing them.  Files changed since '
+                 'they were analyzed are skipped.',
+        'jobs': 'The number of processes used to parse and trace the modules. (default=1)',
+        'include': 'Only analyze the modules whose file name or path relative to top_dir match the glob.  May be '
+                   'given more than once.',
+        'exclude': 'Skip the files and directories whose name or path relative to top_dir match the glob, in '
+                   'addition to the version control, tool, virtualenv, and build directories that are skipped '
+                   'unless they are packages.  May be given more than once.',
+        'since': 'Only output and trace the python files that changed since the git commit, branch, or tag '
+                 '(including uncommitted and untracked files), and the modules that wildcard import them.  The '
+                 'symbols, imports, and calls are still looked up in the whole tree, so every module is read '
+                 'to find the wildcard importers and to build the indexes.  Keep the cache enabled so only the '
+                 'changed modules are parsed, the run time still grows with the size of the tree.',
+        'files': 'Only output and trace these files, and the modules that wildcard import them.  Combined with '
+                 '--since when both are given.',
+        'tracer_backend': 'How --trace finds the names bound by wildcard imports: "{settrace}" line traces the '
+                          'import, "{hook}" intercepts the wildcard imports. (default="{settrace}")'.format(
+                              settrace=SETTRACE_BACKEND, hook=IMPORT_HOOK_BACKEND),
+        'zygote': 'Trace each module in a fork of a zygote process that imported the shared dependencies once, '
+                  'instead of in a pool of spawned processes.  Up to --jobs forks run at once.  Requires '
+                  'os.fork().',
+        'preload': 'A module the --zygote process imports before forking the tracers, for example a heavy '
+                   'dependency of the traced modules.  May be given more than once.',
+
+        'cache_group': 'Options that control the persistent cache of module analysis results.',
+        'cache_dir': 'The directory to keep cached module analysis results in. (default="{dir}")'.format(
+            dir=DEFAULT_CACHE_DIR),
+        'cache_size': 'The maximum size of the cache in megabytes.  The least recently used results are '
+                      'removed when exceeded. (default={size})'.format(size=DEFAULT_CACHE_SIZE // (1024 * 1024)),
+        'no_cache': 'Do not use the persistent cache, parse every module and trace every module --trace can not expand '
+                    'statically.',
+
+        'profile_group': 'Options that show where the time goes in a run.',
+        'profile': 'Print the wall and CPU time of each phase of the run (discovery, parse, visit, tracer '
+                   'startup, traced import, to_patch, output...).',
+        'profile_file': 'Write cProfile statistics for the whole run to FILE, view them with "python -m pstats FILE".',
 
         'info_group': '',
         'version': "Show RefactorImports's version.",
@@ -63,7 +109,38 @@ class RefactorImportsSettings(ApplicationSettings):
         options_group.add_argument('--usages', action='store_true', help=self._help['usages'])
         options_group.add_argument('--imports', action='store_true', help=self._help['imports'])
         options_group.add_argument('--dump', action='store_true', help=self._help['dump'])
+        options_group.add_argument('--cycles', action='store_true', help=self._help['cycles'])
+        options_group.add_argument('--callers', type=str, metavar='NAME', action='append', default=[],
+                                   help=self._help['callers'])
+        options_group.add_argument('--hottest', type=int, metavar='N', default=None, help=self._help['hottest'])
         options_group.add_argument('--trace', action='store_true', help=self._help['trace'])
+        options_group.add_argument('--memory_limit', type=int, metavar='MB', default=None,
+                                   help=self._help['memory_limit'])
+        options_group.add_argument('--apply', action='store_true', help=self._help['apply'])
+        options_group.add_argument('--jobs', type=int, metavar='N', default=1, help=self._help['jobs'])
+        options_group.add_argument('--include', type=str, metavar='GLOB', action='append', default=[],
+                                   help=self._help['include'])
+        options_group.add_argument('--exclude', type=str, metavar='GLOB', action='append', default=[],
+                                   help=self._help['exclude'])
+        options_group.add_argument('--since', type=str, metavar='REF', default=None, help=self._help['since'])
+        options_group.add_argument('--files', type=str, metavar='FILE', nargs='+', default=None,
+                                   help=self._help['files'])
+        options_group.add_argument('--tracer_backend', choices=TRACER_BACKENDS, default=SETTRACE_BACKEND,
+                                   help=self._help['tracer_backend'])
+        options_group.add_argument('--zygote', action='store_true', help=self._help['zygote'])
+        options_group.add_argument('--preload', type=str, metavar='MODULE', action='append', default=[],
+                                   help=self._help['preload'])
+
+        cache_group = parser.add_argument_group(title='Cache Options', description=self._help['cache_group'])
+        cache_group.add_argument('--cache_dir', type=str, metavar='DIR', default=DEFAULT_CACHE_DIR,
+                                 help=self._help['cache_dir'])
+        cache_group.add_argument('--cache_size', type=int, metavar='MB', default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+                                 help=self._help['cache_size'])
+        cache_group.add_argument('--no_cache', action='store_true', help=self._help['no_cache'])
+
+        profile_group = parser.add_argument_group(title='Profile Options', description=self._help['profile_group'])
+        profile_group.add_argument('--profile', action='store_true', help=self._help['profile'])
+        profile_group.add_argument('--profile_file', type=str, metavar='FILE', help=self._help['profile_file'])
 
         info_group = parser.add_argument_group(title='Informational Commands', description=self._help['info_group'])
         info_group.add_argument('--version', dest='version', action='store_true', help=self._help['version'])
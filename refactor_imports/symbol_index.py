@@ -0,0 +1,129 @@
+# coding=utf-8
+
+"""
+An inverted index over the exportable symbols of an analysis.  Answers "which modules export this name" and
+"which names does this module export" with dictionary lookups instead of scanning the list of exportables.
+"""
+
+try:
+    import builtins
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    import __builtin__ as builtins
+
+from refactor_imports.module_info import absolute_module_spec
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+
+class SymbolIndex(object):
+    """
+    Usage::
+
+        index = SymbolIndex(analyzer.exportables())
+        for exportable in index.exporters('ModuleInfo'):
+            print(exportable.import_str)
+        print(index.names('refactor_imports.module_info'))
+    """
+
+    def __init__(self, exportables=None):
+        """
+        :param exportables: the exportables to index
+        :type exportables: iterable(Exportable)|None
+        """
+        # name -> exportables with that name
+        self.by_name = {}
+        # module_spec -> names exported by the module
+        self.by_module = {}
+        # the number of exportables added
+        self._count = 0
+        for exportable in exportables or []:
+            self.add(exportable)
+
+    def add(self, exportable):
+        """
+        :param exportable: the exportable to index
+        :type exportable: Exportable
+        """
+        self.by_name.setdefault(exportable.name, []).append(exportable)
+        self.by_module.setdefault(exportable.module_spec, []).append(exportable.name)
+        self._count += 1
+
+    def exporters(self, name):
+        """
+        :param name: the symbol name
+        :type name: str
+        :return: the exportables with the given name, one per module exporting it
+        :rtype: tuple(Exportable)
+        """
+        return tuple(self.by_name.get(name, ()))
+
+    def names(self, module_spec):
+        """
+        :param module_spec: the module name
+        :type module_spec: str
+        :return: the names exported by the module
+        :rtype: tuple(str)
+        """
+        return tuple(self.by_module.get(module_spec, ()))
+
+    def resolve_call(self, call):
+        """
+        Find where the symbol a call refers to is defined.  The first component of a dotted call
+        ("Foo.bar" -> "Foo") is the name that has to be imported.
+
+        :param call: the call name as recorded in ModuleInfo.calls
+        :type call: str
+        :return: the exportables the call may refer to
+        :rtype: tuple(Exportable)
+        """
+        return self.exporters(call.split('.', 1)[0])
+
+    def required_imports(self, module_info):
+        """
+        Find the explicit imports a module needs for the names it calls.  Each called name that the module
+        does not define or import itself and that is not a builtin is looked up in the index.  When several modules
+        export the name, a module the importer already imports from is preferred, then the first in sorted
+        order.  Names that no module in the index exports are skipped.
+
+        :param module_info: the importing module
+        :type module_info: ModuleInfo
+        :return: the names to import from each module, the modules and names sorted
+        :rtype: list(tuple(str,list(str)))
+        """
+        own_spec = module_info.module_spec.split('.__init__')[0]
+        # names the module binds, by definition or by its own imports, are not imported again
+        local_names = set(module_info.defined_names)
+        local_names.update(module_info.imported_names)
+        local_names.update(module_info.import_aliases)
+        imported_modules = set(absolute_module_spec(name, module_info.module_spec, module_info.file_spec)
+                               for name in module_info.import_names)
+        imports = {}
+        for call in set(module_info.calls):
+            name = call.split('.', 1)[0]
+            if name in local_names or hasattr(builtins, name):
+                continue
+            exporters = [exportable.module_spec for exportable in self.exporters(name)
+                         if exportable.module_spec != own_spec]
+            if not exporters:
+                continue
+            preferred = sorted(exporters, key=lambda module_spec: (module_spec not in imported_modules, module_spec))
+            imports.setdefault(preferred[0], set()).add(name)
+        return [(module_spec, sorted(imports[module_spec])) for module_spec in sorted(imports)]
+
+    def import_lines(self, module_info):
+        """
+        :param module_info: the importing module
+        :type module_info: ModuleInfo
+        :return: one "from module import names" line for each module in required_imports()
+        :rtype: list(str)
+        """
+        return ["from {module} import {names}".format(module=module_spec, names=', '.join(names))
+                for module_spec, names in self.required_imports(module_info)]
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def __len__(self):
+        return self._count
@@ -0,0 +1,124 @@
+# coding=utf-8
+
+"""
+Expand wildcard imports statically.
+
+For "from module import *" the imported names are either the module's literal __all__ or, without an __all__,
+the module's public names.  When the module's source can be found and those names can be read from its
+ModuleInfo, the wildcard can be expanded without importing (and so executing) anything.  Modules where that is
+not possible (extension modules, packages, modules that build __all__ or their globals at run time, ...) are
+left for the ImportTracer.
+"""
+
+import os
+
+from fullmonty.list_helper import unique_list
+
+from refactor_imports.import_tracer import wildcard_patch
+from refactor_imports.module_info import ModuleInfo, absolute_module_spec, find_module_file
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+# calls at module level that can bind names the ModuleParser can not see
+NAMESPACE_CALLS = ('globals', 'locals', 'vars', 'exec', 'execfile', 'setattr')
+
+
+class WildcardResolver(object):
+    """
+    Usage::
+
+        resolver = WildcardResolver(search_path=[top_dir] + sys.path)
+        patch = resolver.patch(module_info)
+        if patch is None:
+            patch = ImportTracer(module_info.module_spec, module_info.file_spec).execute()
+    """
+
+    def __init__(self, search_path=None, cache=None):
+        """
+        :param search_path: the directories to find imported modules in, defaults to sys.path
+        :type search_path: list(str)|None
+        :param cache: optional persistent cache of module summaries
+        :type cache: refactor_imports.module_cache.ModuleCache|None
+        """
+        self.search_path = search_path
+        self.cache = cache
+        self.resolved = 0
+        self.unresolved = 0
+        self._exports = {}
+
+    def patch(self, module_info):
+        """
+        :param module_info: the module to expand the wildcard imports of
+        :type module_info: ModuleInfo
+        :return: the patch replacing the module's wildcard imports or None if they can not be expanded
+                 statically and the module needs to be traced
+        :rtype: str|None
+        """
+        replacements = self.replacements(module_info)
+        if replacements is None:
+            self.unresolved += 1
+            return None
+        self.resolved += 1
+        if not replacements:
+            return ''
+        return wildcard_patch(module_info.file_spec, replacements)
+
+    def replacements(self, module_info):
+        """
+        :param module_info: the module to expand the wildcard imports of
+        :type module_info: ModuleInfo
+        :return: the replacements for wildcard_patch() or None if any wildcard import can not be expanded
+        :rtype: dict(int,tuple(str,list(str)))|None
+        """
+        replacements = {}
+        for line_number, module in module_info.wildcard_imports:
+            module_spec = absolute_module_spec(module, module_info.module_spec, module_info.file_spec)
+            if not module_spec:
+                return None
+            names = self.exports(module_spec)
+            if names is None:
+                return None
+            replacements[line_number] = (module, names)
+        return replacements
+
+    def exports(self, module_spec):
+        """
+        :param module_spec: the absolute module name
+        :type module_spec: str
+        :return: the names bound by "from module_spec import *" or None if they can not be found statically
+        :rtype: list(str)|None
+        """
+        if module_spec not in self._exports:
+            # guard against wildcard import cycles while this module is being resolved
+            self._exports[module_spec] = None
+            self._exports[module_spec] = self._find_exports(module_spec)
+        return self._exports[module_spec]
+
+    def _find_exports(self, module_spec):
+        file_spec = find_module_file(module_spec, self.search_path)
+        if file_spec is None:
+            return None
+        try:
+            info = ModuleInfo(module_spec=module_spec, file_spec=file_spec, cache=self.cache, resolve=False)
+        except (SyntaxError, IOError, UnicodeDecodeError):
+            return None
+
+        if info.variable_names.count('__all__') == 1 and info.all_names is not None and \
+                not any(call.startswith('__all__.') for call in info.calls):
+            return list(info.all_names)
+
+        # a package's namespace also holds whatever submodules happen to be imported, so trace those
+        if '__all__' in info.variable_names or info.dynamic_names or \
+                os.path.basename(file_spec) == '__init__.py' or \
+                any(call in NAMESPACE_CALLS for call in info.calls):
+            return None
+
+        names = info.public_names + [name for name in info.imported_names if not name.startswith('_')]
+        for line_number, module in info.wildcard_imports:
+            wildcard_spec = absolute_module_spec(module, module_spec, file_spec)
+            wildcard_names = self.exports(wildcard_spec) if wildcard_spec else None
+            if wildcard_names is None:
+                return None
+            names.extend(wildcard_names)
+        return unique_list(names)
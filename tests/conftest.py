@@ -0,0 +1,56 @@
+# coding=utf-8
+
+"""
+Fixtures shared by the tests
+"""
+import os
+
+import pytest
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+
+def write_tree(top_dir, sources):
+    """
+    Write the source files, and their directories, below top_dir.
+
+    :param top_dir: the directory the files are written in
+    :type top_dir: str
+    :param sources: the file's contents by its '/' separated path relative to top_dir
+    :type sources: dict(str,str)
+    :return: the absolute path of each file by its relative path
+    :rtype: dict(str,str)
+    """
+    file_specs = {}
+    for name, source in sources.items():
+        file_spec = os.path.join(top_dir, *name.split('/'))
+        if not os.path.isdir(os.path.dirname(file_spec)):
+            os.makedirs(os.path.dirname(file_spec))
+        with open(file_spec, 'w') as source_file:
+            source_file.write(source)
+        file_specs[name] = file_spec
+    return file_specs
+
+
+@pytest.fixture
+def top_dir(tmp_path):
+    """
+    :return: the test's own empty directory, removed by pytest
+    :rtype: str
+    """
+    return str(tmp_path)
+
+
+@pytest.fixture
+def make_tree(top_dir):
+    """
+    Usage::
+
+        def test_something(top_dir, make_tree):
+            file_specs = make_tree({'pkg/__init__.py': '', 'pkg/a.py': 'import os\n'})
+
+    :return: function writing the sources below top_dir, see write_tree()
+    :rtype: function
+    """
+    return lambda sources: write_tree(top_dir, sources)
@@ -0,0 +1,96 @@
+# coding=utf-8
+
+"""
+Test the astpp pretty printer
+"""
+import ast
+import io
+import sys
+
+from refactor_imports.astpp import dump, dump_to
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+SOURCE = '''
+import os
+
+
+def main(args=None):
+    return [os.path.join(arg, 'x') for arg in args or []]
+'''
+
+
+def test_dump_format():
+    """
+    test the pretty printed layout, lists of nodes one per line and indented two levels per list
+    """
+    expected = '\n'.join([
+        "Module(body=[",
+        "    Import(names=[",
+        "        alias(name='os', asname=None),",
+        "      ]),",
+        "  ], type_ignores=[])",
+    ])
+    assert dump(ast.parse('import os')) == expected
+
+
+# noinspection PyProtectedMember
+def recursive_dump(node, annotate_fields=True, include_attributes=False, indent='  '):
+    """
+    The original recursive astpp.dump, kept as the oracle for the iterative dump_to.
+    """
+    def _format(node_, level=0):
+        if isinstance(node_, ast.AST):
+            fields = [(a, _format(b, level)) for a, b in ast.iter_fields(node_)]
+            if include_attributes and node_._attributes:
+                fields.extend([(a, _format(getattr(node_, a), level))
+                               for a in node_._attributes])
+            return ''.join([
+                node_.__class__.__name__,
+                '(',
+                ', '.join(('%s=%s' % field for field in fields)
+                          if annotate_fields else
+                          (b for a, b in fields)),
+                ')'])
+        elif isinstance(node_, list):
+            lines = ['[']
+            lines.extend((indent * (level + 2) + _format(x, level + 2) + ',' for x in node_))
+            if len(lines) > 1:
+                lines.append(indent * (level + 1) + ']')
+            else:
+                lines[-1] += ']'
+            return '\n'.join(lines)
+        return repr(node_)
+
+    return _format(node)
+
+
+def test_dump_to_stream():
+    """
+    test that writing to a stream gives the same output as the original recursive dump, with and without the
+    optional parts
+    """
+    tree = ast.parse(SOURCE)
+    for options in ({}, {'include_attributes': True}, {'annotate_fields': False}, {'indent': '\t'},
+                    {'annotate_fields': False, 'include_attributes': True, 'indent': ''}):
+        stream = io.StringIO()
+        dump_to(tree, stream, **options)
+        expected = recursive_dump(tree, **options)
+        assert stream.getvalue() == expected
+        assert dump(tree, **options) == expected
+
+
+def test_dump_deep_tree():
+    """
+    test that a tree deeper than the recursion limit is dumped
+    """
+    tree = ast.parse('x = ' + ' + '.join(['1'] * 900))
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(200)
+    try:
+        stream = io.StringIO()
+        dump_to(tree, stream)
+    finally:
+        sys.setrecursionlimit(limit)
+    assert stream.getvalue().count('BinOp(') == 899
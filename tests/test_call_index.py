@@ -0,0 +1,35 @@
+# coding=utf-8
+
+"""
+Test the CallSiteIndex
+"""
+from refactor_imports.code_analyzer import CodeAnalyzer
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+SOURCES = {
+    'pkg/__init__.py': '',
+    'pkg/mod.py': 'def func():\n    return 1\n\n\nclass Klass(object):\n    pass\n\n\ndef use():\n    func(); func()\n'
+                  '    return Klass()\n',
+    'pkg/user.py': 'from pkg.mod import func as f\nimport pkg.mod\n\nf()\npkg.mod.func()\nprint(f())\n',
+    'pkg/relative.py': 'from . import mod\nfrom .mod import Klass\n\nmod.func()\nKlass()\n',
+}
+
+
+def test_callers_and_hottest(top_dir, make_tree):
+    """
+    test that calls are qualified through the imports, and that calls of a target on one line share a call site
+    """
+    make_tree(SOURCES)
+    index = CodeAnalyzer(top_dir).call_index()
+
+    assert sorted(index.callers('pkg.mod.func')) == [('pkg.mod', 10, 4, 2), ('pkg.relative', 4, 0, 1),
+                                                     ('pkg.user', 4, 0, 1), ('pkg.user', 5, 0, 1),
+                                                     ('pkg.user', 6, 6, 1)]
+    assert sorted(index.callers('pkg.mod.Klass')) == [('pkg.mod', 11, 11, 1), ('pkg.relative', 5, 0, 1)]
+    assert index.callers('pkg.missing') == []
+    assert index.hottest(2) == [('pkg.mod.func', 6), ('pkg.mod.Klass', 2)]
+    assert len(index) == 8
+    # the name table holds each target once
+    assert len(index.names) == len(set(index.names)) == 3
@@ -0,0 +1,109 @@
+# coding=utf-8
+
+"""
+Test limiting the analysis to changed files
+"""
+import os
+import subprocess
+
+from refactor_imports.changed_files import git_changed_files, wildcard_importers
+from refactor_imports.code_analyzer import CodeAnalyzer
+from refactor_imports.module_cache import ModuleCache
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+# pkg.user wildcard imports pkg.middle which wildcard imports pkg.base
+SOURCES = {
+    'pkg/__init__.py': '',
+    'pkg/base.py': 'ALPHA = 1\n',
+    'pkg/middle.py': 'from pkg.base import *\nBETA = 2\n',
+    'pkg/user.py': 'from .middle import *\nprint(BETA)\n',
+    'pkg/other.py': 'import pkg.base\nGAMMA = 3\n',
+}
+
+
+def git(work_dir, *args):
+    subprocess.check_call(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args),
+                          cwd=work_dir, stdout=subprocess.PIPE)
+
+
+def git_commit_all(work_dir):
+    """make work_dir a git work tree with its files committed"""
+    git(work_dir, 'init', '-q')
+    git(work_dir, 'add', '.')
+    git(work_dir, 'commit', '-q', '-m', 'initial')
+
+
+def test_changed_files_and_wildcard_importers(top_dir, make_tree):
+    """
+    test that only the files changed since a commit, and the modules wildcard importing them, are analyzed
+    """
+    file_specs = make_tree(SOURCES)
+    git_commit_all(top_dir)
+    assert git_changed_files(top_dir, 'HEAD') == []
+
+    with open(file_specs['pkg/base.py'], 'a') as source_file:
+        source_file.write('DELTA = 4\n')
+    make_tree({'pkg/new.py': 'EPSILON = 5\n'})
+    changed = git_changed_files(top_dir, 'HEAD')
+    assert sorted(os.path.basename(file_spec) for file_spec in changed) == ['base.py', 'new.py']
+
+    analyzer = CodeAnalyzer(top_dir, files=changed)
+    module_specs = [info.module_spec for info in analyzer.find_modules(top_dir)]
+    assert sorted(module_specs) == ['pkg.base', 'pkg.middle', 'pkg.new', 'pkg.user']
+
+    # a change to the end of the chain only affects itself
+    user_spec = file_specs['pkg/user.py']
+    finder_index = CodeAnalyzer(top_dir).finder.index
+    assert wildcard_importers(finder_index, [user_spec]) == set([user_spec])
+
+
+def test_selected_files_use_the_whole_tree_indexes(top_dir, make_tree):
+    """
+    test that the files only limit the output, the symbol index and import graph still cover every module
+    """
+    file_specs = make_tree(SOURCES)
+    analyzer = CodeAnalyzer(top_dir, files=[file_specs['pkg/user.py']])
+
+    index = analyzer.symbol_index()
+    assert [exportable.module_spec for exportable in index.exporters('GAMMA')] == ['pkg.other']
+    assert [exportable.module_spec for exportable in index.exporters('BETA')] == ['pkg.middle']
+    assert [info.module_spec for info in analyzer.iter_modules()] == ['pkg.user']
+    assert 'pkg.other' in analyzer.import_graph().names
+
+
+def test_selected_files_index_from_the_cache(top_dir, make_tree, tmp_path_factory):
+    """
+    test that with a warm cache only the changed module is parsed to build the whole tree's index and that the
+    output pass only analyzes the selected modules
+    """
+    file_specs = make_tree(SOURCES)
+    cache = ModuleCache(cache_dir=str(tmp_path_factory.mktemp('cache')))
+    CodeAnalyzer(top_dir, cache=cache).find_modules(top_dir)
+    with open(file_specs['pkg/base.py'], 'a') as source_file:
+        source_file.write('DELTA = 4\n')
+
+    analyzer = CodeAnalyzer(top_dir, cache=cache, keep_trees=False, files=[file_specs['pkg/base.py']])
+    index = analyzer.symbol_index()
+    assert [exportable.module_spec for exportable in index.exporters('DELTA')] == ['pkg.base']
+    assert analyzer.timer.timings['parse'][2] == 1
+    hits = cache.hits
+    assert [info.module_spec for info in analyzer.iter_modules()] == ['pkg.base', 'pkg.middle', 'pkg.user']
+    assert cache.hits == hits + 3
+    assert analyzer.timer.timings['parse'][2] == 1
+
+
+def test_changed_files_through_symlink(top_dir, make_tree):
+    """
+    test that the changes are found when top_dir is reached through a symbolic link, with the paths under the link
+    """
+    real_dir = os.path.join(top_dir, 'real')
+    file_specs = make_tree(dict(('real/' + name, source) for name, source in SOURCES.items()))
+    git_commit_all(real_dir)
+    with open(file_specs['real/pkg/base.py'], 'a') as source_file:
+        source_file.write('DELTA = 4\n')
+
+    link_dir = os.path.join(top_dir, 'link')
+    os.symlink(real_dir, link_dir)
+    assert git_changed_files(link_dir, 'HEAD') == [os.path.join(link_dir, 'pkg', 'base.py')]
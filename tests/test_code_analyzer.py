@@ -0,0 +1,206 @@
+# coding=utf-8
+
+"""
+Test the CodeAnalyzer
+"""
+import os
+
+from refactor_imports import code_analyzer
+from refactor_imports.code_analyzer import CodeAnalyzer
+from refactor_imports.module_cache import ModuleCache
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+
+def package_sources(modules=12):
+    """the sources of pkg with some modules that have no imports"""
+    sources = {'pkg/__init__.py': ''}
+    for index in range(modules):
+        sources['pkg/mod{n}.py'.format(n=index)] = "VALUE_{n} = {n}\n\n\nclass Klass{n}(object):\n    pass\n\n\n" \
+                                                   "def function_{n}():\n    return Klass{n}()\n".format(n=index)
+    return sources
+
+
+def test_parallel_find_modules(top_dir, make_tree):
+    """
+    test that parsing the modules in a process pool gives the same results, in the same order, as parsing
+    them serially
+    """
+    make_tree(package_sources())
+    serial = CodeAnalyzer(top_dir).find_modules(top_dir)
+    parallel = CodeAnalyzer(top_dir, jobs=3).find_modules(top_dir)
+
+    assert len(serial) == 13
+    assert [info.module_spec for info in parallel] == [info.module_spec for info in serial]
+    assert [info.summary() for info in parallel] == [info.summary() for info in serial]
+    assert all(info.tree is None for info in parallel)
+
+
+def test_shared_module_registry(top_dir, make_tree):
+    """
+    test that modules importing each other, and a common dependency, share one ModuleInfo per module
+    """
+    make_tree({
+        'cyclic/__init__.py': '',
+        'cyclic/a.py': "import os\nfrom cyclic import b\n",
+        'cyclic/b.py': "import os\nfrom . import a\nfrom .a import *\n",
+    })
+
+    analyzer = CodeAnalyzer(top_dir)
+    modules = dict((info.module_spec, info) for info in analyzer.find_modules(top_dir))
+    module_a = modules['cyclic.a']
+    module_b = modules['cyclic.b']
+
+    assert module_a.import_modules['os'] is module_b.import_modules['os']
+    assert module_a.import_modules['cyclic'] is modules['cyclic.__init__']
+    assert module_b.import_modules['.'] is modules['cyclic.__init__']
+    assert module_b.import_modules['.a'] is module_a
+    # every module other than the three found ones was analyzed exactly once
+    assert analyzer.registry.misses == len(analyzer.registry.modules) - 3
+    assert analyzer.registry.hits > 0
+
+
+def test_streaming_results(top_dir, make_tree):
+    """
+    test that the streaming generators yield the same results, in the same order, as the list based methods
+    """
+    make_tree(package_sources())
+    analyzer = CodeAnalyzer(top_dir)
+    calls = analyzer.calls()
+    exportables = analyzer.exportables()
+
+    for jobs in (1, 3):
+        streaming = CodeAnalyzer(top_dir, jobs=jobs)
+        modules = streaming.iter_modules()
+        first = next(modules)
+        assert first.module_spec == 'pkg.__init__'
+        assert [first.module_spec] + [info.module_spec for info in modules] == \
+            [info.module_spec for info in analyzer.find_modules(top_dir)]
+        assert [exportable.import_str for exportable in streaming.iter_exportables()] == \
+            [exportable.import_str for exportable in exportables]
+        assert dict(streaming.iter_calls()) == calls
+        # nothing is retained by the streaming methods
+        assert streaming.module_infos is None
+
+
+def test_discarded_trees(top_dir, make_tree):
+    """
+    test that without keep_trees no module or imported module keeps its tree and dump_tree() still works
+    """
+    sources = package_sources(modules=2)
+    sources['pkg/user.py'] = "from pkg.mod0 import Klass0\n\nKlass0()\n"
+    make_tree(sources)
+    kept = CodeAnalyzer(top_dir).find_modules(top_dir)
+    analyzer = CodeAnalyzer(top_dir, keep_trees=False)
+    modules = analyzer.find_modules(top_dir)
+
+    assert all(info.tree is not None for info in kept)
+    assert all(info.tree is None for info in modules)
+    assert all(info is None or info.tree is None for info in analyzer.registry.modules.values())
+    assert [info.summary() for info in modules] == [info.summary() for info in kept]
+    assert [info.dump_tree() for info in modules] == [info.dump_tree() for info in kept]
+    assert all(info.tree is None for info in modules)
+
+
+def test_find_modules_start_dir(top_dir, make_tree):
+    """
+    test that start_dir is honored after the whole tree has been analyzed and the same modules are returned
+    """
+    sources = package_sources(modules=2)
+    sources['other/__init__.py'] = ''
+    make_tree(sources)
+
+    analyzer = CodeAnalyzer(top_dir)
+    modules = analyzer.find_modules(top_dir)
+    subtree = analyzer.find_modules(top_dir, start_dir=os.path.join(top_dir, 'other'))
+
+    assert len(modules) == 4
+    assert [info.module_spec for info in subtree] == ['other.__init__']
+    assert subtree[0] is modules[0]
+    assert analyzer.find_modules(top_dir) is modules
+
+
+def test_phase_timings(top_dir, make_tree):
+    """
+    test that the analysis phases are timed and counted once per module
+    """
+    make_tree(package_sources(modules=3))
+    analyzer = CodeAnalyzer(top_dir)
+    analyzer.find_modules(top_dir)
+    timings = analyzer.timer.timings
+
+    assert analyzer.timer.order[:3] == ['discovery', 'parse', 'visit']
+    assert timings['parse'][2] == 4
+    assert timings['visit'][2] == 4
+    assert timings['resolve imports'][2] == 1
+    assert all(wall >= 0.0 and cpu >= 0.0 for wall, cpu, count in timings.values())
+    assert len(analyzer.timer.report()) == len(timings) + 1
+
+
+def test_index_then_output_parses_once(top_dir, make_tree):
+    """
+    test that the output pass after building the symbol index reuses the modules analyzed for the index
+    """
+    make_tree(package_sources(modules=3))
+    analyzer = CodeAnalyzer(top_dir, keep_trees=False)
+    index = analyzer.symbol_index()
+    module_specs = [info.module_spec for info in analyzer.iter_modules()]
+
+    assert len(index) == 9
+    assert module_specs == ['pkg.__init__', 'pkg.mod0', 'pkg.mod1', 'pkg.mod2']
+    assert analyzer.timer.timings['parse'][2] == 4
+
+
+def test_memory_limited_index_keeps_no_modules(top_dir, make_tree, tmp_path_factory):
+    """
+    test that with a memory limit the output pass after building the symbol index analyzes the modules again,
+    from the cache, and that the modules are streamed in name order without keeping them
+    """
+    sources = package_sources(modules=3)
+    sources['pkg/aardvark/__init__.py'] = ''
+    make_tree(sources)
+    cache = ModuleCache(cache_dir=str(tmp_path_factory.mktemp('cache')))
+    analyzer = CodeAnalyzer(top_dir, keep_trees=False, cache=cache, memory_limit=1024 * 1024 * 1024)
+    index = analyzer.symbol_index()
+    hits = cache.hits
+    modules = analyzer.iter_modules(by_name=True)
+    first = next(modules)
+
+    assert len(index) == 9
+    assert [first.module_spec] + [info.module_spec for info in modules] == \
+        ['pkg.__init__', 'pkg.aardvark.__init__', 'pkg.mod0', 'pkg.mod1', 'pkg.mod2']
+    assert analyzer.timer.timings['parse'][2] == 5
+    assert cache.hits == hits + 5
+    assert analyzer.module_infos is None
+
+
+def test_memory_bounded_chunks(top_dir, make_tree, monkeypatch):
+    """
+    test that the chunks hold the same modules as find_modules and that the imported modules are released
+    between chunks when the process is over the memory limit and has grown since the last release
+    """
+    sources = package_sources(modules=9)
+    sources['pkg/user.py'] = "import os\nfrom pkg.mod0 import Klass0\n"
+    make_tree(sources)
+    modules = CodeAnalyzer(top_dir).find_modules(top_dir)
+
+    unlimited = CodeAnalyzer(top_dir)
+    chunks = list(unlimited.iter_chunks(chunk_size=4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 3]
+    assert unlimited.releases == 0
+    assert unlimited.module_infos is None
+
+    # the resident memory before each chunk's check and, after a release, once the registry is released.  The
+    # second chunk leaves the process over the limit but it has not grown enough since the first release.
+    rss = iter([2000, 1900, 1950, 2100, 2000])
+    monkeypatch.setattr(code_analyzer, 'current_rss', lambda: next(rss))
+    limited = CodeAnalyzer(top_dir, memory_limit=1000)
+    summaries = []
+    for chunk in limited.iter_chunks(chunk_size=4):
+        summaries.extend(info.summary() for info in chunk)
+        assert all(info.import_modules or not info.import_names for info in chunk)
+    assert summaries == [info.summary() for info in modules]
+    assert limited.releases == 2
+    assert not limited.registry.modules
+    assert limited.registry.misses > 0
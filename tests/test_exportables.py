@@ -3,18 +3,19 @@
 import ast
 import os
 from refactor_imports.code_analyzer import CodeAnalyzer
+from refactor_imports.exportable import Exportable
 from fullmonty.simple_logger import info
 
 __author__ = 'roy'
 
-top_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+repo_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
 
 def test_importing_found_exportables():
     """
     This test gets all of the exportable objects then tries to parse and compile each import statement.
     """
-    analyzer = CodeAnalyzer(top_dir)
+    analyzer = CodeAnalyzer(repo_dir)
     exportables = analyzer.exportables()
 
     for exportable in exportables:
@@ -49,3 +50,87 @@ def test_verify_import_bad_package_test():
         assert False, import_str
     except Exception as ex:
         assert True, import_str + ' : ' + str(ex)
+
+
+def test_symbol_index():
+    """
+    This test verifies the symbol index finds the modules exporting a name and the names exported by a module.
+    """
+    analyzer = CodeAnalyzer(repo_dir)
+    index = analyzer.symbol_index()
+
+    assert len(index) == len(analyzer.exportables())
+    assert [exportable.module_spec for exportable in index.exporters('CodeAnalyzer')] == \
+        ['refactor_imports.code_analyzer']
+    assert 'ModuleInfo' in index.names('refactor_imports.module_info')
+    assert [exportable.name for exportable in index.resolve_call('SymbolIndex.add')] == ['SymbolIndex']
+    assert not index.exporters('DoesNotExist')
+
+    # the results are immutable so callers can not change the index
+    assert isinstance(index.exporters('CodeAnalyzer'), tuple)
+    assert isinstance(index.names('refactor_imports.module_info'), tuple)
+    assert analyzer.symbol_index() is index
+
+
+def test_exportable_comparison():
+    """
+    test that exportables compare, hash, and sort by module then name, and have no per instance dictionary
+    """
+    first = Exportable('pkg.__init__', 'pkg/__init__.py', 'Beta')
+    second = Exportable('pkg', 'pkg/__init__.py', 'Beta')
+    third = Exportable('pkg.mod', 'pkg/mod.py', 'Alpha')
+
+    assert first == second
+    assert not first != second
+    assert hash(first) == hash(second)
+    assert len({first, second, third}) == 2
+    assert sorted([third, first]) == [first, third]
+    assert first < third and third > first and first <= second and first >= second
+    assert first.full_name == 'pkg.Beta'
+    assert not hasattr(first, '__dict__')
+    assert first.module_spec is second.module_spec
+
+
+def test_required_imports(top_dir, make_tree):
+    """
+    This test verifies the import lines for a module's calls prefer the modules it already imports from and
+    skip the names it defines, builtins, and names not exported in the tree.
+    """
+    make_tree({
+        'pkg/__init__.py': '',
+        'pkg/shapes.py': 'class Square(object):\n    pass\n\n\nclass Circle(object):\n    pass\n',
+        'pkg/more_shapes.py': 'class Circle(object):\n    pass\n',
+        'pkg/tools.py': 'def measure(shape):\n    return 1\n',
+        'pkg/user.py': 'from pkg.more_shapes import *\n\n\ndef local():\n    pass\n\n\n'
+                       'def main():\n    local()\n    print(len(Square()))\n    Circle()\n'
+                       '    measure(Circle())\n    unknown()\n    Square.area()\n',
+    })
+
+    analyzer = CodeAnalyzer(top_dir)
+    index = analyzer.symbol_index()
+    modules = dict((module_info.module_spec, module_info) for module_info in analyzer.find_modules(top_dir))
+
+    assert index.import_lines(modules['pkg.user']) == ['from pkg.more_shapes import Circle',
+                                                       'from pkg.shapes import Square',
+                                                       'from pkg.tools import measure']
+    assert index.import_lines(modules['pkg.shapes']) == []
+
+
+def test_required_imports_keep_own_imports(top_dir, make_tree):
+    """
+    This test verifies names the module already imports are not imported again from the tree modules that also
+    export them.
+    """
+    make_tree({
+        'pkg/__init__.py': '',
+        'pkg/util.py': 'def join(*parts):\n    return parts\n\n\ndef split(path):\n    return path\n',
+        'pkg/other.py': 'json = None\n',
+        'pkg/user.py': 'from os.path import join\nimport json\n\n\ndef main():\n    join("a", "b")\n'
+                       '    json.dumps({})\n    split("a")\n',
+    })
+
+    analyzer = CodeAnalyzer(top_dir)
+    index = analyzer.symbol_index()
+    modules = dict((module_info.module_spec, module_info) for module_info in analyzer.find_modules(top_dir))
+
+    assert index.import_lines(modules['pkg.user']) == ['from pkg.util import split']
@@ -0,0 +1,85 @@
+# coding=utf-8
+
+"""
+Test the ImportGraph
+"""
+from collections import namedtuple
+
+from refactor_imports.code_analyzer import CodeAnalyzer
+from refactor_imports.import_graph import ImportGraph
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+# the ModuleInfo attributes the graph uses
+Module = namedtuple('Module', ['module_spec', 'file_spec', 'import_names', 'import_aliases'])
+
+
+def test_cycles_and_order(top_dir, make_tree):
+    """
+    test that the import cycles are found and every module comes after the modules it imports
+    """
+    make_tree({
+        'pkg/__init__.py': '',
+        'pkg/a.py': 'import pkg.b\n',
+        'pkg/b.py': 'import os\nfrom .a import *\nfrom pkg.c import thing\n',
+        'pkg/c.py': 'thing = 1\n',
+        'pkg/d.py': 'import pkg.a\nimport pkg.c\n',
+        'pkg/e.py': 'import pkg.e\n',
+    })
+
+    graph = CodeAnalyzer(top_dir).import_graph()
+
+    assert len(graph) == 6
+    assert graph.imports('pkg.b') == ['pkg.a', 'pkg.c']
+    assert graph.edge_count == 6
+    assert graph.cycles() == [['pkg.a', 'pkg.b'], ['pkg.e']]
+
+    order = graph.topological_order()
+    assert sorted(order) == ['pkg', 'pkg.a', 'pkg.b', 'pkg.c', 'pkg.d', 'pkg.e']
+    assert order.index('pkg.c') < order.index('pkg.b')
+    assert order.index('pkg.a') < order.index('pkg.d')
+
+
+def test_submodule_and_parent_package_edges(top_dir, make_tree):
+    """
+    test that "from package import submodule" imports the submodule, and that "import a.b.c" also imports the
+    parent packages, but not the importing module's own packages
+    """
+    make_tree({
+        'pkg/__init__.py': 'from .a import helper\n',
+        'pkg/a.py': 'from . import b\n\n\ndef helper():\n    pass\n',
+        'pkg/b.py': 'from pkg import a\nfrom pkg.a import helper\n',
+        'other/__init__.py': '',
+        'other/sub/__init__.py': '',
+        'other/sub/leaf.py': 'import pkg.b\n',
+        'main/__init__.py': '',
+        'main/run.py': 'import other.sub.leaf\n',
+    })
+
+    graph = CodeAnalyzer(top_dir).import_graph()
+
+    assert graph.imports('pkg.a') == ['pkg.b']
+    assert graph.imports('pkg.b') == ['pkg.a']
+    assert graph.imports('other.sub.leaf') == ['pkg', 'pkg.b']
+    assert graph.imports('main.run') == ['other', 'other.sub', 'other.sub.leaf']
+    assert graph.cycles() == [['pkg.a', 'pkg.b']]
+    order = graph.topological_order()
+    assert order.index('other.sub.leaf') < order.index('main.run')
+
+
+def test_long_import_chain():
+    """
+    test that a chain of imports longer than the recursion limit is ordered and the closing import found
+    """
+    count = 5000
+    modules = [Module('m{n}'.format(n=index), 'm{n}.py'.format(n=index), ['m{n}'.format(n=index + 1)], {})
+               for index in range(count)]
+    graph = ImportGraph(modules)
+
+    assert graph.topological_order() == ['m{n}'.format(n=index) for index in reversed(range(count))]
+    assert not graph.cycles()
+    assert [module.module_spec for module in graph.sort_modules(modules[:3])] == ['m2', 'm1', 'm0']
+
+    modules[-1] = Module('m{n}'.format(n=count - 1), '', ['m0'], {})
+    assert len(ImportGraph(modules).cycles()[0]) == count
@@ -6,9 +6,12 @@ Test the ImportTracer
 import os
 
 import sys
+import time
 
 from refactor_imports.code_analyzer import CodeAnalyzer
-from refactor_imports.import_tracer import ImportTracer
+from refactor_imports.import_tracer import ImportTracer, TracerPool, SETTRACE_BACKEND, IMPORT_HOOK_BACKEND, \
+    TRACER_PRELOAD
+from refactor_imports.isolate import Isolate, IsolateError
 
 __docformat__ = 'restructuredtext en'
 __author__ = 'wrighroy'
@@ -82,3 +85,140 @@ def test_importing_same_name():
             assert "-from data.t4 import *" in patch
             assert "+from data.t4 import Bar" in patch
             assert "+from data.t4 import Delta" in patch
+
+
+def test_tracer_pool():
+    """
+    test that a pool of two workers traces the data modules with the same results as a process per module,
+    even though each worker traces several modules.
+    """
+    data_dir = os.path.join(top_dir, 'data')
+    modules = [('data.' + name, os.path.join(data_dir, name + '.py')) for name in ('p1', 't1', 'p2', 't2', 't3')]
+    with TracerPool(processes=2) as pool:
+        patches = list(pool.trace_modules(modules))
+        assert pool.trace('data.p1', os.path.join(data_dir, 'p1.py')) == patches[0]
+        # each traced module's phases come back from the workers
+        assert pool.timer.timings['traced import'][2] == len(modules) + 1
+        assert pool.timer.timings['to_patch'][2] == len(modules) + 1
+
+    for (module_spec, file_spec), patch in zip(modules, patches):
+        if os.path.basename(file_spec).startswith('p'):
+            assert patch
+        else:
+            assert not patch
+    assert "+from pprint import pformat" in patches[0]
+    assert "+from data.t3 import Charlie" in patches[2]
+    assert "+from data.t4 import Delta" in patches[2]
+
+
+def test_zygote_tracer():
+    """
+    test that tracing in forks of a zygote gives the same patches as the pool, with each module traced in a
+    fresh child
+    """
+    data_dir = os.path.join(top_dir, 'data')
+    modules = [('data.' + name, os.path.join(data_dir, name + '.py')) for name in ('p1', 't1', 'p2')]
+    with TracerPool(processes=1) as pool:
+        pool_patches = list(pool.trace_modules(modules))
+
+    with Isolate(preload=TRACER_PRELOAD) as isolate:
+        tracers = [ImportTracer(module_spec, file_spec) for module_spec, file_spec in modules]
+        patches = [tracer.execute(isolate=isolate) for tracer in tracers]
+        pids = set(isolate.fork(os.getpid) for _ in range(3))
+        try:
+            isolate.fork(int, 'not a number')
+            assert False, 'the exception in the child was not raised'
+        except IsolateError as ex:
+            assert 'ValueError' in str(ex)
+        # the zygote keeps serving after a failed child
+        assert isolate.fork(int, '42') == 42
+        # the children run at the same time and their results are matched to the requests
+        started = time.time()
+        sleeping = [isolate.submit(time.sleep, 1) for _ in range(3)]
+        converted = isolate.submit(int, '7')
+        assert isolate.result(converted) == 7
+        assert [isolate.result(request) for request in sleeping] == [None] * 3
+        assert time.time() - started < 2.5
+
+    assert patches == pool_patches
+    assert len(pids) == 3 and os.getpid() not in pids
+    assert tracers[0].timer.timings['tracer startup'][2] == 1
+    assert tracers[0].timer.timings['traced import'][2] == 1
+
+
+def test_failing_module_does_not_stop_the_pool(tmp_path):
+    """
+    test that a module raising at import time, or exiting, gives the patch for the wildcard imports run before
+    the exception, and that the pool goes on tracing the other modules with the worker no longer traced
+    """
+    (tmp_path / 'raises_late.py').write_text(u'from pprint import *\nraise RuntimeError("boom")\n')
+    (tmp_path / 'exits.py').write_text(u'import sys\nfrom pprint import *\nsys.exit(2)\n')
+    sys.path.insert(0, str(tmp_path))
+    try:
+        data_dir = os.path.join(top_dir, 'data')
+        modules = [('raises_late', str(tmp_path / 'raises_late.py')), ('exits', str(tmp_path / 'exits.py')),
+                   ('data.p1', os.path.join(data_dir, 'p1.py'))]
+        for backend in (SETTRACE_BACKEND, IMPORT_HOOK_BACKEND):
+            with TracerPool(processes=1) as pool:
+                patches = list(pool.trace_modules(modules, backend=backend))
+                # the worker traced the modules in this process, so it must not stay traced
+                assert pool.pool.apply(sys.gettrace) is None
+            assert all("+from pprint import pformat" in patch for patch in patches)
+            assert pool.errors == {'raises_late': 'RuntimeError: boom', 'exits': 'SystemExit: 2'}
+
+        tracer = ImportTracer('exits', str(tmp_path / 'exits.py'))
+        assert "+from pprint import pformat" in tracer.execute()
+        assert tracer.error == 'SystemExit: 2'
+
+        with Isolate(preload=TRACER_PRELOAD) as isolate:
+            tracer = ImportTracer('raises_late', str(tmp_path / 'raises_late.py'))
+            assert "+from pprint import pformat" in tracer.execute(isolate=isolate)
+            assert tracer.error == 'RuntimeError: boom'
+    finally:
+        sys.path.remove(str(tmp_path))
+        sys.modules.pop('raises_late', None)
+
+
+def test_import_hook_backend():
+    """
+    test that the import hook backend finds the names bound by each wildcard import without line tracing
+    """
+    data_dir = os.path.join(top_dir, 'data')
+    modules = [('data.' + name, os.path.join(data_dir, name + '.py')) for name in ('p1', 'p2', 't2')]
+    with TracerPool(processes=1) as pool:
+        settrace_patches = list(pool.trace_modules(modules, backend=SETTRACE_BACKEND))
+        hook_patches = list(pool.trace_modules(modules, backend=IMPORT_HOOK_BACKEND))
+
+    assert hook_patches == settrace_patches
+    assert "-from data.t3 import *\n+from data.t3 import Bar\n+from data.t3 import Charlie\n" in hook_patches[1]
+    assert "-from data.t4 import *\n+from data.t4 import Bar\n+from data.t4 import Delta\n" in hook_patches[1]
+    assert not hook_patches[2]
+
+
+def test_module_tracer_diffs():
+    """
+    test that the module tracer keeps one diff per wildcard import rather than one per executed line
+    """
+    file_spec = os.path.join(top_dir, 'data', 'p2.py')
+    tracer = ImportTracer.ModuleTracer(file_spec)
+    try:
+        patch = ImportTracer.trace('data.p2', file_spec, tracer)
+    finally:
+        for name in ('data.p2', 'data.t3', 'data.t4'):
+            sys.modules.pop(name, None)
+    assert [diff['line_number'] for diff in tracer.diffs] == [8, 11]
+    assert tracer.diffs[0]['added'] == set(['Bar', 'Charlie'])
+    assert tracer.diffs[1]['added'] == set(['Bar', 'Delta'])
+    assert "+from data.t4 import Charlie" not in patch
+
+
+def test_foreign_frames_not_traced():
+    """
+    test that only the traced module's frames get the line trace function and that its wildcard import
+    lines are found from the source
+    """
+    file_spec = os.path.join(top_dir, 'data', 'p2.py')
+    tracer = ImportTracer.ModuleTracer(file_spec)
+    # this test's frame is from another file
+    assert tracer.trace_imports(sys._getframe(), 'call', None) is None
+    assert tracer.wildcard_lines == {8: 'data.t3', 11: 'data.t4'}
@@ -0,0 +1,105 @@
+# coding=utf-8
+
+"""
+Test the persistent ModuleCache
+"""
+import os
+
+from refactor_imports.module_cache import ModuleCache
+from refactor_imports.module_info import ModuleInfo
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+SOURCE = '''
+VALUE = 1
+
+
+class Foo(object):
+    pass
+
+
+def bar():
+    Foo()
+'''
+
+
+def test_unchanged_file_is_not_parsed(top_dir, make_tree):
+    """
+    test that the second ModuleInfo for an unchanged file comes from the cache without parsing the file
+    """
+    cache = ModuleCache(os.path.join(top_dir, 'cache'))
+    file_spec = make_tree({'foo.py': SOURCE})['foo.py']
+
+    info = ModuleInfo(module_spec='foo', file_spec=file_spec, cache=cache)
+    assert info.tree is not None
+    assert cache.misses == 1
+
+    cached_info = ModuleInfo(module_spec='foo', file_spec=file_spec, cache=cache)
+    assert cached_info.tree is None
+    assert cache.hits == 1
+    assert cached_info.summary() == info.summary()
+    assert cached_info.class_names == ['Foo']
+    assert cached_info.function_names == ['bar']
+    assert cached_info.variable_names == ['VALUE']
+    assert cached_info.dump_tree()
+
+
+def test_changed_file_is_parsed(top_dir, make_tree):
+    """
+    test that changing a file's contents invalidates the cache entry while only touching it does not
+    """
+    cache = ModuleCache(os.path.join(top_dir, 'cache'))
+    file_spec = make_tree({'foo.py': SOURCE})['foo.py']
+    ModuleInfo(module_spec='foo', file_spec=file_spec, cache=cache)
+
+    stat = os.stat(file_spec)
+    os.utime(file_spec, (stat.st_atime, stat.st_mtime + 10))
+    assert ModuleInfo(module_spec='foo', file_spec=file_spec, cache=cache).tree is None
+    assert cache.hits == 1
+
+    make_tree({'foo.py': SOURCE + '\n\nclass Baz(object):\n    pass\n'})
+    info = ModuleInfo(module_spec='foo', file_spec=file_spec, cache=cache)
+    assert info.tree is not None
+    assert info.class_names == ['Foo', 'Baz']
+    assert cache.misses == 2
+
+
+def test_least_recently_used_entries_are_evicted(top_dir, make_tree):
+    """
+    test that the cache stays within its size cap by evicting the least recently used entries
+    """
+    cache = ModuleCache(os.path.join(top_dir, 'cache'))
+    file_specs = sorted(make_tree(dict(('mod{n}.py'.format(n=n), SOURCE) for n in range(4))).values())
+    for file_spec in file_specs:
+        ModuleInfo(module_spec='mod', file_spec=file_spec, cache=cache)
+    entry_size = cache.total_bytes // len(file_specs)
+
+    # make mod0 the most recently used entry, then shrink the cache to two entries
+    for index, (entry_path, size, mtime) in enumerate(sorted(cache._entries())):
+        os.utime(entry_path, (mtime, 1000 + index))
+    os.utime(cache._entry_path(file_specs[0]), (0, 2000))
+    cache.max_bytes = entry_size * 2 + entry_size // 2
+    cache._evict()
+
+    assert len(cache._entries()) == 2
+    assert cache.total_bytes <= cache.max_bytes
+    assert cache.get(file_specs[0]) is not None
+
+
+def test_eviction_frees_room_below_the_cap(top_dir, make_tree, monkeypatch):
+    """
+    test that eviction goes below the size cap so the entries are not listed again on every put
+    """
+    cache = ModuleCache(os.path.join(top_dir, 'cache'))
+    file_specs = sorted(make_tree(dict(('mod{n:02d}.py'.format(n=n), SOURCE) for n in range(40))).values())
+    ModuleInfo(module_spec='mod', file_spec=file_specs[0], cache=cache)
+    cache.max_bytes = cache.total_bytes * 20 + cache.total_bytes // 2
+    listings = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, '_entries', lambda: listings.append(1) or entries())
+    for file_spec in file_specs[1:]:
+        ModuleInfo(module_spec='mod', file_spec=file_spec, cache=cache)
+
+    assert cache.total_bytes <= cache.max_bytes
+    assert len(listings) <= 8
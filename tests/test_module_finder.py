@@ -0,0 +1,74 @@
+# coding=utf-8
+
+"""
+Test the ModuleFinder
+"""
+import os
+
+from refactor_imports.module_finder import ModuleFinder
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+
+def empty_files(names):
+    """the sources of the (empty) files"""
+    return dict.fromkeys(names, '')
+
+
+def test_pruning(top_dir, make_tree):
+    """
+    test that the tool, virtualenv, and non-package directories are skipped and the modules are in depth first order
+    """
+    make_tree(empty_files(['pkg/__init__.py', 'pkg/b.py', 'pkg/a.py', 'pkg/notes.txt',
+                           'pkg/sub/__init__.py', 'pkg/sub/c.py',
+                           'pkg/data/__init__.py.orig', 'pkg/data/inner/__init__.py', 'pkg/data/inner/d.py',
+                           'pkg/__pycache__/a.cpython-311.pyc',
+                           'src/other/__init__.py', 'src/other/e.py',
+                           '.git/hooks/__init__.py', 'node_modules/x/__init__.py', 'build/lib/pkg/__init__.py',
+                           'myenv/pyvenv.cfg', 'myenv/lib/site/__init__.py', 'script.py']))
+    finder = ModuleFinder(top_dir)
+
+    assert [module_spec for module_spec, file_spec in finder.index] == \
+        ['pkg.__init__', 'pkg.a', 'pkg.b', 'pkg.sub.__init__', 'pkg.sub.c', 'src.other.__init__', 'src.other.e']
+    assert finder.index[1][1] == os.path.join(top_dir, 'pkg', 'a.py')
+
+
+def test_default_excludes_keep_packages(top_dir, make_tree):
+    """
+    test that subpackages named like the default excludes are analyzed, while the same directories without an
+    __init__.py, and the exclude globs, still prune them
+    """
+    make_tree(empty_files(['pkg/__init__.py', 'pkg/env/__init__.py', 'pkg/env/settings.py',
+                           'pkg/build/__init__.py', 'pkg/build/steps.py', 'env/lib/other/__init__.py']))
+    assert [module_spec for module_spec, file_spec in ModuleFinder(top_dir).index] == \
+        ['pkg.__init__', 'pkg.build.__init__', 'pkg.build.steps', 'pkg.env.__init__', 'pkg.env.settings']
+
+    excluding = ModuleFinder(top_dir, exclude=['build'])
+    assert [module_spec for module_spec, file_spec in excluding.index] == \
+        ['pkg.__init__', 'pkg.env.__init__', 'pkg.env.settings']
+
+
+def test_globs_and_subtrees(top_dir, make_tree):
+    """
+    test the include and exclude globs and that subtree queries come from the index
+    """
+    make_tree(empty_files(['pkg/__init__.py', 'pkg/a.py', 'pkg/a_pb2.py', 'pkg/tests/__init__.py',
+                           'pkg/tests/test_a.py', 'pkg/sub/__init__.py', 'pkg/sub/c.py']))
+    excluding = ModuleFinder(top_dir, exclude=['*_pb2.py', 'pkg/tests'])
+    assert [module_spec for module_spec, file_spec in excluding.index] == \
+        ['pkg.__init__', 'pkg.a', 'pkg.sub.__init__', 'pkg.sub.c']
+
+    including = ModuleFinder(top_dir, include=['test_*.py', '__init__.py'])
+    assert [module_spec for module_spec, file_spec in including.index] == \
+        ['pkg.__init__', 'pkg.sub.__init__', 'pkg.tests.__init__', 'pkg.tests.test_a']
+
+    finder = ModuleFinder(top_dir)
+    assert finder.module_files(os.path.join(top_dir, 'pkg', 'sub')) == finder.index[3:5]
+    assert finder.module_files(top_dir) == finder.index
+    # excluded directories are scanned on their own when asked for
+    assert [module_spec for module_spec, file_spec in
+            excluding.module_files(os.path.join(top_dir, 'pkg', 'tests'))] == ['pkg.tests.__init__',
+                                                                              'pkg.tests.test_a']
+    assert finder.module_files(os.path.join(top_dir, 'pkg', 'a.py')) == \
+        [('', os.path.join(top_dir, 'pkg', 'a.py'))]
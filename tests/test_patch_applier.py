@@ -0,0 +1,101 @@
+# coding=utf-8
+
+"""
+Test applying the --trace patches
+"""
+import os
+
+from refactor_imports.import_tracer import wildcard_patch
+from refactor_imports.patch_applier import PatchApplier, REWRITTEN, STALE, UNCHANGED, file_signature
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+SOURCE = '''"""module {n}"""
+
+from os.path import *
+
+
+def main():
+    return join('a', 'b')
+'''
+
+
+def module_sources(count):
+    """the sources of count modules with a wildcard import"""
+    return dict(('mod{n}.py'.format(n=index), SOURCE.format(n=index)) for index in range(count))
+
+
+def test_apply_patches(top_dir, make_tree):
+    """
+    test that the patched files match the patch and that files changed since they were analyzed are skipped
+    """
+    file_specs = sorted(make_tree(module_sources(6)).values())
+    signatures = dict((file_spec, file_signature(file_spec)) for file_spec in file_specs)
+    patches = [(file_spec, wildcard_patch(file_spec, {3: ('os.path', ['join', 'exists'])}))
+               for file_spec in file_specs]
+    patches[-1] = (file_specs[-1], '')
+
+    # changed after the analysis but before the patch is applied
+    with open(file_specs[0], 'a') as source_file:
+        source_file.write('# edited\n')
+    # without a signature only the patch's context lines catch the change
+    with open(file_specs[1], 'w') as source_file:
+        source_file.write(SOURCE.format(n=1).replace('from os.path import *', 'from os import *'))
+    signatures[file_specs[1]] = None
+
+    applier = PatchApplier(jobs=2)
+    results = dict((file_spec, status) for file_spec, status, message in
+                   applier.apply((file_spec, patch, signatures[file_spec]) for file_spec, patch in patches))
+
+    assert results[file_specs[0]] == STALE
+    assert results[file_specs[1]] == STALE
+    assert [results[file_spec] for file_spec in file_specs[2:5]] == [REWRITTEN] * 3
+    assert results[file_specs[5]] == UNCHANGED
+    assert applier.counts[REWRITTEN] == 3
+    assert 'Rewrote 3 files' in applier.summary()
+
+    with open(file_specs[2]) as source_file:
+        assert source_file.read() == SOURCE.format(n=2).replace(
+            'from os.path import *\n', 'from os.path import exists\nfrom os.path import join\n')
+    with open(file_specs[0]) as source_file:
+        assert 'import *' in source_file.read()
+    assert sorted(os.listdir(top_dir)) == sorted(os.path.basename(file_spec) for file_spec in file_specs)
+
+
+def test_crlf_and_form_feed(top_dir):
+    """
+    test that files with CRLF line endings and form feeds are rewritten, keeping their line endings
+    """
+    file_spec = os.path.join(top_dir, 'crlf.py')
+    source = SOURCE.format(n=0).replace('\n\n\ndef', '\n\x0c\n\ndef').replace('\n', '\r\n')
+    with open(file_spec, 'wb') as source_file:
+        source_file.write(source.encode('utf-8'))
+    patch = wildcard_patch(file_spec, {3: ('os.path', ['join'])})
+
+    results = list(PatchApplier().apply([(file_spec, patch, file_signature(file_spec))]))
+
+    assert results == [(file_spec, REWRITTEN, '')]
+    with open(file_spec, 'rb') as source_file:
+        assert source_file.read().decode('utf-8') == source.replace('from os.path import *',
+                                                                    'from os.path import join')
+
+
+def test_wildcard_import_on_unterminated_last_line(top_dir, make_tree):
+    """
+    test that a wildcard import on a last line without a line ending is patched and the file stays unterminated
+    """
+    sources = {'tail.py': 'print(join)\nfrom os.path import *', 'context.py': 'from os.path import *\nprint(join)'}
+    file_specs = make_tree(sources)
+    patches = dict((name, wildcard_patch(file_specs[name], {line: ('os.path', ['join', 'exists'])}))
+                   for name, line in (('tail.py', 2), ('context.py', 1)))
+
+    assert '-from os.path import *\n\\ No newline at end of file\n+' in patches['tail.py']
+    assert ' print(join)\n\\ No newline at end of file\n' in patches['context.py']
+    results = list(PatchApplier().apply((file_specs[name], patch, file_signature(file_specs[name]))
+                                        for name, patch in sorted(patches.items())))
+    assert [status for file_spec, status, message in results] == [REWRITTEN, REWRITTEN]
+    for name, source in sources.items():
+        with open(file_specs[name]) as source_file:
+            assert source_file.read() == source.replace('from os.path import *',
+                                                        'from os.path import exists\nfrom os.path import join')
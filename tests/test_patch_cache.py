@@ -0,0 +1,52 @@
+# coding=utf-8
+
+"""
+Test the content-addressed PatchCache
+"""
+import os
+
+from refactor_imports.module_info import ModuleInfo
+from refactor_imports.patch_cache import PatchCache
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+
+def test_key_follows_wildcard_targets(top_dir, make_tree):
+    """
+    test that a cached patch is found again until the module, a module it wildcard imports, or a module that one
+    wildcard imports changes
+    """
+    user_spec = make_tree({
+        'base.py': 'ALPHA = 1\n',
+        'middle.py': 'from base import *\nBETA = 2\n',
+        'user.py': 'from middle import *\nprint(BETA)\n',
+        'unrelated.py': 'GAMMA = 3\n',
+    })['user.py']
+    cache_dir = os.path.join(top_dir, 'cache')
+
+    def key():
+        # a new cache per run, the same as separate invocations
+        patch_cache = PatchCache(cache_dir, search_path=[top_dir])
+        return patch_cache, patch_cache.key(ModuleInfo('user', user_spec, resolve=False))
+
+    patch_cache, first_key = key()
+    assert patch_cache.get(first_key) is None
+    patch_cache.put(first_key, 'the patch')
+    assert patch_cache.get(first_key) == 'the patch'
+    assert (patch_cache.hits, patch_cache.misses) == (1, 1)
+
+    make_tree({'unrelated.py': 'GAMMA = 4\n'})
+    assert key()[1] == first_key
+
+    make_tree({'base.py': 'ALPHA = 1\nDELTA = 4\n'})
+    second_key = key()[1]
+    assert second_key != first_key
+
+    make_tree({'middle.py': 'from base import *\nBETA = 5\n'})
+    third_key = key()[1]
+    assert third_key not in (first_key, second_key)
+
+    patch_cache = key()[0]
+    assert patch_cache.get(third_key) is None
+    assert patch_cache.get(first_key) == 'the patch'
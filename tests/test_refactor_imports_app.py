@@ -0,0 +1,161 @@
+# coding=utf-8
+
+"""
+Test the RefactorImportsApp helpers
+"""
+import argparse
+import os
+
+import pytest
+
+from refactor_imports import refactor_imports_app
+from refactor_imports.import_tracer import IMPORT_HOOK_BACKEND, SETTRACE_BACKEND
+from refactor_imports.isolate import IsolateError
+from refactor_imports.refactor_imports_app import RefactorImportsApp
+from refactor_imports.module_info import ModuleInfo
+from refactor_imports.patch_applier import file_signature
+from refactor_imports.patch_cache import PatchCache
+from refactor_imports.phase_timer import NULL_TIMER
+from refactor_imports.wildcard_resolver import WildcardResolver
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+data_dir = os.path.join(os.path.dirname(__file__), 'data')
+
+
+class FakePool(object):
+    """records the pool size and returns a marker patch per module instead of tracing"""
+    # the size of each pool created, set to a new list by the fake_pool fixture
+    sizes = None
+    # the modules whose import raises
+    failing = ()
+
+    def __init__(self, processes=None, timer=None):
+        FakePool.sizes.append(processes)
+        self.errors = {}
+
+    def trace_modules(self, modules, backend=None):
+        for module_spec, file_spec in modules:
+            if module_spec in FakePool.failing:
+                self.errors[module_spec] = 'RuntimeError: boom'
+            yield 'traced ' + module_spec
+
+    def close(self):
+        pass
+
+
+class FakeIsolate(object):
+    """records the number of forks running at once, the forks of the failing modules die"""
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.running = []
+        self.most_running = 0
+
+    def submit(self, func, module_spec, file_spec, backend, started):
+        self.running.append(module_spec)
+        self.most_running = max(self.most_running, len(self.running))
+        return module_spec
+
+    def result(self, request):
+        self.running.remove(request)
+        if request in self.failing:
+            raise IsolateError("Traceback (most recent call last):\nSegfault: the forked process died\n")
+        return 'traced ' + request, {}, None
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    """
+    :return: the FakePool class, used by the app instead of TracerPool, with no pools created yet
+    :rtype: type
+    """
+    monkeypatch.setattr(refactor_imports_app, 'TracerPool', FakePool)
+    monkeypatch.setattr(FakePool, 'sizes', [])
+    return FakePool
+
+
+def test_tracer_pool_sized_from_jobs(fake_pool):
+    """
+    test that the tracer pool shared by all of the chunks is sized from jobs, not from the first chunk
+    """
+    modules = [ModuleInfo('data.' + name, os.path.join(data_dir, name + '.py'), resolve=False)
+               for name in ('p1', 'p2', 'p1')]
+    resolver = WildcardResolver(search_path=[])
+    patches = list(RefactorImportsApp().trace_patches([modules[:1], modules[1:]], resolver, 4, None))
+
+    assert fake_pool.sizes == [4]
+    assert [patch for module, patch in patches] == ['traced data.p1', 'traced data.p2', 'traced data.p1']
+
+
+def test_failed_trace_not_cached(fake_pool, monkeypatch, tmp_path):
+    """
+    test that the partial patch of a module whose import raised is not cached, and that the cached traces are
+    kept per tracer backend
+    """
+    monkeypatch.setattr(fake_pool, 'failing', ('data.p2',))
+    modules = [ModuleInfo('data.' + name, os.path.join(data_dir, name + '.py'), resolve=False)
+               for name in ('p1', 'p2')]
+    resolver = WildcardResolver(search_path=[])
+    patch_cache = PatchCache(str(tmp_path), search_path=[data_dir])
+    list(RefactorImportsApp().trace_patches([modules], resolver, 1, SETTRACE_BACKEND, patch_cache=patch_cache))
+
+    assert patch_cache.get(patch_cache.key(modules[0], SETTRACE_BACKEND)) == 'traced data.p1'
+    assert patch_cache.get(patch_cache.key(modules[1], SETTRACE_BACKEND)) is None
+    assert patch_cache.get(patch_cache.key(modules[0], IMPORT_HOOK_BACKEND)) is None
+
+
+def app_settings(top_dir, **overrides):
+    """the settings of a run without a cache, zygote or profiling, with the given settings changed"""
+    settings = dict(verbosity=0, logfile=None, no_cache=True, cache_dir=None, cache_size=0, top_dir=top_dir,
+                    zygote=False, preload=[], since=None, files=None, memory_limit=None, profile_file=None,
+                    profile=False, jobs=1, include=[], exclude=[], trace=False, apply=False,
+                    tracer_backend=SETTRACE_BACKEND, cycles=False, callers=[], hottest=0, usages=False,
+                    imports=False, dump=False, all=False)
+    settings.update(overrides)
+    return argparse.Namespace(**settings)
+
+
+def test_apply_rewrites_the_whole_top_dir(top_dir, make_tree):
+    """
+    test that --apply rewrites the modules anywhere below top_dir
+    """
+    file_specs = make_tree({'pkg/__init__.py': '',
+                            'pkg/base.py': '__all__ = ["ALPHA"]\nALPHA = 1\n',
+                            'pkg/user.py': 'from pkg.base import *\nprint(ALPHA)\n'})
+    RefactorImportsApp().execute(app_settings(top_dir, apply=True))
+
+    with open(file_specs['pkg/user.py']) as source_file:
+        assert source_file.read() == 'from pkg.base import ALPHA\nprint(ALPHA)\n'
+
+
+def test_signature_of_the_parsed_source(top_dir, make_tree):
+    """
+    test that a module's signature is taken from the source it was parsed from, so a file edited between the
+    analysis and the signing is still seen as changed
+    """
+    file_specs = make_tree({'user.py': 'from os.path import *\nprint(join)\n'})
+    module = ModuleInfo('user', file_specs['user.py'], resolve=False)
+    parsed_signature = file_signature(file_specs['user.py'])
+    with open(file_specs['user.py'], 'a') as source_file:
+        source_file.write('# edited\n')
+    signatures = {}
+    list(RefactorImportsApp().signed([[module]], signatures))
+
+    assert signatures == {file_specs['user.py']: parsed_signature}
+    assert file_signature(file_specs['user.py']) != parsed_signature
+
+
+def test_fork_traces_jobs_at_a_time():
+    """
+    test that the zygote runs up to jobs forks at once and that a failed fork gives an empty patch and an error
+    """
+    modules = [('mod{n}'.format(n=index), 'mod{n}.py'.format(n=index)) for index in range(5)]
+    isolate = FakeIsolate(failing=('mod2',))
+    errors = {'mod1': 'RuntimeError: from an earlier run'}
+    patches = list(RefactorImportsApp().fork_traces(isolate, modules, SETTRACE_BACKEND, 2, NULL_TIMER, errors))
+
+    assert patches == ['traced mod0', 'traced mod1', '', 'traced mod3', 'traced mod4']
+    assert isolate.most_running == 2
+    assert errors == {'mod2': 'IsolateError: Segfault: the forked process died'}
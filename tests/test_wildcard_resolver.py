@@ -0,0 +1,87 @@
+# coding=utf-8
+
+"""
+Test the static WildcardResolver
+"""
+import os
+import sys
+
+from refactor_imports.module_info import ModuleInfo
+from refactor_imports.wildcard_resolver import WildcardResolver, absolute_module_spec
+
+__docformat__ = 'restructuredtext en'
+__author__ = 'roy'
+
+tests_dir = os.path.dirname(__file__)
+
+
+def data_module(name):
+    file_spec = os.path.join(tests_dir, 'data', name + '.py')
+    return ModuleInfo(module_spec='data.' + name, file_spec=file_spec, resolve=False)
+
+
+def test_literal_all():
+    """
+    test that pprint's literal __all__ is used to expand "from pprint import *"
+    """
+    resolver = WildcardResolver(search_path=[tests_dir] + sys.path)
+    patch = resolver.patch(data_module('p1'))
+    assert "-from pprint import *" in patch
+    for name in ['pformat', 'pprint', 'saferepr', 'isreadable', 'PrettyPrinter', 'isrecursive']:
+        assert "+from pprint import {name}".format(name=name) in patch
+
+
+def test_public_names():
+    """
+    test that modules without an __all__ are expanded to their public names
+    """
+    resolver = WildcardResolver(search_path=[tests_dir] + sys.path)
+    patch = resolver.patch(data_module('p2'))
+    assert "-from data.t3 import *" in patch
+    assert "+from data.t3 import Bar\n+from data.t3 import Charlie\n" in patch
+    assert "-from data.t4 import *" in patch
+    assert "+from data.t4 import Bar\n+from data.t4 import Delta\n" in patch
+    assert "import __author__" not in patch
+
+    assert resolver.patch(data_module('t2')) == ''
+    assert resolver.resolved == 2
+    assert resolver.unresolved == 0
+
+
+def test_dynamic_module_needs_tracer(make_tree):
+    """
+    test that a wildcard import of a module that builds its __all__ at run time is left for the tracer
+    """
+    file_spec = make_tree({'uses_os.py': "from os import *\n"})['uses_os.py']
+    resolver = WildcardResolver()
+    assert resolver.patch(ModuleInfo(module_spec='uses_os', file_spec=file_spec, resolve=False)) is None
+    assert resolver.unresolved == 1
+
+
+def test_all_changed_in_a_block_needs_tracer(make_tree):
+    """
+    test that a literal __all__ changed afterwards in an if or try block is left for the tracer, while one
+    assigned after such a block is still used
+    """
+    file_specs = make_tree({
+        'changed_in_if.py': "import sys\n__all__ = ['a']\nif sys.version_info[0] == 3:\n    __all__ = ['a', 'b']\n"
+                            "a = b = 1\n",
+        'extended_in_try.py': "__all__ = ['a']\ntry:\n    __all__ += ['b']\nexcept NameError:\n    pass\n"
+                              "a = b = 1\n",
+        'assigned_after.py': "try:\n    import json\nexcept ImportError:\n    json = None\n__all__ = ['a']\n"
+                             "a = b = 1\n",
+    })
+    resolver = WildcardResolver(search_path=[os.path.dirname(file_specs['changed_in_if.py'])])
+    assert resolver.exports('changed_in_if') is None
+    assert resolver.exports('extended_in_try') is None
+    assert resolver.exports('assigned_after') == ['a']
+
+
+def test_absolute_module_spec():
+    """test converting relative import module names"""
+    assert absolute_module_spec('data.t3', 'data.p2', 'data/p2.py') == 'data.t3'
+    assert absolute_module_spec('.t3', 'data.p2', 'data/p2.py') == 'data.t3'
+    assert absolute_module_spec('.t3', 'data.__init__', 'data/__init__.py') == 'data.t3'
+    assert absolute_module_spec('..', 'a.b.c', 'a/b/c.py') == 'a'
+    assert absolute_module_spec('...x', 'a.b', 'a/b.py') is None
+    assert absolute_module_spec('.t3', '', 'p2.py') is None